@@ -0,0 +1,152 @@
+"""
+API di controllo locale dello scheduler.
+
+Lo scheduler espone un piccolo server HTTP su 127.0.0.1 che riceve e restituisce
+JSON. Porta e token di accesso vengono pubblicati nel file di stato dello
+scheduler, da cui li leggono i client (configuratore, flowctl). Ogni richiesta
+deve riportare il token nell'intestazione X-Control-Token.
+
+    GET  /queue    richieste di esecuzione in attesa, in corso e recenti
+    POST /run      {"flow": ..., "params": {...}, "resume": false, "policy": ..., "source": ...}
+    POST /cancel   {"flow": ..., "task": false}
+    POST /pause    {"flow": ...}  (senza "flow": tutte le pianificazioni)
+    POST /resume   {"flow": ...}
+"""
+import json
+import logging
+import os
+import secrets
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+CONFIG_DIR = "config"
+STATUS_FILE = os.path.join(CONFIG_DIR, "scheduler_status.json")
+CONTROL_HOST = "127.0.0.1"
+TOKEN_HEADER = "X-Control-Token"
+
+
+class ControlApiError(Exception):
+    """Errore restituito dall'API di controllo (es. flusso inesistente, parametri non validi)."""
+
+
+class ControlApiUnavailable(ControlApiError):
+    """Lo scheduler non è in esecuzione o la sua API di controllo non è raggiungibile."""
+
+
+class _ControlRequestHandler(BaseHTTPRequestHandler):
+    def _respond(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        if not secrets.compare_digest(self.headers.get(TOKEN_HEADER, ''), self.server.token):
+            self._respond(403, {'error': "Token di controllo mancante o non valido."})
+            return
+        handler = self.server.routes.get((method, urlparse(self.path).path))
+        if handler is None:
+            self._respond(404, {'error': f"Operazione sconosciuta: {method} {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("Il corpo della richiesta deve essere un oggetto JSON.")
+            self._respond(200, handler(body))
+        except (ValueError, json.JSONDecodeError) as e:
+            self._respond(400, {'error': str(e)})
+        except LookupError as e:
+            self._respond(404, {'error': e.args[0] if e.args else str(e)})
+        except Exception as e:
+            logging.error(f"API di controllo: errore nella richiesta {method} {self.path}: {e}")
+            self._respond(500, {'error': str(e)})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        logging.debug(f"API di controllo: {self.address_string()} {format % args}")
+
+
+def start_control_server(routes, port=0):
+    """
+    Avvia il server dell'API di controllo in un thread in background.
+    'routes' associa (metodo, percorso) a una funzione che riceve il corpo JSON
+    della richiesta e restituisce un dizionario; le funzioni possono sollevare
+    ValueError (richiesta non valida) o LookupError (elemento non trovato).
+    Con port=0 la porta viene scelta dal sistema operativo.
+    Restituisce il server; porta e token sono in server.server_address e server.token.
+    """
+    server = ThreadingHTTPServer((CONTROL_HOST, port), _ControlRequestHandler)
+    server.daemon_threads = True
+    server.routes = routes
+    server.token = secrets.token_hex(16)
+    threading.Thread(target=server.serve_forever, name="control-api", daemon=True).start()
+    logging.info(f"API di controllo in ascolto su http://{CONTROL_HOST}:{server.server_address[1]}")
+    return server
+
+
+def _control_endpoint():
+    """Legge porta e token dell'API dal file di stato dello scheduler."""
+    try:
+        with open(STATUS_FILE, 'r') as f:
+            control = json.load(f).get('control') or {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        control = {}
+    if not control.get('port') or not control.get('token'):
+        raise ControlApiUnavailable("Lo scheduler non è in esecuzione.")
+    return control['port'], control['token']
+
+
+def call_control_api(method, path, body=None, timeout=10):
+    """Invia una richiesta all'API di controllo e restituisce la risposta JSON."""
+    port, token = _control_endpoint()
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(f"http://{CONTROL_HOST}:{port}{path}", data=data, method=method,
+                                     headers={TOKEN_HEADER: token, "Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.load(e).get('error', str(e))
+        except (json.JSONDecodeError, ValueError):
+            message = str(e)
+        raise ControlApiError(message) from None
+    except (urllib.error.URLError, OSError) as e:
+        raise ControlApiUnavailable(f"Scheduler non raggiungibile: {e}") from None
+
+
+def enqueue_flow(flow_name, params=None, resume=False, policy=None, source=None):
+    """Chiede allo scheduler di eseguire subito un flusso. Restituisce la richiesta registrata."""
+    body = {'flow': flow_name, 'params': params or {}, 'resume': resume, 'policy': policy, 'source': source}
+    return call_control_api('POST', '/run', body)['request']
+
+
+def cancel_flow(flow_name, task_only=False):
+    """Annulla l'esecuzione in corso di un flusso, oppure solo il suo task in corso."""
+    return call_control_api('POST', '/cancel', {'flow': flow_name, 'task': task_only})
+
+
+def pause_schedules(flow_name=None):
+    """Sospende le pianificazioni (orari e trigger su file) di un flusso o di tutti."""
+    return call_control_api('POST', '/pause', {'flow': flow_name})
+
+
+def resume_schedules(flow_name=None):
+    """Riattiva le pianificazioni di un flusso o di tutti."""
+    return call_control_api('POST', '/resume', {'flow': flow_name})
+
+
+def list_queue():
+    """Restituisce le richieste di esecuzione note allo scheduler e le pianificazioni sospese."""
+    return call_control_api('GET', '/queue')
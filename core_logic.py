@@ -1,19 +1,69 @@
 import logging
 import os
+import signal
 import subprocess
 import time
 import json
 import threading
+import gzip
+import uuid
+import hashlib
+import shutil
+import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from locking import FileLock, FlowLock, ResourceSet, LOCKS_DIR, lock_name, parse_resources
 
 LOG_DIR = "logs"
 CONFIG_DIR = "config"
 LOG_FILE = os.path.join(LOG_DIR, "scheduler.log")
 STATS_FILE = os.path.join(CONFIG_DIR, "task_stats.json")
+# Lock tra processi sul file delle statistiche: i flussi girano in processi separati
+STATS_LOCK_FILE = os.path.join(LOCKS_DIR, "task_stats.lock")
+# Cartella degli artefatti di output compressi, una sottocartella per ogni esecuzione
+RUNS_DIR = os.path.join(LOG_DIR, "runs")
+RUN_MANIFEST_NAME = "run.json"
+# Esecuzioni iniziate prima di una finestra temporale che vengono comunque considerate,
+# perché potrebbero essere ancora in corso al suo inizio
+TIMELINE_LOOKBACK = timedelta(days=1)
+# Checkpoint dell'ultima esecuzione di ogni flusso, usati per riprendere dopo un errore
+CHECKPOINTS_DIR = os.path.join(CONFIG_DIR, "checkpoints")
+# Numero di righe finali dell'output riportate nel log principale
+OUTPUT_TAIL_LINES = 20
+# Dimensione dei blocchi letti dagli stream dei processi
+PIPE_CHUNK_SIZE = 64 * 1024
+# Politiche possibili quando un flusso viene attivato mentre è già in esecuzione
+OVERLAP_POLICIES = ('skip', 'queue', 'replace')
+# Secondi concessi a un processo annullato per terminare prima di forzarne la chiusura
+CANCEL_GRACE_SECONDS = 5
+# Dopo quanto segnalare una richiesta di annullamento non recapitata (e ogni quanto ripeterla)
+CANCEL_REQUEST_TIMEOUT_SECONDS = 10
+CANCEL_REQUEST_RETRY_SECONDS = 0.5
+# Durata tipica di un task: mediana delle ultime BASELINE_WINDOW esecuzioni riuscite,
+# calcolata solo quando ce ne sono almeno BASELINE_MIN_SAMPLES
+BASELINE_WINDOW = 20
+BASELINE_MIN_SAMPLES = 5
+# Peso dell'ultima esecuzione nella media mobile esponenziale delle durate
+EWMA_ALPHA = 0.2
+# Un task è segnalato come lento se dura più di SLOW_TASK_FACTOR volte la sua durata tipica
+SLOW_TASK_FACTOR = 2.0
+# Prefisso delle righe di avanzamento che i task possono scrivere su stdout o stderr,
+# es. "##progress 45 Elaborazione file 3/7" oppure "##progress 3/7 Elaborazione";
+# viene comunicato ai task nella variabile d'ambiente PROGRESS_TAG_ENV
+PROGRESS_TAG = b"##progress"
+PROGRESS_TAG_ENV = "TASK_PROGRESS_TAG"
 
-# Lock per garantire l'accesso thread-safe al file delle statistiche
-_stats_lock = threading.Lock()
+# Lock per garantire l'accesso thread-safe al file delle statistiche (rientrante, così
+# un aggiornamento può tenerlo tra lettura e scrittura)
+_stats_lock = threading.RLock()
+# Avanzamento delle esecuzioni in corso in questo processo (run_id -> RunProgress)
+_live_runs = {}
+# PID dei processi dei task avviati da questo processo e non ancora terminati
+_task_pids = set()
+_live_lock = threading.Lock()
 
-def _load_task_stats():
+def load_task_stats():
     """Carica le statistiche dei task da un file JSON in modo thread-safe."""
     with _stats_lock:
         try:
@@ -23,29 +73,95 @@ def _load_task_stats():
             return {}
 
 def _save_task_stats(stats):
-    """Salva le statistiche dei task su un file JSON in modo thread-safe."""
+    """Salva le statistiche dei task su un file JSON in modo thread-safe (rename atomico per i lettori)."""
     with _stats_lock:
         os.makedirs(CONFIG_DIR, exist_ok=True)
-        with open(STATS_FILE, 'w') as f:
+        tmp_path = f"{STATS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(stats, f, indent=4)
+        os.replace(tmp_path, STATS_FILE)
 
-def update_task_stats(task_path, duration):
-    """Aggiorna le statistiche min/max per un dato task."""
-    stats = _load_task_stats()
-    task_stats = stats.get(task_path, {})
+def duration_baseline(task_stats):
+    """Restituisce la durata tipica di un task (mediana delle ultime esecuzioni), o None se i dati sono pochi."""
+    recent = task_stats.get('recent', [])
+    if len(recent) < BASELINE_MIN_SAMPLES:
+        return None
+    return statistics.median(recent)
 
-    current_min = task_stats.get('min')
-    current_max = task_stats.get('max')
+def update_task_stats(task_path, duration, slow_factor=SLOW_TASK_FACTOR):
+    """
+    Aggiorna le statistiche di un task: min/max, media mobile esponenziale e finestra
+    delle ultime durate. Se la durata supera slow_factor volte la durata tipica
+    precedente, registra un avviso di lentezza e lo restituisce; altrimenti
+    rimuove l'eventuale avviso precedente e restituisce None.
+    """
+    with _stats_lock, FileLock(STATS_LOCK_FILE):
+        stats = load_task_stats()
+        task_stats = stats.get(task_path, {})
+
+        current_min = task_stats.get('min')
+        current_max = task_stats.get('max')
+
+        if current_min is None or duration < current_min:
+            task_stats['min'] = duration
+
+        if current_max is None or duration > current_max:
+            task_stats['max'] = duration
 
-    if current_min is None or duration < current_min:
-        task_stats['min'] = duration
+        # Il confronto usa la durata tipica prima di includere l'esecuzione corrente
+        baseline = duration_baseline(task_stats)
+        alert = None
+        if baseline and duration > baseline * slow_factor:
+            alert = {
+                'duration': duration,
+                'baseline': baseline,
+                'ratio': duration / baseline,
+                'at': datetime.now().isoformat()
+            }
+            task_stats['slow'] = alert
+        else:
+            task_stats.pop('slow', None)
 
-    if current_max is None or duration > current_max:
-        task_stats['max'] = duration
+        ewma = task_stats.get('ewma')
+        task_stats['ewma'] = duration if ewma is None else EWMA_ALPHA * duration + (1 - EWMA_ALPHA) * ewma
+        task_stats['recent'] = (task_stats.get('recent', []) + [duration])[-BASELINE_WINDOW:]
+        task_stats['runs'] = task_stats.get('runs', 0) + 1
 
-    stats[task_path] = task_stats
-    _save_task_stats(stats)
+        stats[task_path] = task_stats
+        _save_task_stats(stats)
+    return alert
 
+def slow_task_alerts():
+    """Restituisce gli avvisi di lentezza ancora attivi, indicizzati per percorso del task."""
+    return {task_path: task_stats['slow'] for task_path, task_stats in load_task_stats().items() if 'slow' in task_stats}
+
+
+def format_duration(seconds):
+    """Converte una durata in secondi in una stringa formattata HH:MM:SS.ss."""
+    if seconds is None:
+        return ""
+    try:
+        seconds = float(seconds)
+        hours, remainder = divmod(seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return f"{int(hours):02}:{int(minutes):02}:{seconds:05.2f}"
+    except (ValueError, TypeError):
+        return "Invalido"
+
+def format_progress(snapshot):
+    """Riassume in una riga l'avanzamento di un'esecuzione in corso (vedi RunProgress.snapshot)."""
+    parts = []
+    for task in snapshot['tasks']:
+        text = f"'{task['name']}'"
+        if task['percent'] is not None:
+            text += f" {task['percent']:.0f}%"
+        if task['message']:
+            text += f" ({task['message']})"
+        parts.append(text)
+    # La stima è approssimata se per qualche task in corso mancano sia percentuale che storico
+    approximate = "" if snapshot['estimate_complete'] else "~"
+    eta = datetime.fromisoformat(snapshot['eta'])
+    return f"{snapshot['flow']}: {', '.join(parts) or 'in attesa'}, fine prevista {approximate}{eta:%H:%M}"
 
 def setup_logging():
     """Configura il sistema di logging per scrivere su file e console."""
@@ -64,79 +180,1186 @@ def setup_logging():
         ]
     )
 
-def execute_flow(flow_name, tasks):
+def new_run_id():
+    """Genera un identificativo di esecuzione ordinabile cronologicamente."""
+    now = datetime.now()
+    return f"{now:%Y%m%d-%H%M%S}{now.microsecond // 1000:03}-{uuid.uuid4().hex[:6]}"
+
+def _run_dir(run_id):
+    return os.path.join(RUNS_DIR, run_id)
+
+def _artifact_name(task_index, stream_name, attempt=0, instance=None):
+    # Le riprese di un'esecuzione non sovrascrivono l'output dei tentativi precedenti
+    suffix = f".r{attempt}" if attempt else ""
+    instance_suffix = f".i{instance + 1}" if instance is not None else ""
+    return f"task{task_index + 1:03}{instance_suffix}{suffix}.{stream_name}.gz"
+
+def artifact_path(run_id, artifact_name):
+    """Restituisce il percorso completo di un artefatto di output di un'esecuzione."""
+    return os.path.join(_run_dir(run_id), artifact_name)
+
+def _write_run_manifest(manifest):
+    """Scrive il manifesto dell'esecuzione in modo atomico (file temporaneo + rename)."""
+    run_dir = _run_dir(manifest['run_id'])
+    os.makedirs(run_dir, exist_ok=True)
+    manifest_path = os.path.join(run_dir, RUN_MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, manifest_path)
+
+def load_run_manifest(run_id):
+    """Carica il manifesto di un'esecuzione. Restituisce None se non esiste o è corrotto."""
+    try:
+        with open(os.path.join(_run_dir(run_id), RUN_MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def iter_runs():
+    """Legge uno alla volta i manifesti delle esecuzioni passate, dalla più recente alla più vecchia."""
+    try:
+        run_ids = sorted(os.listdir(RUNS_DIR), reverse=True)
+    except FileNotFoundError:
+        return
+
+    for run_id in run_ids:
+        manifest = load_run_manifest(run_id)
+        if manifest is not None:
+            yield manifest
+
+def list_runs(limit=None):
+    """Elenca i manifesti delle esecuzioni passate, dalla più recente alla più vecchia."""
+    runs = []
+    for manifest in iter_runs():
+        runs.append(manifest)
+        if limit is not None and len(runs) >= limit:
+            break
+    return runs
+
+def runs_in_window(start, end):
+    """Restituisce i manifesti delle esecuzioni attive almeno in parte tra start e end."""
+    runs = []
+    for manifest in iter_runs():
+        started = datetime.fromisoformat(manifest['started'])
+        if started > end:
+            continue
+        # Gli identificativi sono in ordine di avvio: oltre un certo anticipo si smette di leggere
+        if started < start - TIMELINE_LOOKBACK:
+            break
+        ended = datetime.fromisoformat(manifest['ended']) if manifest.get('ended') else datetime.now()
+        if ended >= start:
+            runs.append(manifest)
+    return runs
+
+def run_timeline(manifests):
     """
-    Esegue una lista di task (dizionari con 'name' e 'path') in sequenza.
+    Converte i manifesti delle esecuzioni nelle barre di una vista a timeline: una per
+    task eseguito, con inizio, fine, inizio dell'attesa delle risorse e stato.
+    Restituisce le barre in ordine di arrivo (inizio dell'attesa, poi inizio).
+    """
+    bars = []
+    for manifest in manifests:
+        for task in manifest.get('tasks', []):
+            # I task mai avviati (file mancante, errore di configurazione) non hanno tempi
+            if not task.get('started') or task.get('duration') is None:
+                continue
+            start = datetime.fromisoformat(task['started'])
+            bars.append({
+                'run_id': manifest['run_id'],
+                'flow': manifest.get('flow', ''),
+                'task': task.get('name', ''),
+                'attempt': task.get('attempt', 0),
+                'status': task.get('status', ''),
+                'queue_start': start - timedelta(seconds=task.get('queue_wait') or 0),
+                'start': start,
+                'end': start + timedelta(seconds=task['duration'])
+            })
+    bars.sort(key=lambda bar: (bar['queue_start'], bar['start']))
+    return bars
+
+def tasks_signature(tasks):
     """
-    logging.info(f"TRIGGER: Avvio flusso '{flow_name}'.")
+    Calcola un'impronta della lista dei task. Serve a verificare che la configurazione
+    di un flusso non sia cambiata prima di riprenderne un'esecuzione interrotta.
+    """
+    relevant = [[task.get('name'), task.get('path'), task.get('enabled', True), task.get('pipe_to_next', False)]
+                for task in tasks]
+    return hashlib.sha1(json.dumps(relevant).encode('utf-8')).hexdigest()
+
+def _checkpoint_path(flow_name):
+    return os.path.join(CHECKPOINTS_DIR, lock_name(flow_name) + ".json")
+
+def _save_checkpoint(flow_name, checkpoint):
+    """Salva il checkpoint di un flusso in modo durevole (fsync + rename atomico)."""
+    os.makedirs(CHECKPOINTS_DIR, exist_ok=True)
+    path = _checkpoint_path(flow_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_checkpoint(flow_name):
+    """Carica il checkpoint dell'ultima esecuzione di un flusso, o None se assente."""
+    try:
+        with open(_checkpoint_path(flow_name), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def is_resumable(checkpoint):
+    """Indica se il checkpoint si riferisce a un'esecuzione fallita o annullata che si può riprendere."""
+    return checkpoint is not None and checkpoint.get('status') in ('failed', 'cancelled')
+
+def _parse_progress(line):
+    """
+    Interpreta una riga di avanzamento ("##progress 45 messaggio", "##progress 45% ..."
+    o "##progress 3/7 ..."). Restituisce (percentuale, messaggio) o None se non è valida.
+    """
+    fields = line[len(PROGRESS_TAG):].decode('utf-8', errors='replace').strip().split(None, 1)
+    if not fields:
+        return None
+    value = fields[0].rstrip('%')
+    try:
+        if '/' in value:
+            done, total = value.split('/', 1)
+            percent = 100.0 * float(done) / float(total)
+        else:
+            percent = float(value)
+    except (ValueError, ZeroDivisionError):
+        return None
+    message = fields[1].strip() if len(fields) > 1 else ""
+    return min(max(percent, 0.0), 100.0), message
+
+def _without_progress_lines(data, state):
+    """
+    Toglie da un blocco di output le righe di avanzamento (PROGRESS_TAG), che non devono
+    arrivare allo stdin del task successivo in modalità pipe. 'state' conserva tra un
+    blocco e l'altro l'inizio di riga non ancora classificabile e se la riga corrente
+    viene inoltrata ('pass') o scartata ('drop').
+    """
+    # Nessuna riga del blocco può iniziare con il prefisso: si inoltra tutto
+    if state['mode'] != 'drop' and not state['head'] and PROGRESS_TAG[:1] not in data:
+        if data.endswith(b'\n'):
+            state['mode'] = None
+        elif data:
+            state['mode'] = 'pass'
+        return data
+
+    forwarded = []
+    position = 0
+    while position < len(data):
+        end = data.find(b'\n', position)
+        segment = data[position:] if end < 0 else data[position:end + 1]
+        position += len(segment)
+        if state['mode'] is None:
+            head = state['head'] + segment
+            if len(head) < len(PROGRESS_TAG) and PROGRESS_TAG.startswith(head):
+                # Inizio di riga troppo corto per sapere se è una riga di avanzamento
+                state['head'] = head
+                continue
+            state['head'] = b''
+            state['mode'] = 'drop' if head.startswith(PROGRESS_TAG) else 'pass'
+            segment = head
+        if state['mode'] == 'pass':
+            forwarded.append(segment)
+        if segment.endswith(b'\n'):
+            state['mode'] = None
+    return b''.join(forwarded)
+
+def _spool_stream(stream, path, tail, sink=None, on_progress=None):
+    """
+    Copia uno stream del processo in un file gzip a blocchi, mantenendo in memoria
+    solo le ultime righe (tail). Se è indicato un sink (lo stdin del task successivo
+    in modalità pipe), i dati vengono inoltrati anche lì, come un 'tee'.
+    Le righe di avanzamento (PROGRESS_TAG) vengono passate a on_progress senza
+    rallentare la copia (di ogni blocco si considera solo l'ultima); restano
+    nell'artefatto ma non vengono inoltrate al sink.
+    Restituisce il numero di righe lette.
+    """
+    line_count = 0
+    pending = b''
+    sink_state = {'mode': None, 'head': b''}
+    with gzip.open(path, 'wb') as out:
+        while True:
+            chunk = stream.read1(PIPE_CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+            if sink is not None:
+                try:
+                    sink.write(_without_progress_lines(chunk, sink_state))
+                    sink.flush()
+                except (BrokenPipeError, OSError):
+                    # Il task a valle ha chiuso il suo stdin: il resto viene solo salvato
+                    sink = None
+            data = pending + chunk
+            lines = data.split(b'\n')
+            pending = lines.pop()
+            # Una riga senza terminatore non può crescere all'infinito in memoria
+            if len(pending) > PIPE_CHUNK_SIZE:
+                lines.append(pending)
+                pending = b''
+            line_count += len(lines)
+            for line in lines[-OUTPUT_TAIL_LINES:]:
+                tail.append(line.decode('utf-8', errors='replace').rstrip('\r'))
+            if on_progress is not None and PROGRESS_TAG in data:
+                for line in reversed(lines):
+                    progress = _parse_progress(line) if line.startswith(PROGRESS_TAG) else None
+                    if progress is not None:
+                        on_progress(*progress)
+                        break
+    if pending:
+        line_count += 1
+        tail.append(pending.decode('utf-8', errors='replace').rstrip('\r'))
+    if sink is not None:
+        try:
+            # Un inizio di riga rimasto in sospeso alla fine dello stream non era avanzamento
+            sink.write(sink_state['head'])
+            sink.close()
+        except OSError:
+            pass
+    stream.close()
+    return line_count
+
+def _kill_process_tree(process):
+    """Termina un processo e tutti i suoi figli."""
+    if process.poll() is not None:
+        return
+    if os.name == 'nt':
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True, check=False)
+        return
+    # Su POSIX ogni task è capo del proprio gruppo di processi (start_new_session)
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=CANCEL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def kill_task_tree(pid):
+    """
+    Termina subito l'albero di processi di un task dato il suo PID, anche quando il
+    processo che lo aveva avviato non esiste più e il task è stato adottato dal sistema.
+    """
+    if os.name == 'nt':
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True, check=False)
+        return
+    # Il task è capo del proprio gruppo di processi (start_new_session), che ne contiene i figli
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def running_task_pids():
+    """PID dei processi dei task in corso in questo processo."""
+    with _live_lock:
+        return sorted(_task_pids)
+
+def _run_pipeline(commands, run_id, task_indices, cancel_event=None, attempt=0, env=None, instance=None, skip_event=None,
+                  on_progress=None):
+    """
+    Esegue uno o più comandi collegati come una pipeline della shell: lo stdout di
+    ogni processo diventa lo stdin del successivo. Tutti i processi girano in
+    parallelo e l'output di ciascuno viene comunque salvato negli artefatti
+    compressi dell'esecuzione. Un singolo task è una pipeline di un solo comando.
+    Se cancel_event (annullamento del flusso) o skip_event (annullamento del solo task
+    in corso) viene impostato, tutti i processi (con i loro figli) vengono terminati.
+    'env' contiene variabili d'ambiente aggiuntive per i processi; 'instance' distingue
+    gli artefatti delle istanze di un task matrice. on_progress(posizione nella
+    pipeline, percentuale, messaggio) riceve l'avanzamento dichiarato dai task.
+    Restituisce, per ogni comando, un dizionario con codice di uscita, durata,
+    righe finali di ciascuno stream e nomi degli artefatti.
+    """
+    os.makedirs(_run_dir(run_id), exist_ok=True)
+    results = []
+    for task_index in task_indices:
+        result = {}
+        for stream_name in ('stdout', 'stderr'):
+            result[f'{stream_name}_artifact'] = _artifact_name(task_index, stream_name, attempt, instance)
+            result[f'{stream_name}_tail'] = deque(maxlen=OUTPUT_TAIL_LINES)
+            result[f'{stream_name}_lines'] = 0
+        results.append(result)
+
+    process_env = dict(os.environ)
+    process_env.update(env or {})
+    process_env[PROGRESS_TAG_ENV] = PROGRESS_TAG.decode()
+
+    start_time = time.monotonic()
+    processes = []
+    try:
+        for stage, command in enumerate(commands):
+            processes.append(subprocess.Popen(
+                command,
+                env=process_env,
+                stdin=subprocess.PIPE if stage > 0 else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=(os.name != 'nt')
+            ))
+    except Exception:
+        # Se un comando non parte, la pipeline non può funzionare: termina quelli già avviati
+        for process in processes:
+            process.kill()
+            process.wait()
+        raise
+    with _live_lock:
+        _task_pids.update(process.pid for process in processes)
+
+    def reader(stream, result, stream_name, sink, stage):
+        stage_progress = None
+        if on_progress is not None:
+            stage_progress = lambda percent, message: on_progress(stage, percent, message)
+        result[f'{stream_name}_lines'] = _spool_stream(
+            stream, artifact_path(run_id, result[f'{stream_name}_artifact']), result[f'{stream_name}_tail'], sink,
+            stage_progress
+        )
+
+    # Un thread per stream evita lo stallo quando uno dei buffer del pipe si riempie
+    readers = []
+    for stage, (process, result) in enumerate(zip(processes, results)):
+        sink = processes[stage + 1].stdin if stage + 1 < len(processes) else None
+        readers.append(threading.Thread(target=reader, args=(process.stdout, result, 'stdout', sink, stage), daemon=True))
+        readers.append(threading.Thread(target=reader, args=(process.stderr, result, 'stderr', None, stage), daemon=True))
+    def waiter(process, result):
+        # Ogni processo ha la sua attesa, così la durata di un task che termina
+        # prima degli altri non dipende dall'ordine nella pipeline
+        result['returncode'] = process.wait()
+        result['duration'] = time.monotonic() - start_time
+
+    waiters = [threading.Thread(target=waiter, args=(process, result), daemon=True)
+               for process, result in zip(processes, results)]
+    for thread in readers + waiters:
+        thread.start()
+    try:
+        for thread in waiters:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+                if any(event is not None and event.is_set() for event in (cancel_event, skip_event)):
+                    for process in processes:
+                        _kill_process_tree(process)
+    finally:
+        with _live_lock:
+            _task_pids.difference_update(process.pid for process in processes)
+    for thread in readers:
+        thread.join()
+
+    for result in results:
+        result['stdout_tail'] = list(result['stdout_tail'])
+        result['stderr_tail'] = list(result['stderr_tail'])
+    return results
+
+def _format_tail(lines, total_lines):
+    """Formatta le righe finali di un output indicando quante righe sono state omesse."""
+    omitted = total_lines - len(lines)
+    header = f"[... {omitted} righe precedenti omesse ...]\n" if omitted > 0 else ""
+    return header + "\n".join(lines)
+
+
+class ArtifactPager:
+    """
+    Lettore paginato e pigro per un artefatto di output compresso. Decomprime solo
+    fino alla pagina richiesta e memorizza gli offset delle pagine già visitate,
+    così le pagine note non vanno di nuovo divise in righe. Il formato gzip però
+    non permette l'accesso diretto: tornare a una pagina precedente fa ripartire la
+    decompressione dall'inizio del file, per cui il costo cresce con la posizione
+    della pagina nell'artefatto.
+    """
+    def __init__(self, path, page_size=500):
+        self.path = path
+        self.page_size = page_size
+        self._file = gzip.open(path, 'rb')
+        self._page_offsets = [0]
+        self._last_page = None # Indice dell'ultima pagina, noto solo dopo aver raggiunto la fine
+
+    def _read_lines(self):
+        lines = []
+        for _ in range(self.page_size):
+            line = self._file.readline()
+            if not line:
+                break
+            lines.append(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+        return lines
+
+    def read_page(self, page):
+        """
+        Restituisce (righe, ha_pagina_successiva) per la pagina indicata (da 0).
+        Se la pagina è oltre la fine, restituisce l'ultima pagina disponibile.
+        """
+        if self._last_page is not None:
+            page = min(page, self._last_page)
+
+        # Avanza dalla pagina nota più vicina fino a quella richiesta
+        known_page = min(page, len(self._page_offsets) - 1)
+        self._file.seek(self._page_offsets[known_page])
+        while True:
+            lines = self._read_lines()
+            has_next = len(lines) == self.page_size and self._file.peek(1) != b''
+            if known_page + 1 == len(self._page_offsets) and has_next:
+                self._page_offsets.append(self._file.tell())
+            if not has_next:
+                self._last_page = known_page
+            if known_page == page or not has_next:
+                return lines, has_next
+            known_page += 1
+
+    def close(self):
+        self._file.close()
+
+
+def _build_command(task_path, args=()):
+    """Restituisce il comando per eseguire lo script in base all'estensione, o None se non supportata."""
+    file_extension = os.path.splitext(task_path)[1].lower()
+    if file_extension == '.py':
+        return ["python", task_path, *args]
+    if file_extension == '.bat':
+        return ["cmd", "/c", task_path, *args]
+    if file_extension == '.ps1':
+        return ["powershell", "-ExecutionPolicy", "Bypass", "-File", task_path, *args]
+    return None
+
+def parse_matrix(task):
+    """
+    Legge le istanze di un task matrice. La chiave 'matrix' è una lista di insiemi di
+    parametri, ognuno con 'name' (facoltativo), 'args' (argomenti aggiuntivi dello
+    script) ed 'env' (variabili d'ambiente aggiuntive). 'max_parallel' limita quante
+    istanze girano insieme (predefinito: tutte).
+    Restituisce (istanze normalizzate, parallelismo massimo), oppure (None, None) se
+    il task non è una matrice. Solleva ValueError se la dichiarazione non è valida.
+    """
+    matrix = task.get('matrix')
+    if matrix is None:
+        return None, None
+    if not isinstance(matrix, list) or not matrix:
+        raise ValueError("'matrix' deve essere una lista non vuota di insiemi di parametri.")
+
+    instances = []
+    for k, params in enumerate(matrix):
+        if not isinstance(params, dict):
+            raise ValueError(f"L'istanza {k+1} della matrice deve essere un oggetto con 'name', 'args' ed 'env'.")
+        args = params.get('args', [])
+        if isinstance(args, str):
+            args = [args]
+        env = params.get('env', {})
+        if not isinstance(args, list) or not isinstance(env, dict):
+            raise ValueError(f"L'istanza {k+1} della matrice ha 'args' o 'env' non validi.")
+        instances.append({
+            'name': str(params.get('name', f"#{k+1}")),
+            'args': [str(arg) for arg in args],
+            'env': {str(key): str(value) for key, value in env.items()}
+        })
+
+    max_parallel = task.get('max_parallel', len(instances))
+    if not isinstance(max_parallel, int) or max_parallel < 1:
+        raise ValueError("'max_parallel' deve essere un intero maggiore di zero.")
+    return instances, min(max_parallel, len(instances))
+
+def preflight_check(flow_name, tasks, warm=True):
+    """
+    Verifica in anticipo che i task abilitati di un flusso possano partire: esistenza
+    dello script, tipo supportato, interprete disponibile, risorse e matrice valide.
+    Con warm=True rilegge anche i file per portarli nella cache del disco (utile sulle
+    cartelle di rete) e controlla la sintassi degli script .py. Il controllo non
+    scrive bytecode: uno script avviato come 'python script.py' non usa il .pyc.
+    Restituisce la lista dei problemi trovati (vuota se è tutto a posto).
+    """
+    problems = []
+    interpreters = {}
 
     for i, task in enumerate(tasks):
+        if not task.get('enabled', True):
+            continue
         task_name = task.get('name', 'Task Senza Nome')
         task_path = task.get('path', '')
+        prefix = f"Task {i+1} '{task_name}'"
 
-        # Controlla se il task è abilitato. Per retrocompatibilità, se la chiave 'enabled'
-        # non esiste, il task viene considerato abilitato.
-        if not task.get('enabled', True):
-            logging.info(f"[{flow_name}] Task '{task_name}' saltato perché disabilitato.")
+        try:
+            parse_resources(task.get('resources'))
+        except ValueError as e:
+            problems.append(f"{prefix}: risorse non valide: {e}")
+        try:
+            parse_matrix(task)
+        except ValueError as e:
+            problems.append(f"{prefix}: matrice non valida: {e}")
+
+        if not task_path or not os.path.exists(task_path):
+            problems.append(f"{prefix}: file '{task_path}' non trovato.")
             continue
 
-        logging.info(f"[{flow_name}] Esecuzione task {i+1}/{len(tasks)} '{task_name}': '{task_path}'...")
+        command = _build_command(task_path)
+        if command is None:
+            problems.append(f"{prefix}: tipo di file non supportato '{os.path.splitext(task_path)[1]}'.")
+            continue
 
-        if not task_path or not os.path.exists(task_path):
-            logging.error(f"[{flow_name}] ERRORE: Il file del task '{task_name}' ('{task_path}') non è stato trovato. Interruzione del flusso.")
-            break
+        interpreter = command[0]
+        if interpreter not in interpreters:
+            interpreters[interpreter] = shutil.which(interpreter) is not None
+        if not interpreters[interpreter]:
+            problems.append(f"{prefix}: interprete '{interpreter}' non disponibile.")
 
+        if not warm:
+            continue
+        is_python = task_path.lower().endswith('.py')
         try:
-            command = []
-            file_extension = os.path.splitext(task_path)[1].lower()
-
-            if file_extension == '.py':
-                command = ["python", task_path]
-            elif file_extension == '.bat':
-                command = ["cmd", "/c", task_path]
-            elif file_extension == '.ps1':
-                command = ["powershell", "-ExecutionPolicy", "Bypass", "-File", task_path]
-            else:
-                logging.error(f"[{flow_name}] ERRORE: Tipo di file non supportato '{file_extension}' per il task '{task_name}'. Salto.")
+            # La lettura completa porta il file nella cache del sistema operativo
+            chunks = []
+            with open(task_path, 'rb') as f:
+                while True:
+                    chunk = f.read(PIPE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if is_python:
+                        chunks.append(chunk)
+            if is_python:
+                compile(b''.join(chunks), task_path, 'exec', dont_inherit=True)
+        except SyntaxError as e:
+            line = f" (riga {e.lineno})" if e.lineno else ""
+            problems.append(f"{prefix}: errore di sintassi: {e.msg}{line}.")
+        except ValueError as e:
+            # Ad esempio byte nulli nel sorgente
+            problems.append(f"{prefix}: script non valido: {e}.")
+        except OSError as e:
+            logging.warning(f"[{flow_name}] Pre-flight: impossibile leggere '{task_path}': {e}")
+
+    return problems
+
+def pipe_group(tasks, start):
+    """
+    Restituisce gli indici dei task collegati in modalità pipe a partire da 'start'.
+    Un task con 'pipe_to_next' abilitato passa il suo stdout al task immediatamente
+    successivo, purché anch'esso sia abilitato. I task matrice non entrano in una pipeline.
+    """
+    group = [start]
+    while True:
+        last = group[-1]
+        if not tasks[last].get('enabled', True) or not tasks[last].get('pipe_to_next', False):
+            return group
+        if last + 1 >= len(tasks) or not tasks[last + 1].get('enabled', True):
+            return group
+        if 'matrix' in tasks[last] or 'matrix' in tasks[last + 1]:
+            return group
+        group.append(last + 1)
+
+def _expected_duration(task_stats):
+    """Durata attesa di un task dalle sue statistiche: durata tipica, media mobile o massimo registrato."""
+    if not task_stats:
+        return None
+    return duration_baseline(task_stats) or task_stats.get('ewma') or task_stats.get('max')
+
+class RunProgress:
+    """
+    Avanzamento in tempo reale di un'esecuzione in questo processo. Combina la
+    percentuale dichiarata dai task (PROGRESS_TAG) con le durate storiche per stimare
+    quanto manca al termine dei task in corso e dell'intero flusso.
+    """
+    def __init__(self, run_id, flow_label, flow_name):
+        self.run_id = run_id
+        self.flow_label = flow_label
+        self.flow_name = flow_name
+        self.started = datetime.now().isoformat()
+        self.task_stats = load_task_stats()
+        self._running = {}
+        self._pending = {}
+        self._lanes = 1
+        self._remaining_after = 0.0
+        with _live_lock:
+            _live_runs[run_id] = self
+
+    def expected(self, stats_key):
+        return _expected_duration(self.task_stats.get(stats_key))
+
+    @staticmethod
+    def _unit_key(unit):
+        return (unit['indices'][0], unit.get('instance'))
+
+    def start_group(self, tasks, next_index, units, lanes):
+        """Registra le unità del gruppo che sta per partire e la durata attesa dei task successivi."""
+        # Per una pipeline conta il task più lungo, perché i task girano in parallelo
+        remaining_after = 0.0
+        i = next_index
+        while i < len(tasks):
+            group = pipe_group(tasks, i)
+            i = group[-1] + 1
+            if tasks[group[0]].get('enabled', True):
+                remaining_after += max(self.expected(tasks[j].get('path', '')) or 0.0 for j in group)
+        with _live_lock:
+            self._remaining_after = remaining_after
+            self._lanes = lanes
+            self._pending = {self._unit_key(unit): max(self.expected(key) or 0.0 for key in unit['stats_keys'])
+                             for unit in units}
+
+    def unit_started(self, unit):
+        with _live_lock:
+            self._pending.pop(self._unit_key(unit), None)
+            for stage, (name, stats_key) in enumerate(zip(unit['names'], unit['stats_keys'])):
+                self._running[(self._unit_key(unit), stage)] = {
+                    'name': name,
+                    'started': datetime.now().isoformat(),
+                    'clock': time.monotonic(),
+                    'expected': self.expected(stats_key),
+                    'percent': None,
+                    'message': ""
+                }
+
+    def report(self, unit, stage, percent, message):
+        with _live_lock:
+            entry = self._running.get((self._unit_key(unit), stage))
+            if entry is not None:
+                entry['percent'] = percent
+                entry['message'] = message
+
+    def unit_finished(self, unit):
+        with _live_lock:
+            for stage in range(len(unit['names'])):
+                self._running.pop((self._unit_key(unit), stage), None)
+
+    def snapshot(self):
+        """Restituisce l'avanzamento dei task in corso e la fine prevista del flusso."""
+        now = time.monotonic()
+        with _live_lock:
+            tasks = []
+            complete = True
+            group_remaining = 0.0
+            for entry in self._running.values():
+                elapsed = now - entry['clock']
+                if entry['percent']:
+                    # La velocità osservata è più affidabile della durata storica
+                    remaining = elapsed * (100 - entry['percent']) / entry['percent']
+                elif entry['expected']:
+                    remaining = max(entry['expected'] - elapsed, 0.0)
+                else:
+                    remaining = None
+                    complete = False
+                tasks.append({
+                    'name': entry['name'],
+                    'started': entry['started'],
+                    'elapsed': elapsed,
+                    'percent': entry['percent'],
+                    'message': entry['message'],
+                    'remaining': remaining
+                })
+                group_remaining = max(group_remaining, remaining or 0.0)
+            group_remaining += sum(self._pending.values()) / self._lanes
+            remaining = group_remaining + self._remaining_after
+        return {
+            'flow': self.flow_label,
+            'flow_name': self.flow_name,
+            'started': self.started,
+            'tasks': tasks,
+            'remaining': remaining,
+            'eta': (datetime.now() + timedelta(seconds=remaining)).isoformat(),
+            'estimate_complete': complete
+        }
+
+    def close(self):
+        with _live_lock:
+            _live_runs.pop(self.run_id, None)
+
+def live_progress():
+    """Restituisce l'avanzamento delle esecuzioni in corso in questo processo, per run_id."""
+    with _live_lock:
+        runs = list(_live_runs.values())
+    return {run.run_id: run.snapshot() for run in runs}
+
+def _run_unit(flow_name, unit, run_id, cancel_event, attempt, skip_event=None, progress=None):
+    """
+    Esegue un'unità di lavoro (un task, una pipeline o un'istanza di un task matrice):
+    acquisisce le sue risorse condivise, avvia i processi e rilascia le risorse.
+    L'avanzamento dichiarato dai task viene riportato a 'progress' (RunProgress).
+    Restituisce i risultati dei processi con tempi e attesa, o None se l'attesa
+    delle risorse è stata interrotta dall'annullamento del flusso o del task.
+    """
+    # Le risorse condivise (es. Excel, sessione SafeWork) vengono acquisite tutte
+    # insieme prima di avviare il task, in ordine di arrivo tra tutti i flussi attivi
+    resources = unit['resources']
+    resource_set = ResourceSet(resources, f"{flow_name}: {unit['label']}")
+    resource_list = ", ".join(f"{name}:{capacity}" for name, capacity in sorted(resources.items()))
+
+    def on_resource_wait():
+        busy = "; ".join(f"{name} -> {', '.join(labels) or 'libera'}" for name, labels in resource_set.holders().items())
+        logging.info(f"[{flow_name}] Task {unit['label']} in attesa delle risorse {resource_list} (occupate da: {busy}).")
+
+    queued_at = time.monotonic()
+    if not resource_set.acquire(cancel_event, on_resource_wait, skip_event=skip_event):
+        if cancel_event is not None and cancel_event.is_set():
+            logging.warning(f"[{flow_name}] Attesa delle risorse {resource_list} interrotta dall'annullamento del flusso.")
+        else:
+            logging.warning(f"[{flow_name}] Attesa delle risorse {resource_list} interrotta dall'annullamento del task {unit['label']}.")
+        return None
+    queue_wait = time.monotonic() - queued_at
+    if resources and queue_wait >= 1:
+        logging.info(f"[{flow_name}] Risorse {resource_list} acquisite dopo {queue_wait:.2f} secondi di attesa.")
+
+    on_progress = None
+    if progress is not None:
+        progress.unit_started(unit)
+        on_progress = lambda stage, percent, message: progress.report(unit, stage, percent, message)
+    try:
+        started = datetime.now().isoformat()
+        run_start = time.monotonic()
+        results = _run_pipeline(unit['commands'], run_id, unit['indices'], cancel_event, attempt,
+                                unit.get('env'), unit.get('instance'), skip_event, on_progress)
+        return {'results': results, 'queue_wait': queue_wait, 'started': started, 'ended': datetime.now().isoformat(),
+                'run_span': (run_start, time.monotonic())}
+    finally:
+        if progress is not None:
+            progress.unit_finished(unit)
+        resource_set.release()
+
+def _busy_seconds(spans):
+    """Secondi in cui almeno uno degli intervalli (inizio, fine) era in corso, senza contare le sovrapposizioni."""
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(spans):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+def execute_flow(flow_name, tasks, run_id=None, cancel_event=None, checkpoint_key=None, start_index=0,
+                 params=None, skip_event=None):
+    """
+    Esegue una lista di task (dizionari con 'name' e 'path') in sequenza.
+    I task consecutivi con 'pipe_to_next' vengono eseguiti in parallelo come una
+    pipeline; la pipeline riesce solo se tutti i suoi task terminano con codice 0.
+    Un task con 'matrix' viene eseguito una volta per ogni insieme di parametri,
+    con al più 'max_parallel' istanze in parallelo; riesce solo se riescono tutte.
+    L'output di ogni task viene salvato in artefatti compressi dell'esecuzione
+    identificata da run_id; nel log principale finiscono solo un riepilogo e
+    le ultime righe. Impostando cancel_event l'esecuzione viene annullata,
+    terminando il task in corso; impostando skip_event viene terminato solo il
+    task in corso e il flusso prosegue con il successivo.
+    'params' sono parametri dell'esecuzione, passati a tutti i task come
+    variabili d'ambiente.
+    Se checkpoint_key è indicato, l'avanzamento viene salvato dopo ogni task nel
+    checkpoint del flusso; se run_id è un'esecuzione esistente, questa viene
+    ripresa dal task start_index. Restituisce l'identificativo dell'esecuzione.
+    """
+    # Un run_id già esistente indica la ripresa di un'esecuzione precedente
+    manifest = load_run_manifest(run_id) if run_id else None
+    run_id = run_id or new_run_id()
+
+    if manifest is None:
+        logging.info(f"TRIGGER: Avvio flusso '{flow_name}' (esecuzione {run_id}).")
+        manifest = {
+            'run_id': run_id,
+            'flow': flow_name,
+            'flow_name': checkpoint_key,
+            'status': 'running',
+            'started': datetime.now().isoformat(),
+            'ended': None,
+            'attempt': 0,
+            'params': params or {},
+            'tasks': []
+        }
+    else:
+        task_name = tasks[start_index].get('name', 'Task Senza Nome') if start_index < len(tasks) else ''
+        logging.info(f"RIPRESA: Flusso '{flow_name}' (esecuzione {run_id}) ripreso dal task {start_index+1}/{len(tasks)} '{task_name}'.")
+        manifest['status'] = 'running'
+        manifest['ended'] = None
+        manifest['attempt'] = manifest.get('attempt', 0) + 1
+        manifest.setdefault('resumed', []).append(datetime.now().isoformat())
+        if params:
+            manifest['params'] = params
+    attempt = manifest['attempt']
+    _write_run_manifest(manifest)
+    flow_failed = False
+    flow_cancelled = False
+
+    # Indice da cui riprendere in caso di errore: l'inizio del gruppo in corso,
+    # perché una pipeline va sempre rieseguita dal primo task
+    resume_index = start_index
+
+    def save_checkpoint(status):
+        if checkpoint_key is None:
+            return
+        _save_checkpoint(checkpoint_key, {
+            'flow': checkpoint_key,
+            'run_id': run_id,
+            'status': status,
+            'next_index': resume_index,
+            'task_count': len(tasks),
+            'tasks_signature': tasks_signature(tasks),
+            'updated': datetime.now().isoformat()
+        })
+
+    save_checkpoint('running')
+
+    progress = RunProgress(run_id, flow_name, checkpoint_key)
+    try:
+        i = start_index
+        while i < len(tasks) and not flow_failed:
+            if cancel_event is not None and cancel_event.is_set():
+                logging.warning(f"[{flow_name}] FLUSSO ANNULLATO prima del task '{tasks[i].get('name', 'Task Senza Nome')}'.")
+                flow_cancelled = True
+                break
+
+            if skip_event is not None:
+                # Una richiesta di annullamento arrivata tra due task non riguarda il successivo
+                skip_event.clear()
+            group = pipe_group(tasks, i)
+            resume_index = group[0]
+            i = group[-1] + 1
+
+            task = tasks[group[0]]
+            task_name = task.get('name', 'Task Senza Nome')
+
+            # Controlla se il task è abilitato. Per retrocompatibilità, se la chiave 'enabled'
+            # non esiste, il task viene considerato abilitato.
+            if not task.get('enabled', True):
+                logging.info(f"[{flow_name}] Task '{task_name}' saltato perché disabilitato.")
                 continue
 
-            start_time = time.monotonic()
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                check=False,
-                encoding='utf-8',
-                errors='replace'
-            )
-            end_time = time.monotonic()
-            duration = end_time - start_time
-
-            if result.stdout:
-                logging.info(f"[{flow_name}] Output del task '{task_name}':\n{result.stdout.strip()}")
-
-            if result.returncode == 0:
-                logging.info(f"[{flow_name}] Task '{task_name}' completato con successo in {duration:.2f} secondi.")
-                update_task_stats(task_path, duration) # Aggiorna le statistiche
-                if i < len(tasks) - 1:
-                    next_task_name = tasks[i+1].get('name', 'Task Senza Nome')
-                    logging.info(f"[{flow_name}] Prossimo task: '{next_task_name}'")
+            if len(group) > 1:
+                stage_names = " | ".join(f"'{tasks[j].get('name', 'Task Senza Nome')}'" for j in group)
+                logging.info(f"[{flow_name}] Esecuzione task {group[0]+1}-{group[-1]+1}/{len(tasks)} in modalità pipe: {stage_names}...")
+
+            commands = []
+            resources = {}
+            matrix = None
+            for j in group:
+                task_name = tasks[j].get('name', 'Task Senza Nome')
+                task_path = tasks[j].get('path', '')
+                if len(group) == 1:
+                    logging.info(f"[{flow_name}] Esecuzione task {j+1}/{len(tasks)} '{task_name}': '{task_path}'...")
+
+                if not task_path or not os.path.exists(task_path):
+                    logging.error(f"[{flow_name}] ERRORE: Il file del task '{task_name}' ('{task_path}') non è stato trovato. Interruzione del flusso.")
+                    manifest['tasks'].append({'index': j, 'name': task_name, 'path': task_path, 'attempt': attempt, 'status': 'missing'})
+                    flow_failed = True
+                    break
+
+                try:
+                    resources.update(parse_resources(tasks[j].get('resources')))
+                except ValueError as e:
+                    logging.error(f"[{flow_name}] ERRORE: Risorse non valide per il task '{task_name}': {e} Interruzione del flusso.")
+                    manifest['tasks'].append({'index': j, 'name': task_name, 'path': task_path, 'attempt': attempt,
+                                              'status': 'error', 'error': str(e)})
+                    flow_failed = True
+                    break
+
+                try:
+                    matrix, max_parallel = parse_matrix(tasks[j])
+                except ValueError as e:
+                    logging.error(f"[{flow_name}] ERRORE: Matrice non valida per il task '{task_name}': {e} Interruzione del flusso.")
+                    manifest['tasks'].append({'index': j, 'name': task_name, 'path': task_path, 'attempt': attempt,
+                                              'status': 'error', 'error': str(e)})
+                    flow_failed = True
+                    break
+
+                command = _build_command(task_path)
+                if command is None:
+                    file_extension = os.path.splitext(task_path)[1].lower()
+                    if len(group) == 1:
+                        logging.error(f"[{flow_name}] ERRORE: Tipo di file non supportato '{file_extension}' per il task '{task_name}'. Salto.")
+                    else:
+                        # Un task mancante spezzerebbe la pipeline: non si può semplicemente saltare
+                        logging.error(f"[{flow_name}] ERRORE: Tipo di file non supportato '{file_extension}' per il task '{task_name}' in una pipeline. Interruzione del flusso.")
+                        manifest['tasks'].append({'index': j, 'name': task_name, 'path': task_path, 'attempt': attempt, 'status': 'unsupported'})
+                        flow_failed = True
+                    break
+                commands.append(command)
+
+            if flow_failed or len(commands) < len(group):
+                continue
+
+            group_names = ", ".join(f"'{tasks[j].get('name', 'Task Senza Nome')}'" for j in group)
+            if matrix is None:
+                units = [{'label': group_names, 'commands': commands, 'indices': group, 'resources': resources, 'env': params,
+                          'names': [tasks[j].get('name', 'Task Senza Nome') for j in group],
+                          'stats_keys': [tasks[j].get('path', '') for j in group]}]
             else:
-                # Se il task fallisce, logga tutto l'output e interrompi il flusso
-                logging.error(f"[{flow_name}] ERRORE: Task '{task_name}' terminato con codice {result.returncode} dopo {duration:.2f} secondi.")
+                # Ogni istanza della matrice è un'unità a sé, con le proprie risorse
+                units = [{
+                    'label': f"'{task_name} [{instance['name']}]'",
+                    'commands': [commands[0] + instance['args']],
+                    'indices': group,
+                    'resources': resources,
+                    'env': {**(params or {}), **instance['env']},
+                    'instance': k,
+                    'instance_name': instance['name'],
+                    'names': [f"{task_name} [{instance['name']}]"],
+                    'stats_keys': [f"{task_path} [{instance['name']}]"]
+                } for k, instance in enumerate(matrix)]
+                logging.info(f"[{flow_name}] Task matrice '{task_name}': {len(units)} istanze, al più {max_parallel} in parallelo.")
+            progress.start_group(tasks, i, units, max_parallel if matrix is not None else 1)
 
-                # Logga sia stdout che stderr perché l'errore può finire in entrambi
-                if result.stdout:
-                    logging.error(f"[{flow_name}] Output standard del task '{task_name}':\n{result.stdout.strip()}")
-                if result.stderr:
-                    logging.error(f"[{flow_name}] Errore standard del task '{task_name}':\n{result.stderr.strip()}")
+            try:
+                if len(units) == 1:
+                    outcomes = [_run_unit(flow_name, units[0], run_id, cancel_event, attempt, skip_event, progress)]
+                else:
+                    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+                        outcomes = list(pool.map(
+                            lambda unit: _run_unit(flow_name, unit, run_id, cancel_event, attempt, skip_event, progress), units
+                        ))
+            except Exception as e:
+                task_name = tasks[group[0]].get('name', 'Task Senza Nome')
+                logging.critical(f"[{flow_name}] Errore critico durante l'esecuzione del task '{task_name}': {e}")
+                logging.warning(f"[{flow_name}] Flusso interrotto a causa di un'eccezione.")
+                for j in group:
+                    manifest['tasks'].append({'index': j, 'name': tasks[j].get('name', 'Task Senza Nome'),
+                                              'path': tasks[j].get('path', ''), 'attempt': attempt, 'status': 'error', 'error': str(e)})
+                flow_failed = True
+                break
 
-                logging.critical(f"[{flow_name}] FLUSSO INTERROTTO a causa di un errore nel task '{task_name}'. I task successivi non verranno eseguiti.")
-                break # Interrompe il ciclo for
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            skipped = not cancelled and skip_event is not None and skip_event.is_set()
+            failed_names = []
+            for unit, outcome in zip(units, outcomes):
+                if outcome is None:
+                    # Annullato mentre attendeva le risorse: nessun processo è partito
+                    for j, task_name in zip(unit['indices'], unit['names']):
+                        manifest['tasks'].append({'index': j, 'name': task_name, 'path': tasks[j].get('path', ''), 'attempt': attempt,
+                                                  'status': 'cancelled' if cancelled else 'skipped'})
+                    continue
+                for j, result in zip(unit['indices'], outcome['results']):
+                    task_name = tasks[j].get('name', 'Task Senza Nome')
+                    task_path = tasks[j].get('path', '')
+                    stats_key = task_path
+                    if 'instance_name' in unit:
+                        task_name = f"{task_name} [{unit['instance_name']}]"
+                        stats_key = f"{task_path} [{unit['instance_name']}]"
+                    duration = result['duration']
+                    succeeded = result['returncode'] == 0
+                    if succeeded:
+                        status = 'success'
+                    elif cancelled:
+                        status = 'cancelled'
+                    else:
+                        status = 'skipped' if skipped else 'failed'
+                    task_record = {
+                        'index': j,
+                        'name': task_name,
+                        'path': task_path,
+                        'attempt': attempt,
+                        'status': status,
+                        'started': outcome['started'],
+                        'ended': outcome['ended'],
+                        'queue_wait': outcome['queue_wait'],
+                        'duration': duration,
+                        'returncode': result['returncode'],
+                        'stdout': result['stdout_artifact'],
+                        'stderr': result['stderr_artifact'],
+                        'stdout_lines': result['stdout_lines'],
+                        'stderr_lines': result['stderr_lines'],
+                    }
+                    if 'instance_name' in unit:
+                        task_record['instance'] = unit['instance_name']
+                    manifest['tasks'].append(task_record)
+                    output_summary = (f"output: {result['stdout_lines']} righe stdout, {result['stderr_lines']} righe stderr "
+                                      f"in '{_run_dir(run_id)}'")
 
-        except Exception as e:
-            logging.critical(f"[{flow_name}] Errore critico durante l'esecuzione del task '{task_name}': {e}")
-            logging.warning(f"[{flow_name}] Flusso interrotto a causa di un'eccezione.")
-            break
+                    if status == 'cancelled':
+                        logging.warning(f"[{flow_name}] Task '{task_name}' annullato dopo {duration:.2f} secondi ({output_summary}).")
+                    elif status == 'skipped':
+                        logging.warning(f"[{flow_name}] Task '{task_name}' annullato su richiesta dopo {duration:.2f} secondi ({output_summary}). "
+                                        f"Il flusso prosegue.")
+                    elif succeeded:
+                        logging.info(f"[{flow_name}] Task '{task_name}' completato con successo in {duration:.2f} secondi ({output_summary}).")
+                        if result['stdout_tail']:
+                            logging.info(f"[{flow_name}] Ultime righe dell'output del task '{task_name}':\n"
+                                         f"{_format_tail(result['stdout_tail'], result['stdout_lines'])}")
+                        slow_alert = update_task_stats(stats_key, duration, tasks[j].get('slow_factor', SLOW_TASK_FACTOR)) # Aggiorna le statistiche
+                        if slow_alert:
+                            task_record['slow'] = slow_alert
+                            logging.warning(f"[{flow_name}] LENTEZZA: Task '{task_name}' ha impiegato {format_duration(duration)}, "
+                                            f"{slow_alert['ratio']:.1f} volte la sua durata tipica ({format_duration(slow_alert['baseline'])}).")
+                    else:
+                        # Se il task fallisce, logga la parte finale dell'output
+                        logging.error(f"[{flow_name}] ERRORE: Task '{task_name}' terminato con codice {result['returncode']} dopo {duration:.2f} secondi ({output_summary}).")
 
+                        # Logga sia stdout che stderr perché l'errore può finire in entrambi
+                        if result['stdout_tail']:
+                            logging.error(f"[{flow_name}] Output standard del task '{task_name}' (ultime righe):\n"
+                                          f"{_format_tail(result['stdout_tail'], result['stdout_lines'])}")
+                        if result['stderr_tail']:
+                            logging.error(f"[{flow_name}] Errore standard del task '{task_name}' (ultime righe):\n"
+                                          f"{_format_tail(result['stderr_tail'], result['stderr_lines'])}")
+                        failed_names.append(task_name)
+
+            if matrix is not None and not cancelled:
+                task_name = tasks[group[0]].get('name', 'Task Senza Nome')
+                succeeded_count = len(units) - len(failed_names)
+                # Come per i singoli task, l'attesa delle risorse non fa parte della durata:
+                # conta solo il tempo in cui almeno un'istanza era in esecuzione
+                group_duration = _busy_seconds([outcome['run_span'] for outcome in outcomes if outcome is not None])
+                matrix_record = {'index': group[0], 'name': task_name, 'path': tasks[group[0]].get('path', ''), 'attempt': attempt,
+                                 'instances': len(units), 'succeeded': succeeded_count, 'duration': group_duration}
+                manifest.setdefault('matrix', []).append(matrix_record)
+                logging.info(f"[{flow_name}] Task matrice '{task_name}': {succeeded_count}/{len(units)} istanze completate con successo "
+                             f"in {group_duration:.2f} secondi.")
+                if not failed_names:
+                    slow_alert = update_task_stats(tasks[group[0]].get('path', ''), group_duration,
+                                                   tasks[group[0]].get('slow_factor', SLOW_TASK_FACTOR))
+                    if slow_alert:
+                        matrix_record['slow'] = slow_alert
+                        logging.warning(f"[{flow_name}] LENTEZZA: Task matrice '{task_name}' ha impiegato {format_duration(group_duration)}, "
+                                        f"{slow_alert['ratio']:.1f} volte la sua durata tipica ({format_duration(slow_alert['baseline'])}).")
+            _write_run_manifest(manifest)
+
+            if cancelled:
+                logging.warning(f"[{flow_name}] FLUSSO ANNULLATO durante l'esecuzione. I task successivi non verranno eseguiti.")
+                flow_cancelled = True
+                break
+            if failed_names:
+                # Come con 'set -o pipefail': basta un task fallito per far fallire la pipeline
+                failed_list = ", ".join(f"'{name}'" for name in failed_names)
+                logging.critical(f"[{flow_name}] FLUSSO INTERROTTO a causa di un errore nel task {failed_list}. I task successivi non verranno eseguiti.")
+                flow_failed = True
+            else:
+                resume_index = i
+                save_checkpoint('running')
+                if i < len(tasks):
+                    next_task_name = tasks[i].get('name', 'Task Senza Nome')
+                    logging.info(f"[{flow_name}] Prossimo task: '{next_task_name}'")
+    finally:
+        progress.close()
+
+    if flow_cancelled:
+        manifest['status'] = 'cancelled'
+    else:
+        manifest['status'] = 'failed' if flow_failed else 'success'
+    manifest['ended'] = datetime.now().isoformat()
+    _write_run_manifest(manifest)
+    save_checkpoint(manifest['status'])
+    if manifest['status'] in ('failed', 'cancelled') and checkpoint_key is not None:
+        logging.info(f"[{flow_name}] Checkpoint salvato: l'esecuzione {run_id} può essere ripresa dal task {resume_index+1}.")
     logging.info(f"Flusso '{flow_name}' terminato.")
+    return run_id
+
+def recover_interrupted_run(flow_name, reason):
+    """
+    Chiude come fallita l'ultima esecuzione di un flusso rimasta 'running' perché il
+    processo che la eseguiva è terminato senza concluderla (crash, blocco, kill), così
+    da poterla riprendere dal checkpoint. Non fa nulla se il flusso è in esecuzione
+    in un altro processo. Restituisce il run_id dell'esecuzione chiusa, o None.
+    """
+    flow_lock = FlowLock(flow_name)
+    if not flow_lock.try_acquire(f"{flow_name} (ripristino)"):
+        return None
+    try:
+        checkpoint = load_checkpoint(flow_name)
+        if checkpoint is None or checkpoint.get('status') != 'running':
+            return None
+        run_id = checkpoint['run_id']
+        manifest = load_run_manifest(run_id)
+        if manifest is not None and manifest.get('status') == 'running':
+            manifest['status'] = 'failed'
+            manifest['ended'] = datetime.now().isoformat()
+            manifest['interrupted'] = reason
+            _write_run_manifest(manifest)
+        checkpoint['status'] = 'failed'
+        checkpoint['updated'] = datetime.now().isoformat()
+        _save_checkpoint(flow_name, checkpoint)
+        logging.warning(f"[{flow_name}] Esecuzione {run_id} interrotta ({reason}): può essere ripresa dal task {checkpoint['next_index']+1}.")
+        return run_id
+    finally:
+        flow_lock.release()
+
+def _request_replacement(flow_lock, label, holder):
+    """
+    Chiede all'esecuzione in corso di annullarsi per essere sostituita. Subito dopo
+    l'acquisizione del lock il detentore può non aver ancora scritto i suoi dati: la
+    richiesta viene ripetuta finché non viene recapitata o il lock si libera
+    (segnalando nel log un'attesa oltre CANCEL_REQUEST_TIMEOUT_SECONDS).
+    Restituisce True se nel frattempo l'esecuzione è terminata e il lock è stato acquisito.
+    """
+    deadline = time.monotonic() + CANCEL_REQUEST_TIMEOUT_SECONDS
+    while not flow_lock.request_cancel():
+        if flow_lock.wait_and_acquire(label, timeout=CANCEL_REQUEST_RETRY_SECONDS):
+            logging.info(f"[{label}] L'esecuzione da sostituire è terminata nel frattempo: avvio immediato.")
+            return True
+        if deadline is not None and time.monotonic() >= deadline:
+            deadline = None
+            logging.error(f"[{label}] Richiesta di annullamento non ancora recapitata a {holder} dopo {CANCEL_REQUEST_TIMEOUT_SECONDS} "
+                          f"secondi (detentore del lock non leggibile): continuo a riprovare.")
+    logging.warning(f"[{label}] Il flusso è già in esecuzione da {holder}. Richiesta di annullamento inviata, verrà sostituito.")
+    return False
+
+def run_flow_exclusive(flow_name, tasks, overlap_policy='skip', label=None, resume=False, params=None,
+                       cancel_event=None):
+    """
+    Esegue un flusso garantendo che, tra tutti i processi (GUI, scheduler, ...),
+    ne sia in corso al più un'esecuzione. Se il flusso è già in esecuzione si
+    applica overlap_policy:
+      - 'skip':    la nuova attivazione viene ignorata;
+      - 'queue':   la nuova attivazione attende la fine di quella in corso
+                   (al più una in attesa, le altre vengono accorpate);
+      - 'replace': l'esecuzione in corso viene annullata e sostituita.
+    'label' è il nome mostrato nei log (es. "Flusso (Manuale)").
+    Con resume=True riprende l'ultima esecuzione fallita o annullata dal task in
+    errore, mantenendo lo stesso identificativo. 'params' viene passato a execute_flow.
+    Le richieste di annullamento del flusso o del solo task in corso possono
+    arrivare da altri processi (vedi FlowLock); impostando cancel_event, se indicato,
+    l'esecuzione viene annullata dallo stesso processo.
+    Restituisce l'identificativo dell'esecuzione, o None se non è stata avviata.
+    """
+    label = label or flow_name
+    if overlap_policy not in OVERLAP_POLICIES:
+        logging.warning(f"[{label}] Politica di sovrapposizione '{overlap_policy}' non valida. Uso 'skip'.")
+        overlap_policy = 'skip'
+
+    flow_lock = FlowLock(flow_name)
+    if not flow_lock.try_acquire(label):
+        owner = flow_lock.owner() or {}
+        holder = f"'{owner.get('label', '?')}' (PID {owner.get('pid', '?')})"
+
+        if overlap_policy == 'skip':
+            logging.warning(f"[{label}] Il flusso è già in esecuzione da {holder}. Attivazione ignorata.")
+            return None
+        if not flow_lock.reserve_queue_slot():
+            logging.warning(f"[{label}] Il flusso è già in esecuzione da {holder} e un'altra attivazione è in attesa. Attivazione accorpata.")
+            return None
+        acquired = False
+        if overlap_policy == 'replace':
+            acquired = _request_replacement(flow_lock, label, holder)
+        else:
+            logging.info(f"[{label}] Il flusso è già in esecuzione da {holder}. Attivazione in coda.")
+        if not acquired:
+            flow_lock.wait_and_acquire(label)
+
+    # Un thread di controllo trasforma le richieste di annullamento di altri processi
+    # in cancel_event (intero flusso) o skip_event (solo il task in corso)
+    cancel_event = cancel_event or threading.Event()
+    skip_event = threading.Event()
+    finished = threading.Event()
+
+    def watch_cancel_requests():
+        while not finished.wait(1):
+            if flow_lock.cancel_requested():
+                cancel_event.set()
+                return
+            if flow_lock.take_task_cancel_request():
+                skip_event.set()
+
+    watcher = threading.Thread(target=watch_cancel_requests, daemon=True)
+    watcher.start()
+    try:
+        run_id = None
+        start_index = 0
+        if resume:
+            # Il checkpoint va letto solo dopo aver acquisito il lock del flusso
+            checkpoint = load_checkpoint(flow_name)
+            if not is_resumable(checkpoint):
+                logging.warning(f"[{label}] Nessuna esecuzione fallita da riprendere.")
+                return None
+            if checkpoint.get('tasks_signature') != tasks_signature(tasks):
+                logging.error(f"[{label}] I task del flusso sono cambiati dopo l'esecuzione {checkpoint['run_id']}: impossibile riprenderla.")
+                return None
+            run_id = checkpoint['run_id']
+            start_index = checkpoint['next_index']
+        return execute_flow(label, tasks, run_id=run_id, cancel_event=cancel_event,
+                            checkpoint_key=flow_name, start_index=start_index,
+                            params=params, skip_event=skip_event)
+    finally:
+        finished.set()
+        watcher.join()
+        flow_lock.release()
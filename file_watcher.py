@@ -0,0 +1,225 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# Valori predefiniti dei trigger su file (in secondi)
+DEFAULT_DEBOUNCE_SECONDS = 5
+DEFAULT_MIN_INTERVAL_SECONDS = 60
+DEFAULT_POLL_INTERVAL_SECONDS = 5
+
+# Costanti di inotify (linux/inotify.h)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def parse_watch(watch):
+    """
+    Legge la dichiarazione 'watch' di un flusso, ad esempio
+    {"path": "input", "pattern": "*.csv", "debounce_seconds": 5, "min_interval_seconds": 60}.
+    Restituisce la dichiarazione con i valori predefiniti, None se il flusso non ha
+    un trigger su file. Solleva ValueError se la dichiarazione non è valida.
+    """
+    if watch is None:
+        return None
+    if not isinstance(watch, dict) or not watch.get('path'):
+        raise ValueError("'watch' deve indicare almeno la cartella da osservare ('path').")
+    normalized = {
+        'path': str(watch['path']),
+        'pattern': str(watch.get('pattern', '*')),
+        'debounce_seconds': watch.get('debounce_seconds', DEFAULT_DEBOUNCE_SECONDS),
+        'min_interval_seconds': watch.get('min_interval_seconds', DEFAULT_MIN_INTERVAL_SECONDS),
+        'poll_interval_seconds': watch.get('poll_interval_seconds', DEFAULT_POLL_INTERVAL_SECONDS)
+    }
+    for key in ('debounce_seconds', 'min_interval_seconds', 'poll_interval_seconds'):
+        if not isinstance(normalized[key], (int, float)) or normalized[key] < 0:
+            raise ValueError(f"'{key}' deve essere un numero di secondi non negativo.")
+    if normalized['poll_interval_seconds'] == 0:
+        raise ValueError("'poll_interval_seconds' deve essere maggiore di zero.")
+    return normalized
+
+
+class InotifyWatcher:
+    """Osserva una cartella con inotify (solo Linux): nessun costo finché non arrivano eventi."""
+    mode = 'inotify'
+
+    def __init__(self, directory, pattern):
+        self.pattern = pattern
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 non riuscita")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"impossibile osservare '{directory}': {os.strerror(errno)}")
+
+    def read_changes(self, timeout):
+        """Attende al più 'timeout' secondi e restituisce i nomi dei file modificati che rispettano il pattern."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changes = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0').decode(errors='replace')
+            offset += name_length
+            if mask & (_IN_Q_OVERFLOW | _IN_IGNORED):
+                # Eventi persi o cartella rimossa: non si sa quali file siano cambiati
+                raise OSError(f"coda degli eventi persa (maschera {mask:#x})")
+            if name and fnmatch.fnmatch(name, self.pattern):
+                changes.add(name)
+        return changes
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class PollingWatcher:
+    """Osserva una cartella confrontando periodicamente data di modifica e dimensione dei file."""
+    mode = 'polling'
+
+    def __init__(self, directory, pattern, poll_interval=DEFAULT_POLL_INTERVAL_SECONDS):
+        self.directory = directory
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        # I file già presenti all'avvio non attivano il flusso
+        self._snapshot = self._scan()
+        self._last_scan = time.monotonic()
+
+    def _scan(self):
+        snapshot = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and fnmatch.fnmatch(entry.name, self.pattern):
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return snapshot
+
+    def read_changes(self, timeout):
+        """Attende al più 'timeout' secondi e restituisce i nomi dei file nuovi o modificati."""
+        time.sleep(max(0, min(timeout, self._last_scan + self.poll_interval - time.monotonic())))
+        if time.monotonic() - self._last_scan < self.poll_interval:
+            return set()
+        snapshot = self._scan()
+        self._last_scan = time.monotonic()
+        changes = {name for name, signature in snapshot.items() if self._snapshot.get(name) != signature}
+        self._snapshot = snapshot
+        return changes
+
+    def close(self):
+        pass
+
+
+def matching_files(directory, pattern):
+    """Nomi dei file della cartella che rispettano il pattern (vuoto se la cartella non esiste)."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file() and fnmatch.fnmatch(entry.name, pattern)}
+    except FileNotFoundError:
+        return set()
+
+
+def open_watcher(watch):
+    """Crea l'osservatore migliore disponibile: inotify su Linux, altrimenti il polling."""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(watch['path'], watch['pattern'])
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify non disponibile per '{watch['path']}' ({e}): uso il polling.")
+    return PollingWatcher(watch['path'], watch['pattern'], watch['poll_interval_seconds'])
+
+
+class FileTrigger:
+    """
+    Avvia un flusso quando nella cartella osservata compare o cambia un file che
+    rispetta il pattern. Le raffiche di modifiche vengono accorpate: il flusso parte
+    solo dopo 'debounce_seconds' senza nuovi eventi, e non più spesso di una volta
+    ogni 'min_interval_seconds' (i file arrivati nel frattempo attivano un'unica
+    esecuzione successiva).
+    """
+    def __init__(self, flow_name, watch, on_trigger):
+        self.flow_name = flow_name
+        self.watch = watch
+        self.on_trigger = on_trigger
+        self.mode = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"watch-{self.flow_name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        watch = self.watch
+        watcher = open_watcher(watch)
+        self.mode = watcher.mode
+        logging.info(f"[{self.flow_name}] Osservazione di '{os.path.join(watch['path'], watch['pattern'])}' avviata ({self.mode}).")
+
+        pending = set()
+        last_event = None
+        last_fire = None
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    changes = watcher.read_changes(timeout=0.5)
+                except OSError as e:
+                    # Si riparte con un nuovo osservatore (es. cartella ricreata) e si considerano
+                    # cambiati i file presenti, perché gli eventi intermedi sono andati persi
+                    logging.warning(f"[{self.flow_name}] Osservazione di '{watch['path']}' interrotta ({e}): la riavvio.")
+                    watcher.close()
+                    self._stop_event.wait(watch['poll_interval_seconds'])
+                    watcher = open_watcher(watch)
+                    self.mode = watcher.mode
+                    changes = matching_files(watch['path'], watch['pattern'])
+
+                now = time.monotonic()
+                if changes:
+                    pending |= changes
+                    last_event = now
+
+                if not pending or now - last_event < watch['debounce_seconds']:
+                    continue
+                if last_fire is not None and now - last_fire < watch['min_interval_seconds']:
+                    continue
+                files = sorted(pending)
+                pending = set()
+                last_fire = now
+                try:
+                    self.on_trigger(self.flow_name, files)
+                except Exception as e:
+                    logging.critical(f"[{self.flow_name}] Errore nell'avvio del flusso da trigger su file: {e}")
+        finally:
+            watcher.close()
+            logging.info(f"[{self.flow_name}] Osservazione di '{watch['path']}' terminata.")
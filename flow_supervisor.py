@@ -0,0 +1,398 @@
+"""
+Esecuzione dei flussi in processi supervisionati.
+
+Lo scheduler non esegue più i flussi nei propri thread: ogni esecuzione gira in un
+processo figlio, così la formattazione di output enormi, la scrittura delle
+statistiche o un crash di un flusso non rallentano il loop di pianificazione né
+gli altri flussi. Il processo figlio invia al supervisore (un thread dello
+scheduler) segnali di vita periodici con l'avanzamento, i PID dei task in corso e
+la memoria usata dal processo e dai suoi task, e al termine l'esito
+dell'esecuzione. Se il processo termina in modo anomalo, smette di dare segnali di
+vita o supera il limite di memoria, il supervisore gli chiede di annullare il
+flusso (sul canale di controllo, che funziona anche su Windows), lo chiude se non
+si ferma, termina i task rimasti orfani e lo riavvia riprendendo l'esecuzione dal
+checkpoint.
+"""
+import ctypes
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from core_logic import setup_logging, run_flow_exclusive, live_progress, recover_interrupted_run, running_task_pids, kill_task_tree
+
+# Ogni quanti secondi il processo di un flusso invia un segnale di vita
+HEARTBEAT_SECONDS = 5
+# Ogni quanti secondi il processo di un flusso controlla se sono partiti o finiti dei task
+TASK_PIDS_POLL_SECONDS = 0.5
+# Dopo quanti secondi senza segnali di vita il processo è considerato bloccato
+HEARTBEAT_TIMEOUT_SECONDS = 60
+# Riavvii predefiniti di un processo terminato in modo anomalo, per esecuzione
+DEFAULT_MAX_RESTARTS = 1
+# Secondi concessi a un processo da fermare per annullare il flusso prima di forzarne la chiusura
+STOP_GRACE_SECONDS = 30
+
+# 'spawn' avvia un interprete pulito: il figlio non eredita thread, lock e handler dello scheduler
+_context = multiprocessing.get_context('spawn')
+
+# Supervisori attivi, per il file di stato
+_supervisors = set()
+_supervisors_lock = threading.Lock()
+
+
+def _linux_tree_memory_kb(task_pids):
+    # Ogni task è capo del proprio gruppo di processi: il gruppo ne contiene anche i figli
+    page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+    own_pid = os.getpid()
+    groups = set(task_pids)
+    total_pages = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Il nome del comando (tra parentesi) può contenere spazi: i campi seguono l'ultima ')'
+        fields = stat[stat.rindex(b')') + 2:].split()
+        if int(entry) == own_pid or int(fields[2]) in groups:
+            total_pages += int(fields[21])
+    return total_pages * page_kb
+
+
+def _windows_tree_memory_kb():
+    from ctypes import wintypes
+
+    class PROCESSENTRY32(ctypes.Structure):
+        _fields_ = [('dwSize', wintypes.DWORD), ('cntUsage', wintypes.DWORD), ('th32ProcessID', wintypes.DWORD),
+                    ('th32DefaultHeapID', ctypes.c_size_t), ('th32ModuleID', wintypes.DWORD),
+                    ('cntThreads', wintypes.DWORD), ('th32ParentProcessID', wintypes.DWORD),
+                    ('pcPriClassBase', wintypes.LONG), ('dwFlags', wintypes.DWORD), ('szExeFile', ctypes.c_char * 260)]
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD), ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t), ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t), ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    kernel32.K32GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    TH32CS_SNAPPROCESS = 0x2
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    PROCESS_VM_READ = 0x0010
+
+    # I discendenti del processo (task e loro figli) si ricavano dai PID dei genitori
+    snapshot = kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0)
+    if snapshot is None or snapshot == ctypes.c_void_p(-1).value:
+        return None
+    children = {}
+    try:
+        entry = PROCESSENTRY32()
+        entry.dwSize = ctypes.sizeof(PROCESSENTRY32)
+        found = kernel32.Process32First(snapshot, ctypes.byref(entry))
+        while found:
+            children.setdefault(entry.th32ParentProcessID, []).append(entry.th32ProcessID)
+            found = kernel32.Process32Next(snapshot, ctypes.byref(entry))
+    finally:
+        kernel32.CloseHandle(snapshot)
+
+    tree = set()
+    pending = [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        if pid not in tree:
+            tree.add(pid)
+            pending.extend(children.get(pid, []))
+
+    total_bytes = 0
+    for pid in tree:
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ, False, pid)
+        if not handle:
+            continue
+        try:
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+            if kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                total_bytes += counters.WorkingSetSize
+        finally:
+            kernel32.CloseHandle(handle)
+    return total_bytes // 1024
+
+
+def _tree_memory_kb(task_pids):
+    """
+    Memoria occupata ora (in KB) dal processo del flusso e dai processi dei suoi task
+    (figli compresi), o None se la piattaforma non permette di misurarla.
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            return _linux_tree_memory_kb(task_pids)
+        if os.name == 'nt':
+            return _windows_tree_memory_kb()
+    except (OSError, ValueError, AttributeError) as e:
+        logging.debug(f"Misura della memoria non riuscita: {e}")
+    return None
+
+
+def _supervised_main(conn, control, flow_name, tasks, overlap_policy, label, resume, params):
+    """Punto di ingresso del processo di un flusso: esegue il flusso e ne comunica l'esito al supervisore."""
+    setup_logging()
+    cancel_event = threading.Event()
+    # Ctrl+C arriva anche ai figli: l'arresto dello scheduler non interrompe i flussi in corso
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def listen():
+        # Il supervisore chiede l'arresto sul canale di controllo, non con un segnale:
+        # su Windows terminate() chiuderebbe il processo senza annullare i task
+        while True:
+            try:
+                message = control.recv()
+            except (EOFError, OSError):
+                # Il supervisore non è più in ascolto (es. scheduler terminato): il flusso prosegue
+                return
+            if message['type'] == 'stop':
+                logging.warning(f"[{label or flow_name}] Arresto richiesto dal supervisore ({message['reason']}): annullamento del flusso.")
+                cancel_event.set()
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except OSError:
+                # Il supervisore non è più in ascolto (es. scheduler terminato): il flusso prosegue
+                pass
+
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        # I PID dei task vengono comunicati appena cambiano, così il supervisore può
+        # terminarli anche se questo processo muore tra due segnali di vita
+        reported_pids = None
+        next_heartbeat = 0
+        while True:
+            task_pids = running_task_pids()
+            if time.monotonic() >= next_heartbeat:
+                send({'type': 'heartbeat', 'progress': live_progress(), 'memory_kb': _tree_memory_kb(task_pids),
+                      'task_pids': task_pids})
+                next_heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+                reported_pids = task_pids
+            elif task_pids != reported_pids:
+                send({'type': 'tasks', 'task_pids': task_pids})
+                reported_pids = task_pids
+            if stop_heartbeat.wait(TASK_PIDS_POLL_SECONDS):
+                return
+
+    threading.Thread(target=listen, daemon=True).start()
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        run_id = run_flow_exclusive(flow_name, tasks, overlap_policy, label, resume=resume, params=params,
+                                    cancel_event=cancel_event)
+        result = {'type': 'result', 'run_id': run_id}
+    except Exception as e:
+        logging.critical(f"[{label or flow_name}] Errore non gestito nell'esecuzione del flusso: {e}")
+        result = {'type': 'error', 'error': f"{type(e).__name__}: {e}"}
+    stop_heartbeat.set()
+    heartbeat_thread.join()
+    send(result)
+    conn.close()
+
+
+class FlowSupervisor:
+    """
+    Esegue un flusso in un processo figlio e lo sorveglia. Un processo che termina
+    senza riportare l'esito, che non dà segnali di vita per heartbeat_timeout secondi
+    o che (insieme ai suoi task) supera memory_limit_mb viene fermato e riavviato
+    (al più max_restarts volte) riprendendo l'esecuzione interrotta dal checkpoint.
+    """
+    def __init__(self, flow_name, tasks, overlap_policy='skip', label=None, resume=False, params=None,
+                 max_restarts=DEFAULT_MAX_RESTARTS, memory_limit_mb=None, heartbeat_timeout=HEARTBEAT_TIMEOUT_SECONDS):
+        self.flow_name = flow_name
+        self.tasks = tasks
+        self.overlap_policy = overlap_policy
+        self.label = label or flow_name
+        self.resume = resume
+        self.params = params
+        self.max_restarts = max_restarts
+        self.memory_limit_mb = memory_limit_mb
+        self.heartbeat_timeout = heartbeat_timeout
+        self.restarts = 0
+        self.pid = None
+        self.task_pids = []
+        self.progress = {}
+        self.memory_kb = None
+        self.last_heartbeat = None
+        self._memory_limit_warned = False
+
+    def info(self):
+        """Stato del supervisore per il file di stato dello scheduler."""
+        return {
+            'flow': self.flow_name,
+            'label': self.label,
+            'pid': self.pid,
+            'task_pids': self.task_pids,
+            'restarts': self.restarts,
+            'memory_kb': self.memory_kb,
+            'last_heartbeat': self.last_heartbeat
+        }
+
+    def run(self):
+        """Esegue il flusso, riavviandone il processo se necessario. Restituisce il run_id, o None."""
+        resume = self.resume
+        last_run_id = None
+        while True:
+            run_id, problem, restartable = self._run_process(resume)
+            last_run_id = run_id or last_run_id
+            if problem is None:
+                return last_run_id
+
+            logging.error(f"[{self.label}] Processo del flusso (PID {self.pid}): {problem}.")
+            last_run_id = recover_interrupted_run(self.flow_name, problem) or last_run_id
+            if not restartable:
+                return last_run_id
+            if last_run_id is None:
+                logging.error(f"[{self.label}] Nessuna esecuzione interrotta da riprendere: il processo non viene riavviato.")
+                return None
+            if self.restarts >= self.max_restarts:
+                logging.critical(f"[{self.label}] Riavvii esauriti ({self.max_restarts}): l'esecuzione {last_run_id} "
+                                 f"può essere ripresa manualmente.")
+                return last_run_id
+            self.restarts += 1
+            logging.warning(f"[{self.label}] Riavvio {self.restarts}/{self.max_restarts} del processo: "
+                            f"ripresa dell'esecuzione {last_run_id}.")
+            resume = True
+
+    def _run_process(self, resume):
+        """
+        Avvia un processo per il flusso e lo sorveglia fino al termine.
+        Restituisce (run_id, problema, riavviabile); problema è None se il processo
+        ha riportato regolarmente l'esito.
+        """
+        parent_conn, child_conn = _context.Pipe(duplex=False)
+        child_control, control = _context.Pipe(duplex=False)
+        process = _context.Process(
+            target=_supervised_main,
+            args=(child_conn, child_control, self.flow_name, self.tasks, self.overlap_policy, self.label, resume, self.params),
+            name=f"flow-{self.flow_name}"
+        )
+        process.start()
+        # Chiuse le copie del supervisore, la fine del processo figlio produce EOF sul canale
+        child_conn.close()
+        child_control.close()
+        self.pid = process.pid
+        self.task_pids = []
+        self.last_heartbeat = datetime.now().isoformat()
+        try:
+            return self._watch(process, parent_conn, control)
+        finally:
+            process.join()
+            parent_conn.close()
+            control.close()
+            self.progress = {}
+
+    def _watch(self, process, conn, control):
+        last_heartbeat = time.monotonic()
+        stop_deadline = None
+        problem = None
+        while True:
+            if conn.poll(1):
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    break
+                if message['type'] == 'result':
+                    return message['run_id'], problem, True
+                if message['type'] == 'error':
+                    return None, message['error'], False
+                self.task_pids = message['task_pids']
+                if message['type'] == 'tasks':
+                    continue
+                last_heartbeat = time.monotonic()
+                self.last_heartbeat = datetime.now().isoformat()
+                self.progress = message['progress']
+                self.memory_kb = message['memory_kb']
+                if self.memory_limit_mb and self.memory_kb is None and not self._memory_limit_warned:
+                    self._memory_limit_warned = True
+                    logging.warning(f"[{self.label}] Memoria dei processi non misurabile su questa piattaforma: "
+                                    f"il limite di {self.memory_limit_mb} MB non viene applicato.")
+                if (stop_deadline is None and self.memory_limit_mb and self.memory_kb
+                        and self.memory_kb > self.memory_limit_mb * 1024):
+                    problem = f"memoria oltre il limite ({self.memory_kb // 1024} MB su {self.memory_limit_mb} MB)"
+                    stop_deadline = self._request_stop(process, control, problem)
+                continue
+
+            if not process.is_alive():
+                break
+            now = time.monotonic()
+            if stop_deadline is None and now - last_heartbeat > self.heartbeat_timeout:
+                problem = f"nessun segnale di vita da {self.heartbeat_timeout} secondi"
+                stop_deadline = self._request_stop(process, control, problem)
+            elif stop_deadline is not None and now > stop_deadline:
+                logging.error(f"[{self.label}] Il processo {process.pid} non si è fermato entro {STOP_GRACE_SECONDS} secondi: chiusura forzata.")
+                process.kill()
+                self._kill_tasks()
+                stop_deadline = float('inf')
+
+        process.join()
+        # I task di un processo terminato restano in vita (adottati dal sistema): vanno
+        # chiusi prima del riavvio, altrimenti la ripresa li eseguirebbe una seconda volta
+        self._kill_tasks()
+        return None, problem or f"terminato in modo anomalo (codice di uscita {process.exitcode})", True
+
+    def _request_stop(self, process, control, reason):
+        logging.warning(f"[{self.label}] Arresto del processo {process.pid}: {reason}.")
+        try:
+            control.send({'type': 'stop', 'reason': reason})
+        except OSError:
+            # Il canale è già chiuso: il processo verrà chiuso alla scadenza
+            pass
+        return time.monotonic() + STOP_GRACE_SECONDS
+
+    def _kill_tasks(self):
+        """Termina gli alberi di processi dei task rimasti dal processo del flusso."""
+        for pid in self.task_pids:
+            logging.warning(f"[{self.label}] Chiusura dei processi del task (PID {pid}) rimasti dal processo del flusso.")
+            kill_task_tree(pid)
+        self.task_pids = []
+
+
+def run_supervised(flow_name, tasks, overlap_policy='skip', label=None, resume=False, params=None,
+                   max_restarts=DEFAULT_MAX_RESTARTS, memory_limit_mb=None):
+    """
+    Esegue un flusso con run_flow_exclusive in un processo supervisionato e ne attende
+    la fine. Restituisce l'identificativo dell'esecuzione, o None se non è stata avviata.
+    """
+    supervisor = FlowSupervisor(flow_name, tasks, overlap_policy, label, resume, params, max_restarts, memory_limit_mb)
+    with _supervisors_lock:
+        _supervisors.add(supervisor)
+    try:
+        return supervisor.run()
+    finally:
+        with _supervisors_lock:
+            _supervisors.discard(supervisor)
+
+
+def supervised_progress():
+    """Avanzamento delle esecuzioni in corso nei processi supervisionati, per run_id."""
+    with _supervisors_lock:
+        supervisors = list(_supervisors)
+    progress = {}
+    for supervisor in supervisors:
+        progress.update(supervisor.progress)
+    return progress
+
+
+def supervisors_info():
+    """Stato dei processi supervisionati in corso."""
+    with _supervisors_lock:
+        return [supervisor.info() for supervisor in _supervisors]
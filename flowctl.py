@@ -0,0 +1,419 @@
+"""
+Interfaccia a riga di comando per eseguire e ispezionare i flussi senza GUI.
+
+Importa solo i moduli di base (niente tkinter), così si avvia rapidamente ed è
+adatta a script, CI e timer di sistema. Esempi:
+
+    python flowctl.py list
+    python flowctl.py next
+    python flowctl.py run "Nome Flusso"
+    python flowctl.py run "Nome Flusso" --resume
+    python flowctl.py run-task tasks/task1.py
+    python flowctl.py check "Nome Flusso"
+    python flowctl.py simulate --days 30 --deadline "Nome Flusso=10:00"
+    python flowctl.py stats "Nome Flusso"
+    python flowctl.py history --limit 20
+    python flowctl.py logs "Nome Flusso" --level ERROR --since 7d
+    python flowctl.py logs --follow
+
+Comandi che agiscono sullo scheduler in esecuzione tramite la sua API di controllo:
+
+    python flowctl.py submit "Nome Flusso" --param DATA=2024-01-31
+    python flowctl.py cancel "Nome Flusso" [--task]
+    python flowctl.py pause ["Nome Flusso"]
+    python flowctl.py unpause ["Nome Flusso"]
+    python flowctl.py queue
+
+Codici di uscita: 0 successo, 1 flusso/task fallito, 2 argomenti non validi,
+3 flusso non trovato o senza task, 4 esecuzione non avviata (flusso già in
+esecuzione o nulla da riprendere), 5 esecuzione annullata, 6 scheduler non
+raggiungibile.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from core_logic import (setup_logging, execute_flow, run_flow_exclusive, load_run_manifest, iter_runs,
+                        load_task_stats, load_checkpoint, format_duration, format_progress, preflight_check,
+                        duration_baseline, OVERLAP_POLICIES)
+from workflow_config import load_workflows, next_fire_time
+from log_index import LogFilter, LogFollower, LogIndex, LEVELS, parse_log_time
+
+EXIT_SUCCESS = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NOT_FOUND = 3
+EXIT_NOT_STARTED = 4
+EXIT_CANCELLED = 5
+EXIT_UNAVAILABLE = 6
+
+DAY_NAMES = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
+
+
+def _load_workflows_or_exit():
+    try:
+        return load_workflows()
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Impossibile leggere la configurazione dei flussi: {e}", file=sys.stderr)
+        sys.exit(EXIT_NOT_FOUND)
+
+
+def _get_flow_or_exit(workflows, flow_name):
+    config = workflows.get(flow_name)
+    if config is None:
+        print(f"Flusso '{flow_name}' non trovato. Flussi disponibili: {', '.join(sorted(workflows)) or 'nessuno'}", file=sys.stderr)
+        sys.exit(EXIT_NOT_FOUND)
+    return config
+
+
+def _exit_code_for_run(run_id):
+    """Converte l'esito di un'esecuzione nel codice di uscita del comando."""
+    if run_id is None:
+        return EXIT_NOT_STARTED
+    manifest = load_run_manifest(run_id) or {}
+    status = manifest.get('status')
+    if status == 'success':
+        return EXIT_SUCCESS
+    if status == 'cancelled':
+        return EXIT_CANCELLED
+    return EXIT_FAILED
+
+
+def cmd_list(args):
+    workflows = _load_workflows_or_exit()
+    for flow_name in sorted(workflows):
+        config = workflows[flow_name]
+        tasks = config.get("tasks", [])
+        enabled = sum(1 for task in tasks if task.get('enabled', True))
+        days = ",".join(DAY_NAMES[d] for d in sorted(config.get("schedule_days", []))) or "-"
+        checkpoint = load_checkpoint(flow_name)
+        last_status = checkpoint.get('status', '-') if checkpoint else '-'
+        line = (f"{flow_name}\t{config.get('schedule_time', '-')}\t{days}\t"
+                f"{enabled}/{len(tasks)} task\t{config.get('overlap_policy', 'skip')}\tultima: {last_status}")
+        watch = config.get("watch")
+        if isinstance(watch, dict) and watch.get('path'):
+            line += f"\tosserva: {os.path.join(watch['path'], watch.get('pattern', '*'))}"
+        print(line)
+    return EXIT_SUCCESS
+
+
+def cmd_next(args):
+    workflows = _load_workflows_or_exit()
+    now = datetime.now()
+    upcoming = []
+    for flow_name, config in workflows.items():
+        fire_time = next_fire_time(config, now)
+        if fire_time is not None:
+            upcoming.append((fire_time, flow_name))
+
+    for fire_time, flow_name in sorted(upcoming)[:args.limit]:
+        print(f"{fire_time:%Y-%m-%d %H:%M} ({DAY_NAMES[fire_time.weekday()]})\t{flow_name}")
+    unscheduled = len(workflows) - len(upcoming)
+    if unscheduled:
+        print(f"{unscheduled} flussi senza giorni pianificati.")
+    return EXIT_SUCCESS
+
+
+def cmd_run(args):
+    workflows = _load_workflows_or_exit()
+    config = _get_flow_or_exit(workflows, args.flow)
+    tasks = config.get("tasks", [])
+    if not tasks:
+        print(f"Il flusso '{args.flow}' non ha task da eseguire.", file=sys.stderr)
+        return EXIT_NOT_FOUND
+
+    setup_logging()
+    overlap_policy = args.policy or config.get("overlap_policy", "skip")
+    run_id = run_flow_exclusive(args.flow, tasks, overlap_policy, f"{args.flow} (CLI)", resume=args.resume)
+    return _exit_code_for_run(run_id)
+
+
+def cmd_run_task(args):
+    if not os.path.exists(args.path):
+        print(f"Il file del task '{args.path}' non è stato trovato.", file=sys.stderr)
+        return EXIT_NOT_FOUND
+
+    setup_logging()
+    task_name = args.name or os.path.splitext(os.path.basename(args.path))[0]
+    run_id = execute_flow(f"Task Singolo: {task_name}", [{'name': task_name, 'path': args.path}])
+    return _exit_code_for_run(run_id)
+
+
+def cmd_check(args):
+    workflows = _load_workflows_or_exit()
+    config = _get_flow_or_exit(workflows, args.flow)
+    problems = preflight_check(args.flow, config.get("tasks", []), warm=not args.no_warm)
+    for problem in problems:
+        print(problem)
+    if problems:
+        return EXIT_FAILED
+    print(f"Flusso '{args.flow}' pronto.")
+    return EXIT_SUCCESS
+
+
+def cmd_simulate(args):
+    # Importato qui: serve solo a questo comando
+    from schedule_simulator import ScheduleSimulator, format_report
+
+    if args.config:
+        try:
+            workflows = load_workflows(args.config)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Impossibile leggere '{args.config}': {e}", file=sys.stderr)
+            return EXIT_NOT_FOUND
+    else:
+        workflows = _load_workflows_or_exit()
+
+    deadlines = {}
+    for spec in args.deadline:
+        flow_name, _, deadline = spec.rpartition('=')
+        try:
+            deadlines[flow_name] = tuple(map(int, deadline.split(':')))
+        except ValueError:
+            print(f"Scadenza non valida '{spec}': usare \"Nome Flusso=HH:MM\".", file=sys.stderr)
+            return EXIT_USAGE
+
+    start = datetime.strptime(args.start, "%Y-%m-%d") if args.start else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    simulator = ScheduleSimulator(workflows, load_task_stats(), seed=args.seed,
+                                  default_duration=args.default_duration, deadlines=deadlines)
+    report = simulator.run(start, start + timedelta(days=args.days))
+    print(format_report(report))
+    return EXIT_SUCCESS
+
+
+def cmd_stats(args):
+    stats = load_task_stats()
+    if args.flow:
+        workflows = _load_workflows_or_exit()
+        tasks = _get_flow_or_exit(workflows, args.flow).get("tasks", [])
+        rows = [(task.get('name', 'Task Senza Nome'), task.get('path', '')) for task in tasks]
+    else:
+        rows = [(os.path.basename(path), path) for path in sorted(stats)]
+
+    for task_name, task_path in rows:
+        task_stats = stats.get(task_path, {})
+        line = (f"{task_name}\tmin {format_duration(task_stats.get('min')) or '-'}\t"
+                f"max {format_duration(task_stats.get('max')) or '-'}\t"
+                f"tipico {format_duration(duration_baseline(task_stats)) or '-'}")
+        if 'slow' in task_stats:
+            line += f"\tLENTO ({task_stats['slow']['ratio']:.1f}x)"
+        print(line)
+    return EXIT_SUCCESS
+
+
+def cmd_history(args):
+    if args.limit <= 0:
+        return EXIT_SUCCESS
+    shown = 0
+    # I manifesti vengono letti uno alla volta, dal più recente, fino al limite richiesto
+    for manifest in iter_runs():
+        flow_label = manifest.get('flow', '')
+        if args.flow and manifest.get('flow_name') != args.flow:
+            continue
+        tasks = manifest.get('tasks', [])
+        # Durata reale dell'esecuzione: la somma dei task conterebbe più volte i task paralleli
+        ended = datetime.fromisoformat(manifest['ended']) if manifest.get('ended') else datetime.now()
+        duration = (ended - datetime.fromisoformat(manifest['started'])).total_seconds()
+        failed = [task.get('name') for task in tasks if task.get('status') not in ('success', None)]
+        line = (f"{manifest['run_id']}\t{flow_label}\t{manifest.get('status', '-')}\t"
+                f"{len(tasks)} task\t{format_duration(duration)}")
+        if failed and manifest.get('status') != 'success':
+            line += f"\terrore in: {failed[-1]}"
+        print(line)
+        shown += 1
+        if shown >= args.limit:
+            break
+    return EXIT_SUCCESS
+
+
+def cmd_logs(args):
+    try:
+        log_filter = LogFilter(
+            args.flow,
+            args.level,
+            parse_log_time(args.since) if args.since else None,
+            parse_log_time(args.until, end_of_period=True) if args.until else None,
+            args.grep
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return EXIT_USAGE
+
+    # Le voci più recenti che rispettano il filtro, mostrate in ordine cronologico
+    index = LogIndex()
+    index.refresh()
+    for entry in reversed(index.search(log_filter, limit=args.limit, newest_first=True)):
+        print(entry['text'])
+
+    if args.follow:
+        follower = LogFollower()
+        try:
+            while True:
+                for entry in follower.read_new():
+                    if log_filter.matches(entry):
+                        print(entry['text'], flush=True)
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return EXIT_SUCCESS
+
+
+def _call_scheduler(action_name, *args, **kwargs):
+    """
+    Esegue un'operazione dell'API di controllo (una funzione di control_api, per nome),
+    convertendo gli errori in codici di uscita.
+    """
+    # Importato qui: serve solo ai comandi che parlano con lo scheduler
+    import control_api
+
+    try:
+        return getattr(control_api, action_name)(*args, **kwargs), EXIT_SUCCESS
+    except control_api.ControlApiUnavailable as e:
+        print(e, file=sys.stderr)
+        return None, EXIT_UNAVAILABLE
+    except control_api.ControlApiError as e:
+        print(e, file=sys.stderr)
+        return None, EXIT_NOT_FOUND
+
+
+def cmd_submit(args):
+    params = {}
+    for spec in args.param:
+        key, separator, value = spec.partition('=')
+        if not separator or not key:
+            print(f"Parametro non valido '{spec}': usare NOME=VALORE.", file=sys.stderr)
+            return EXIT_USAGE
+        params[key] = value
+    request, code = _call_scheduler('enqueue_flow', args.flow, params, args.resume, args.policy, "CLI")
+    if request is not None:
+        print(f"Richiesta #{request['id']} accodata: {request['label']}")
+    return code
+
+
+def cmd_cancel(args):
+    result, code = _call_scheduler('cancel_flow', args.flow, args.task)
+    if result is not None:
+        owner = result.get('owner') or {}
+        target = "del task in corso" if args.task else "dell'esecuzione"
+        print(f"Annullamento {target} di '{owner.get('label', args.flow)}' richiesto.")
+    return code
+
+
+def cmd_pause(args):
+    result, code = _call_scheduler('pause_schedules', args.flow)
+    if result is not None:
+        print(f"Pianificazioni sospese: {', '.join(result['paused']) or 'nessuna'}")
+    return code
+
+
+def cmd_unpause(args):
+    result, code = _call_scheduler('resume_schedules', args.flow)
+    if result is not None:
+        print(f"Pianificazioni sospese: {', '.join(result['paused']) or 'nessuna'}")
+    return code
+
+
+def cmd_queue(args):
+    result, code = _call_scheduler('list_queue')
+    if result is None:
+        return code
+    for request in result['requests']:
+        params = " ".join(f"{key}={value}" for key, value in request['params'].items())
+        print(f"#{request['id']}\t{request['flow']}\t{request['state']}\t{request['submitted'][:19]}\t"
+              f"{request.get('status') or '-'}\t{request.get('run_id') or '-'}\t{params}")
+    if result['paused']:
+        print(f"Pianificazioni sospese: {', '.join(result['paused'])}")
+    for snapshot in result.get('progress', {}).values():
+        print(f"In corso: {format_progress(snapshot)}")
+    return EXIT_SUCCESS
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="flowctl", description="Esegue e ispeziona i flussi di lavoro senza GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="Elenca i flussi configurati").set_defaults(func=cmd_list)
+
+    next_parser = subparsers.add_parser("next", help="Mostra i prossimi orari di esecuzione")
+    next_parser.add_argument("--limit", type=int, default=20, help="Numero massimo di flussi mostrati")
+    next_parser.set_defaults(func=cmd_next)
+
+    run_parser = subparsers.add_parser("run", help="Esegue un flusso e attende la sua conclusione")
+    run_parser.add_argument("flow", help="Nome del flusso")
+    run_parser.add_argument("--resume", action="store_true", help="Riprende l'ultima esecuzione fallita dal task in errore")
+    run_parser.add_argument("--policy", choices=OVERLAP_POLICIES, help="Politica se il flusso è già in esecuzione")
+    run_parser.set_defaults(func=cmd_run)
+
+    task_parser = subparsers.add_parser("run-task", help="Esegue un singolo script come task")
+    task_parser.add_argument("path", help="Percorso dello script (.py, .bat, .ps1)")
+    task_parser.add_argument("--name", help="Nome del task mostrato nei log")
+    task_parser.set_defaults(func=cmd_run_task)
+
+    check_parser = subparsers.add_parser("check", help="Esegue il pre-flight di un flusso (percorsi, interpreti, sintassi)")
+    check_parser.add_argument("flow", help="Nome del flusso")
+    check_parser.add_argument("--no-warm", action="store_true", help="Solo validazione, senza controllare la sintassi e rileggere gli script")
+    check_parser.set_defaults(func=cmd_check)
+
+    simulate_parser = subparsers.add_parser("simulate", help="Simula le pianificazioni senza eseguire nulla")
+    simulate_parser.add_argument("--days", type=int, default=30, help="Giorni da simulare (predefinito 30)")
+    simulate_parser.add_argument("--start", help="Data di inizio AAAA-MM-GG (predefinito oggi)")
+    simulate_parser.add_argument("--config", help="File di configurazione alternativo (es. con un flusso in prova)")
+    simulate_parser.add_argument("--seed", type=int, help="Seme per rendere riproducibile l'estrazione delle durate")
+    simulate_parser.add_argument("--default-duration", type=float, default=60.0, help="Durata in secondi dei task senza statistiche")
+    simulate_parser.add_argument("--deadline", action="append", default=[], help="Scadenza di un flusso, es. \"Flusso=10:00\"")
+    simulate_parser.set_defaults(func=cmd_simulate)
+
+    stats_parser = subparsers.add_parser("stats", help="Mostra le statistiche di durata dei task")
+    stats_parser.add_argument("flow", nargs="?", help="Limita ai task di questo flusso")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    history_parser = subparsers.add_parser("history", help="Mostra le esecuzioni passate")
+    history_parser.add_argument("flow", nargs="?", help="Limita alle esecuzioni di questo flusso")
+    history_parser.add_argument("--limit", type=int, default=20, help="Numero massimo di esecuzioni mostrate")
+    history_parser.set_defaults(func=cmd_history)
+
+    logs_parser = subparsers.add_parser("logs", help="Cerca nel log dello scheduler (usa un indice, anche su log molto grandi)")
+    logs_parser.add_argument("flow", nargs="?", help="Limita alle voci di questo flusso")
+    logs_parser.add_argument("--level", choices=LEVELS, help="Livello minimo (es. ERROR include CRITICAL)")
+    logs_parser.add_argument("--since", help="Dall'orario AAAA-MM-GG [HH:MM] o da una durata fa (30m, 12h, 7d)")
+    logs_parser.add_argument("--until", help="Fino all'orario AAAA-MM-GG [HH:MM] o a una durata fa")
+    logs_parser.add_argument("--grep", help="Testo contenuto nella voce (senza distinzione di maiuscole)")
+    logs_parser.add_argument("--limit", type=int, default=100, help="Numero massimo di voci mostrate (le più recenti)")
+    logs_parser.add_argument("--follow", "-f", action="store_true", help="Continua a mostrare le nuove voci, come tail -f")
+    logs_parser.set_defaults(func=cmd_logs)
+
+    submit_parser = subparsers.add_parser("submit", help="Chiede allo scheduler di eseguire subito un flusso")
+    submit_parser.add_argument("flow", help="Nome del flusso")
+    submit_parser.add_argument("--param", action="append", default=[], help="Parametro NOME=VALORE passato ai task come variabile d'ambiente")
+    submit_parser.add_argument("--resume", action="store_true", help="Riprende l'ultima esecuzione fallita dal task in errore")
+    submit_parser.add_argument("--policy", choices=OVERLAP_POLICIES, help="Politica se il flusso è già in esecuzione")
+    submit_parser.set_defaults(func=cmd_submit)
+
+    cancel_parser = subparsers.add_parser("cancel", help="Annulla l'esecuzione in corso di un flusso")
+    cancel_parser.add_argument("flow", help="Nome del flusso")
+    cancel_parser.add_argument("--task", action="store_true", help="Termina solo il task in corso; il flusso prosegue")
+    cancel_parser.set_defaults(func=cmd_cancel)
+
+    pause_parser = subparsers.add_parser("pause", help="Sospende le pianificazioni (tutte o di un flusso)")
+    pause_parser.add_argument("flow", nargs="?", help="Nome del flusso (predefinito: tutti)")
+    pause_parser.set_defaults(func=cmd_pause)
+
+    unpause_parser = subparsers.add_parser("unpause", help="Riattiva le pianificazioni (tutte o di un flusso)")
+    unpause_parser.add_argument("flow", nargs="?", help="Nome del flusso (predefinito: tutti)")
+    unpause_parser.set_defaults(func=cmd_unpause)
+
+    subparsers.add_parser("queue", help="Mostra le richieste di esecuzione dello scheduler").set_defaults(func=cmd_queue)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,13 +8,48 @@ import threading
 import queue
 import logging
 from datetime import datetime, timedelta
-from core_logic import setup_logging, execute_flow
+from locking import FlowLock, parse_resources
+from control_api import ControlApiError, ControlApiUnavailable, enqueue_flow, cancel_flow
+from workflow_config import load_workflows
+from log_index import LogFilter, LogFollower, LogIndex, LEVELS as LOG_LEVELS, parse_log_time
+from core_logic import (setup_logging, execute_flow, run_flow_exclusive, list_runs, artifact_path, ArtifactPager,
+                        load_checkpoint, is_resumable, format_duration, parse_matrix,
+                        duration_baseline, live_progress, format_progress, runs_in_window, run_timeline)
 
 CONFIG_DIR = "config"
 CONFIG_FILE = os.path.join(CONFIG_DIR, "workflows.json")
 STATUS_FILE = os.path.join(CONFIG_DIR, "scheduler_status.json")
 STATS_FILE = os.path.join(CONFIG_DIR, "task_stats.json")
 
+# Esecuzioni più recenti elencate nel browser degli output e nella timeline
+RECENT_RUNS_LIMIT = 200
+
+# Colori delle barre della timeline per stato del task
+TIMELINE_STATUS_COLORS = {
+    'success': "#4caf50",
+    'failed': "#e53935",
+    'cancelled': "#9e9e9e",
+    'skipped': "#ffb300"
+}
+TIMELINE_QUEUE_COLOR = "#cfd8dc"
+
+# Colori delle voci del browser del log per livello
+LOG_LEVEL_COLORS = {
+    'WARNING': "#e65100",
+    'ERROR': "#c62828",
+    'CRITICAL': "#b71c1c"
+}
+# Righe conservate al più nel browser del log e intervallo di aggiornamento in modalità "segui"
+LOG_BROWSER_MAX_LINES = 5000
+LOG_FOLLOW_INTERVAL_MS = 1000
+
+# Etichette delle politiche di sovrapposizione mostrate nella GUI
+OVERLAP_POLICY_LABELS = {
+    'skip': "Ignora la nuova attivazione",
+    'queue': "Accoda un'esecuzione",
+    'replace': "Annulla e sostituisci"
+}
+
 
 class QueueHandler(logging.Handler):
     """Classe per inviare i record di logging a una coda."""
@@ -58,19 +93,6 @@ def _parse_task_path_from_xml(filepath):
     raise ValueError("Nessun percorso di script supportato (.py, .bat, .ps1) trovato in <Arguments> o <Command>.")
 
 
-def format_duration(seconds):
-    """Converte una durata in secondi in una stringa formattata HH:MM:SS.ss."""
-    if seconds is None:
-        return ""
-    try:
-        seconds = float(seconds)
-        hours, remainder = divmod(seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return f"{int(hours):02}:{int(minutes):02}:{seconds:05.2f}"
-    except (ValueError, TypeError):
-        return "Invalido"
-
-
 class WorkflowConfiguratorApp:
     def __init__(self, root):
         self.root = root
@@ -101,8 +123,7 @@ class WorkflowConfiguratorApp:
 
     def load_workflows(self):
         try:
-            with open(CONFIG_FILE, 'r') as f:
-                self.workflows = json.load(f)
+            self.workflows = load_workflows()
         except (FileNotFoundError, json.JSONDecodeError):
             self.workflows = {}
 
@@ -167,19 +188,23 @@ class WorkflowConfiguratorApp:
 
         self.tasks_tree = ttk.Treeview(
             tasks_frame,
-            columns=("task_name", "min_time", "max_time"),
+            columns=("task_name", "min_time", "max_time", "typical_time"),
             show="headings"
         )
         self.tasks_tree.heading("task_name", text="Task")
         self.tasks_tree.heading("min_time", text="Tempo Min")
         self.tasks_tree.heading("max_time", text="Tempo Max")
+        self.tasks_tree.heading("typical_time", text="Tempo Tipico")
 
         self.tasks_tree.column("task_name", width=400)
         self.tasks_tree.column("min_time", width=100, anchor=tk.E)
         self.tasks_tree.column("max_time", width=100, anchor=tk.E)
+        self.tasks_tree.column("typical_time", width=100, anchor=tk.E)
 
         # Configura i tag per lo stile dei task disabilitati
         self.tasks_tree.tag_configure('disabled', foreground='gray', font=('Arial', 10, 'overstrike'))
+        # Task la cui ultima esecuzione è stata molto più lenta del solito
+        self.tasks_tree.tag_configure('slow', foreground='dark orange', background='#fff3e0')
 
         self.tasks_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.tasks_tree.bind("<Double-1>", self.edit_selected_task)
@@ -194,6 +219,7 @@ class WorkflowConfiguratorApp:
         # Separatore e nuovo pulsante per abilitare/disabilitare
         ttk.Separator(task_buttons_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=5)
         ttk.Button(task_buttons_frame, text="Abilita/Disabilita Task", command=self.toggle_task_enabled).pack(fill=tk.X, pady=2)
+        ttk.Button(task_buttons_frame, text="Pipe verso Successivo", command=self.toggle_task_pipe).pack(fill=tk.X, pady=2)
         ttk.Separator(task_buttons_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=5)
 
         ttk.Button(task_buttons_frame, text="Sposta Su", command=self.move_task_up).pack(fill=tk.X, pady=2)
@@ -216,6 +242,17 @@ class WorkflowConfiguratorApp:
         days = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
         for i, day in enumerate(days):
             ttk.Checkbutton(days_frame, text=day, variable=self.day_vars[i], command=self.save_workflows).pack(side=tk.LEFT)
+        overlap_frame = ttk.Frame(schedule_frame)
+        overlap_frame.pack(pady=5)
+        ttk.Label(overlap_frame, text="Se già in esecuzione:").pack(side=tk.LEFT, padx=5)
+        self.overlap_policy_var = tk.StringVar(value=OVERLAP_POLICY_LABELS['skip'])
+        overlap_combobox = ttk.Combobox(overlap_frame, textvariable=self.overlap_policy_var, state="readonly",
+                                        values=list(OVERLAP_POLICY_LABELS.values()), width=30)
+        overlap_combobox.pack(side=tk.LEFT)
+        overlap_combobox.bind("<<ComboboxSelected>>", lambda e: self.save_workflows())
+        ttk.Label(overlap_frame, text="Pre-flight (minuti prima, 0 = no):").pack(side=tk.LEFT, padx=(15, 5))
+        self.warmup_spinbox = ttk.Spinbox(overlap_frame, from_=0, to=240, width=5, command=self.save_workflows)
+        self.warmup_spinbox.pack(side=tk.LEFT)
 
         action_frame = ttk.Frame(right_pane)
         action_frame.pack(fill=tk.X, pady=10)
@@ -223,13 +260,27 @@ class WorkflowConfiguratorApp:
         run_now_button = ttk.Button(action_frame, text="Esegui Flusso", command=self.run_workflow_now)
         run_now_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
 
+        resume_button = ttk.Button(action_frame, text="Riprendi da Errore", command=self.resume_workflow_from_failure)
+        resume_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
+
+        cancel_button = ttk.Button(action_frame, text="Annulla Esecuzione", command=self.cancel_running_flow)
+        cancel_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
+
         run_selected_button = ttk.Button(action_frame, text="Esegui Task Selezionato", command=self.run_selected_task)
         run_selected_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
 
+        run_output_button = ttk.Button(action_frame, text="Output Esecuzioni...", command=self.show_run_output_browser)
+        run_output_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
+
+        timeline_button = ttk.Button(action_frame, text="Timeline...", command=self.show_run_timeline)
+        timeline_button.pack(side=tk.LEFT, expand=True, fill=tk.X)
+
         # --- Area Log ---
         log_frame = ttk.LabelFrame(self.root, text="Log di Esecuzione", padding="10")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
 
+        ttk.Button(log_frame, text="Cerca nel Log Completo...", command=self.show_log_browser).pack(anchor=tk.E, pady=(0, 5))
+
         self.log_widget = scrolledtext.ScrolledText(log_frame, state='disabled', wrap=tk.WORD, height=10)
         self.log_widget.pack(fill=tk.BOTH, expand=True)
 
@@ -238,6 +289,7 @@ class WorkflowConfiguratorApp:
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
     def update_status_bar(self):
+        progress = {}
         try:
             with open(STATUS_FILE, 'r') as f:
                 status_data = json.load(f)
@@ -252,14 +304,38 @@ class WorkflowConfiguratorApp:
                 if running_flows:
                     status_text = f"Stato Scheduler: IN ESECUZIONE ({len(running_flows)} flussi attivi: {', '.join(running_flows)})"
                     status_color = "blue"
+                    progress.update(status_data.get('progress', {}))
                 else:
                     status_text = "Stato Scheduler: IN ESECUZIONE (in attesa)"
                     status_color = "green"
 
+                # Segnala i flussi il cui ultimo pre-flight ha trovato problemi
+                failed_warmups = [name for name, result in status_data.get('warmup', {}).items() if result.get('problems')]
+                if failed_warmups:
+                    status_text += f" | PRE-FLIGHT con problemi: {', '.join(failed_warmups)} (vedi log)"
+                    status_color = "dark orange"
+
+                paused = status_data.get('paused', [])
+                if paused:
+                    paused_names = "tutti i flussi" if '*' in paused else ", ".join(paused)
+                    status_text += f" | PIANIFICAZIONI SOSPESE: {paused_names}"
+
+                # Segnala i task la cui ultima esecuzione è stata anomala per durata
+                slow_tasks = status_data.get('slow_tasks', {})
+                if slow_tasks:
+                    slow_names = [os.path.basename(task_path) for task_path in slow_tasks]
+                    status_text += f" | TASK LENTI: {', '.join(slow_names)}"
+                    status_color = "dark orange"
+
         except (FileNotFoundError, json.JSONDecodeError):
             status_text = "Stato Scheduler: FERMATO"
             status_color = "red"
 
+        # Avanzamento e fine prevista dei flussi in corso, nello scheduler o in questo processo
+        progress.update(live_progress())
+        if progress:
+            status_text += " | " + "; ".join(format_progress(snapshot) for snapshot in progress.values())
+
         self.status_bar.config(text=status_text, foreground=status_color)
 
         # Ripianifica il controllo
@@ -296,16 +372,18 @@ class WorkflowConfiguratorApp:
 
         for task in self.current_tasks:
             task_path = task.get('path', '')
-            task_name = task.get('name', 'Task Senza Nome')
 
             stats = self.task_stats.get(task_path, {})
             min_t = format_duration(stats.get('min'))
             max_t = format_duration(stats.get('max'))
+            typical_t = format_duration(duration_baseline(stats))
 
             # Applica il tag 'disabled' se il task non è abilitato
             tags = () if task.get('enabled', True) else ('disabled',)
+            if 'slow' in stats:
+                tags += ('slow',)
 
-            self.tasks_tree.insert("", tk.END, values=(task_name, min_t, max_t), tags=tags)
+            self.tasks_tree.insert("", tk.END, values=(self._task_display_name(task), min_t, max_t, typical_t), tags=tags)
 
         hour, minute = map(int, flow_data.get("schedule_time", "00:00").split(':'))
         self.hour_spinbox.set(f"{hour:02}")
@@ -313,18 +391,39 @@ class WorkflowConfiguratorApp:
         selected_days = flow_data.get("schedule_days", [])
         for i in range(7):
             self.day_vars[i].set(i in selected_days)
+        policy = flow_data.get("overlap_policy", "skip")
+        self.overlap_policy_var.set(OVERLAP_POLICY_LABELS.get(policy, OVERLAP_POLICY_LABELS['skip']))
+        self.warmup_spinbox.set(flow_data.get("warmup_minutes", 0))
+
+    def _task_display_name(self, task):
+        """Nome del task nella lista, con l'indicazione di modalità pipe e matrice."""
+        display_name = task.get('name', 'Task Senza Nome')
+        # Evidenzia i task il cui output viene passato al task successivo
+        if task.get('pipe_to_next', False):
+            display_name += "  | pipe"
+        if isinstance(task.get('matrix'), list):
+            display_name += f"  [matrice: {len(task['matrix'])}]"
+        return display_name
 
     def update_workflow_from_ui(self, flow_name):
         if flow_name not in self.workflows: return
         new_flow_name = self.flow_name_entry.get().strip()
         if not new_flow_name: return
 
-        # Salva la lista di dizionari, non solo i nomi
-        current_data = {
+        policy_by_label = {label: policy for policy, label in OVERLAP_POLICY_LABELS.items()}
+
+        # Salva la lista di dizionari, non solo i nomi. Le chiavi non gestite dalla GUI vengono preservate.
+        current_data = dict(self.workflows[flow_name])
+        current_data.update({
             "tasks": self.current_tasks,
             "schedule_time": f"{int(self.hour_spinbox.get()):02}:{int(self.minute_spinbox.get()):02}",
-            "schedule_days": [i for i, var in enumerate(self.day_vars) if var.get()]
-        }
+            "schedule_days": [i for i, var in enumerate(self.day_vars) if var.get()],
+            "overlap_policy": policy_by_label.get(self.overlap_policy_var.get(), 'skip')
+        })
+        try:
+            current_data["warmup_minutes"] = max(0, int(self.warmup_spinbox.get()))
+        except ValueError:
+            pass
         if new_flow_name != flow_name:
             self.workflows[new_flow_name] = current_data
             del self.workflows[flow_name]
@@ -340,6 +439,8 @@ class WorkflowConfiguratorApp:
         self.hour_spinbox.set("00")
         self.minute_spinbox.set("00")
         for var in self.day_vars: var.set(False)
+        self.overlap_policy_var.set(OVERLAP_POLICY_LABELS['skip'])
+        self.warmup_spinbox.set(0)
 
     def add_new_workflow(self):
         i = 1
@@ -379,14 +480,97 @@ class WorkflowConfiguratorApp:
         self.log_widget.delete('1.0', tk.END)
         self.log_widget.configure(state='disabled')
 
-        # Esegui in un thread per non bloccare la GUI
+        # Se lo scheduler è attivo il flusso viene eseguito da lui, come le esecuzioni pianificate
+        if self._submit_to_scheduler(flow_name):
+            return
+
+        # Altrimenti esegui in un thread per non bloccare la GUI. Il lock tra processi
+        # evita che il flusso si sovrapponga a un'esecuzione dello scheduler.
+        overlap_policy = self.workflows.get(flow_name, {}).get("overlap_policy", "skip")
         execution_thread = threading.Thread(
-            target=execute_flow,
-            args=(f"{flow_name} (Manuale)", tasks)
+            target=run_flow_exclusive,
+            args=(flow_name, tasks, overlap_policy, f"{flow_name} (Manuale)")
         )
         execution_thread.daemon = True # Permette all'app di chiudersi anche se il thread è in esecuzione
         execution_thread.start()
 
+    def resume_workflow_from_failure(self):
+        """Riprende l'ultima esecuzione fallita del flusso selezionato dal task in errore."""
+        if not self.selected_workflow_name:
+            messagebox.showwarning("Azione non permessa", "Seleziona un flusso di lavoro da riprendere.")
+            return
+
+        flow_name = self.selected_workflow_name
+        checkpoint = load_checkpoint(flow_name)
+        if not is_resumable(checkpoint):
+            messagebox.showinfo("Informazione", f"Il flusso '{flow_name}' non ha esecuzioni fallite da riprendere.")
+            return
+
+        next_index = checkpoint.get('next_index', 0)
+        if not messagebox.askyesno(
+            "Conferma",
+            f"Riprendere l'esecuzione {checkpoint['run_id']} del flusso '{flow_name}' "
+            f"dal task {next_index + 1} di {checkpoint.get('task_count', '?')}?"
+        ):
+            return
+
+        self.log_widget.configure(state='normal')
+        self.log_widget.delete('1.0', tk.END)
+        self.log_widget.configure(state='disabled')
+
+        if self._submit_to_scheduler(flow_name, resume=True):
+            return
+
+        overlap_policy = self.workflows.get(flow_name, {}).get("overlap_policy", "skip")
+        execution_thread = threading.Thread(
+            target=run_flow_exclusive,
+            args=(flow_name, self.current_tasks, overlap_policy, f"{flow_name} (Ripresa)"),
+            kwargs={'resume': True}
+        )
+        execution_thread.daemon = True
+        execution_thread.start()
+
+    def _submit_to_scheduler(self, flow_name, resume=False):
+        """
+        Affida l'esecuzione del flusso allo scheduler tramite l'API di controllo.
+        Restituisce False se lo scheduler non è raggiungibile e il flusso va eseguito qui.
+        """
+        try:
+            request = enqueue_flow(flow_name, resume=resume, source="Ripresa" if resume else "Manuale")
+        except ControlApiUnavailable:
+            logging.info(f"Scheduler non raggiungibile: il flusso '{flow_name}' viene eseguito dal configuratore.")
+            return False
+        except ControlApiError as e:
+            messagebox.showerror("Errore", f"Lo scheduler ha rifiutato l'esecuzione del flusso '{flow_name}': {e}")
+            return True
+        logging.info(f"Flusso '{flow_name}' affidato allo scheduler (richiesta #{request['id']}). "
+                     f"L'avanzamento è nel log dello scheduler e in 'Output Esecuzioni...'.")
+        return True
+
+    def cancel_running_flow(self):
+        """Annulla l'esecuzione in corso del flusso selezionato, ovunque sia stata avviata."""
+        if not self.selected_workflow_name:
+            messagebox.showwarning("Azione non permessa", "Seleziona il flusso da annullare.")
+            return
+
+        flow_name = self.selected_workflow_name
+        if not messagebox.askyesno("Conferma", f"Annullare l'esecuzione in corso del flusso '{flow_name}'?"):
+            return
+
+        try:
+            cancel_flow(flow_name)
+            requested = True
+        except ControlApiUnavailable:
+            # Senza scheduler la richiesta si deposita direttamente presso il detentore del lock
+            requested = FlowLock(flow_name).request_cancel()
+        except ControlApiError:
+            requested = False
+
+        if requested:
+            logging.warning(f"Richiesto l'annullamento del flusso '{flow_name}'.")
+        else:
+            messagebox.showinfo("Informazione", f"Il flusso '{flow_name}' non è in esecuzione.")
+
     def run_selected_task(self):
         """Esegue solo il task attualmente selezionato nella Treeview."""
         selected_items = self.tasks_tree.selection()
@@ -415,6 +599,446 @@ class WorkflowConfiguratorApp:
         execution_thread.daemon = True
         execution_thread.start()
 
+    def show_run_output_browser(self):
+        """
+        Apre una finestra per consultare l'output salvato delle esecuzioni passate.
+        Gli artefatti compressi vengono letti una pagina alla volta.
+        """
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Output delle Esecuzioni")
+        dialog.geometry("1000x600")
+        dialog.transient(self.root)
+
+        paned = ttk.PanedWindow(dialog, orient=tk.HORIZONTAL)
+        paned.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        lists_frame = ttk.Frame(paned)
+        paned.add(lists_frame, weight=1)
+
+        runs_tree = ttk.Treeview(lists_frame, columns=("run_id", "flow", "status"), show="headings", height=12)
+        runs_tree.heading("run_id", text="Esecuzione")
+        runs_tree.heading("flow", text="Flusso")
+        runs_tree.heading("status", text="Stato")
+        runs_tree.column("run_id", width=160)
+        runs_tree.column("flow", width=140)
+        runs_tree.column("status", width=70)
+        runs_tree.pack(fill=tk.BOTH, expand=True)
+
+        tasks_tree = ttk.Treeview(lists_frame, columns=("task", "status", "lines"), show="headings", height=10)
+        tasks_tree.heading("task", text="Task")
+        tasks_tree.heading("status", text="Stato")
+        tasks_tree.heading("lines", text="Righe")
+        tasks_tree.column("task", width=230)
+        tasks_tree.column("status", width=70)
+        tasks_tree.column("lines", width=70, anchor=tk.E)
+        tasks_tree.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
+
+        output_frame = ttk.Frame(paned)
+        paned.add(output_frame, weight=2)
+
+        nav_frame = ttk.Frame(output_frame)
+        nav_frame.pack(fill=tk.X)
+        stream_var = tk.StringVar(value='stdout')
+        page_label = ttk.Label(nav_frame, text="")
+        output_text = scrolledtext.ScrolledText(output_frame, state='disabled', wrap=tk.NONE)
+        output_text.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
+
+        runs = list_runs(limit=RECENT_RUNS_LIMIT)
+        state = {'pager': None, 'page': 0, 'has_next': False, 'run': None, 'task': None}
+        for index, run in enumerate(runs):
+            runs_tree.insert("", tk.END, iid=str(index), values=(run['run_id'], run.get('flow', ''), run.get('status', '')))
+
+        def close_pager():
+            if state['pager'] is not None:
+                state['pager'].close()
+                state['pager'] = None
+
+        def show_page(page):
+            pager = state['pager']
+            output_text.configure(state='normal')
+            output_text.delete('1.0', tk.END)
+            if pager is None:
+                page_label.config(text="")
+            else:
+                lines, has_next = pager.read_page(page)
+                state['page'] = page
+                state['has_next'] = has_next
+                output_text.insert(tk.END, "\n".join(lines))
+                page_label.config(text=f"Pagina {page + 1}{'' if has_next else ' (ultima)'}")
+            output_text.configure(state='disabled')
+
+        def open_artifact(*_):
+            close_pager()
+            task = state['task']
+            if task is not None and task.get(stream_var.get()):
+                path = artifact_path(state['run']['run_id'], task[stream_var.get()])
+                try:
+                    state['pager'] = ArtifactPager(path)
+                except OSError as e:
+                    logging.error(f"Impossibile aprire l'output '{path}': {e}")
+            show_page(0)
+
+        def on_run_select(event):
+            selection = runs_tree.selection()
+            if not selection: return
+            state['run'] = runs[int(selection[0])]
+            state['task'] = None
+            for item in tasks_tree.get_children():
+                tasks_tree.delete(item)
+            for index, task in enumerate(state['run'].get('tasks', [])):
+                lines = task.get(f"{stream_var.get()}_lines", "")
+                tasks_tree.insert("", tk.END, iid=str(index), values=(task.get('name', ''), task.get('status', ''), lines))
+            open_artifact()
+
+        def on_task_select(event):
+            selection = tasks_tree.selection()
+            if not selection or state['run'] is None: return
+            state['task'] = state['run']['tasks'][int(selection[0])]
+            open_artifact()
+
+        def on_close():
+            close_pager()
+            dialog.destroy()
+
+        ttk.Radiobutton(nav_frame, text="Output standard", variable=stream_var, value='stdout', command=open_artifact).pack(side=tk.LEFT)
+        ttk.Radiobutton(nav_frame, text="Errore standard", variable=stream_var, value='stderr', command=open_artifact).pack(side=tk.LEFT, padx=(5, 15))
+        ttk.Button(nav_frame, text="<< Precedente", command=lambda: show_page(max(0, state['page'] - 1))).pack(side=tk.LEFT)
+        ttk.Button(nav_frame, text="Successiva >>", command=lambda: state['has_next'] and show_page(state['page'] + 1)).pack(side=tk.LEFT, padx=5)
+        page_label.pack(side=tk.LEFT, padx=10)
+
+        runs_tree.bind("<<TreeviewSelect>>", on_run_select)
+        tasks_tree.bind("<<TreeviewSelect>>", on_task_select)
+        dialog.protocol("WM_DELETE_WINDOW", on_close)
+        dialog.bind("<Escape>", lambda e: on_close())
+
+    def show_run_timeline(self):
+        """
+        Apre una vista a timeline (diagramma di Gantt) di un'esecuzione o di tutte le
+        esecuzioni in una finestra temporale: una barra per task con attesa delle
+        risorse, durata e stato. Le barre sono semplici elementi di un Canvas, quindi
+        anche esecuzioni con centinaia di task vengono disegnate rapidamente.
+        """
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Timeline delle Esecuzioni")
+        dialog.geometry("1200x650")
+        dialog.transient(self.root)
+
+        label_width = 280
+        row_height = 20
+        axis_height = 24
+
+        controls = ttk.Frame(dialog)
+        controls.pack(fill=tk.X, padx=10, pady=(10, 5))
+        mode_var = tk.StringVar(value='run')
+        runs = list_runs(limit=RECENT_RUNS_LIMIT)
+        run_choices = [f"{run['run_id']}  {run.get('flow', '')}  [{run.get('status', '')}]" for run in runs]
+        run_var = tk.StringVar(value=run_choices[0] if run_choices else "")
+        hours_var = tk.StringVar(value="24")
+
+        ttk.Radiobutton(controls, text="Esecuzione:", variable=mode_var, value='run', command=lambda: redraw(fit=True)).pack(side=tk.LEFT)
+        run_combobox = ttk.Combobox(controls, textvariable=run_var, values=run_choices, state="readonly", width=60)
+        run_combobox.pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Radiobutton(controls, text="Tutti i flussi, ultime ore:", variable=mode_var, value='window', command=lambda: redraw(fit=True)).pack(side=tk.LEFT)
+        ttk.Spinbox(controls, from_=1, to=24 * 31, width=5, textvariable=hours_var, command=lambda: redraw(fit=True)).pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Button(controls, text="Zoom +", command=lambda: zoom(2.0)).pack(side=tk.LEFT)
+        ttk.Button(controls, text="Zoom -", command=lambda: zoom(0.5)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Adatta", command=lambda: redraw(fit=True)).pack(side=tk.LEFT)
+
+        info_label = ttk.Label(dialog, text="Passa il mouse su una barra per i dettagli.", anchor=tk.W)
+        info_label.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 10))
+
+        grid = ttk.Frame(dialog)
+        grid.pack(fill=tk.BOTH, expand=True, padx=10)
+        grid.rowconfigure(1, weight=1)
+        grid.columnconfigure(1, weight=1)
+        # Etichette e asse dei tempi sono canvas separati, così restano visibili durante lo scorrimento
+        axis_canvas = tk.Canvas(grid, height=axis_height, background="white", highlightthickness=0)
+        labels_canvas = tk.Canvas(grid, width=label_width, background="white", highlightthickness=0)
+        chart_canvas = tk.Canvas(grid, background="white", highlightthickness=0)
+        y_scroll = ttk.Scrollbar(grid, orient=tk.VERTICAL)
+        x_scroll = ttk.Scrollbar(grid, orient=tk.HORIZONTAL)
+        axis_canvas.grid(row=0, column=1, sticky="ew")
+        labels_canvas.grid(row=1, column=0, sticky="ns")
+        chart_canvas.grid(row=1, column=1, sticky="nsew")
+        y_scroll.grid(row=1, column=2, sticky="ns")
+        x_scroll.grid(row=2, column=1, sticky="ew")
+
+        def scroll_y(*args):
+            chart_canvas.yview(*args)
+            labels_canvas.yview(*args)
+
+        def scroll_x(*args):
+            chart_canvas.xview(*args)
+            axis_canvas.xview(*args)
+
+        def on_mousewheel(event):
+            scroll_y("scroll", -1 if (event.num == 4 or event.delta > 0) else 1, "units")
+
+        y_scroll.config(command=scroll_y)
+        x_scroll.config(command=scroll_x)
+        chart_canvas.config(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set, yscrollincrement=row_height)
+        labels_canvas.config(yscrollincrement=row_height)
+        for canvas in (chart_canvas, labels_canvas):
+            canvas.bind("<MouseWheel>", on_mousewheel)
+            canvas.bind("<Button-4>", on_mousewheel)
+            canvas.bind("<Button-5>", on_mousewheel)
+
+        state = {'bars': [], 'scale': None, 'items': {}}
+
+        def load_bars():
+            if mode_var.get() == 'run':
+                if not run_var.get():
+                    return []
+                return run_timeline([runs[run_choices.index(run_var.get())]])
+            try:
+                hours = max(1, int(hours_var.get()))
+            except ValueError:
+                hours = 24
+            end = datetime.now()
+            return run_timeline(runs_in_window(end - timedelta(hours=hours), end))
+
+        def tick_seconds(scale):
+            # Il passo delle tacche più piccolo che lascia almeno 80 pixel tra due etichette
+            for step in (1, 5, 10, 30, 60, 300, 600, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400):
+                if step * scale >= 80:
+                    return step
+            return 7 * 86400
+
+        def redraw(fit=False):
+            if fit:
+                state['bars'] = load_bars()
+            bars = state['bars']
+            for canvas in (axis_canvas, labels_canvas, chart_canvas):
+                canvas.delete("all")
+            state['items'] = {}
+            if not bars:
+                info_label.config(text="Nessun task con tempi registrati nel periodo o nell'esecuzione scelta.")
+                return
+
+            origin = min(bar['queue_start'] for bar in bars)
+            span = max((max(bar['end'] for bar in bars) - origin).total_seconds(), 1)
+            if fit or state['scale'] is None:
+                state['scale'] = max(chart_canvas.winfo_width() - 20, 400) / span
+            scale = state['scale']
+            width = span * scale + 20
+            height = len(bars) * row_height
+            window_mode = mode_var.get() == 'window'
+
+            # Tacche dell'asse allineate a multipli del passo (es. ogni 5 minuti esatti)
+            step = tick_seconds(scale)
+            offset = (origin - datetime.min).total_seconds() % step
+            tick = origin + timedelta(seconds=(step - offset) % step)
+            while (tick - origin).total_seconds() <= span:
+                x = (tick - origin).total_seconds() * scale
+                label = f"{tick:%d/%m %H:%M}" if step >= 3600 else f"{tick:%H:%M:%S}"
+                axis_canvas.create_line(x, axis_height - 6, x, axis_height, fill="gray")
+                axis_canvas.create_text(x + 2, 2, text=label, anchor=tk.NW, font=("Arial", 8))
+                chart_canvas.create_line(x, 0, x, height, fill="#eeeeee")
+                tick += timedelta(seconds=step)
+
+            for row, bar in enumerate(bars):
+                y = row * row_height
+                label = f"{bar['flow']}: {bar['task']}" if window_mode else bar['task']
+                labels_canvas.create_text(5, y + row_height / 2, text=label, anchor=tk.W, font=("Arial", 9))
+                queue_x = (bar['queue_start'] - origin).total_seconds() * scale
+                start_x = (bar['start'] - origin).total_seconds() * scale
+                end_x = max((bar['end'] - origin).total_seconds() * scale, start_x + 1)
+                if start_x - queue_x >= 1:
+                    chart_canvas.create_rectangle(queue_x, y + 6, start_x, y + row_height - 6,
+                                                  fill=TIMELINE_QUEUE_COLOR, outline="", tags=("bar",))
+                item = chart_canvas.create_rectangle(start_x, y + 3, end_x, y + row_height - 3,
+                                                     fill=TIMELINE_STATUS_COLORS.get(bar['status'], "#1e88e5"),
+                                                     outline="", tags=("bar",))
+                state['items'][item] = bar
+
+            for canvas, region in ((axis_canvas, (0, 0, width, axis_height)),
+                                   (labels_canvas, (0, 0, label_width, height)),
+                                   (chart_canvas, (0, 0, width, height))):
+                canvas.config(scrollregion=region)
+            total = (max(bar['end'] for bar in bars) - origin).total_seconds()
+            info_label.config(text=f"{len(bars)} task, dal {origin:%d/%m %H:%M:%S} per {format_duration(total)}. "
+                                   f"Grigio chiaro: attesa delle risorse.")
+
+        def zoom(factor):
+            if state['scale'] is not None:
+                state['scale'] *= factor
+                redraw()
+
+        def on_bar_enter(event):
+            current = chart_canvas.find_withtag("current")
+            bar = state['items'].get(current[0]) if current else None
+            if bar is None:
+                return
+            queue_wait = (bar['start'] - bar['queue_start']).total_seconds()
+            attempt = f", tentativo {bar['attempt']}" if bar['attempt'] else ""
+            info_label.config(text=f"{bar['flow']} / {bar['task']} ({bar['run_id']}{attempt}): {bar['status']}, "
+                                   f"inizio {bar['start']:%H:%M:%S}, durata {format_duration((bar['end'] - bar['start']).total_seconds())}, "
+                                   f"attesa risorse {format_duration(queue_wait)}")
+
+        chart_canvas.tag_bind("bar", "<Enter>", on_bar_enter)
+        run_combobox.bind("<<ComboboxSelected>>", lambda e: (mode_var.set('run'), redraw(fit=True)))
+        dialog.bind("<Escape>", lambda e: dialog.destroy())
+        # Il primo disegno attende che il canvas abbia le sue dimensioni reali
+        dialog.after(50, lambda: redraw(fit=True))
+
+    def show_log_browser(self):
+        """
+        Apre una finestra per cercare nel log completo dello scheduler (per flusso,
+        livello, intervallo di orari e testo) e seguirne le nuove voci. La ricerca usa
+        l'indice del log e la finestra conserva al più LOG_BROWSER_MAX_LINES righe,
+        così resta reattiva anche con log di gigabyte.
+        """
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Log dello Scheduler")
+        dialog.geometry("1150x650")
+        dialog.transient(self.root)
+
+        filters = ttk.Frame(dialog)
+        filters.pack(fill=tk.X, padx=10, pady=(10, 0))
+        flow_var = tk.StringVar()
+        level_var = tk.StringVar(value="Tutti")
+        since_var = tk.StringVar(value=(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M"))
+        until_var = tk.StringVar()
+        text_var = tk.StringVar()
+        follow_var = tk.BooleanVar(value=False)
+
+        ttk.Label(filters, text="Flusso:").pack(side=tk.LEFT)
+        flow_combo = ttk.Combobox(filters, textvariable=flow_var, values=[""] + sorted(self.workflows), width=22)
+        flow_combo.pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(filters, text="Livello minimo:").pack(side=tk.LEFT)
+        ttk.Combobox(filters, textvariable=level_var, values=["Tutti"] + list(LOG_LEVELS), state="readonly", width=10).pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(filters, text="Dal:").pack(side=tk.LEFT)
+        ttk.Entry(filters, textvariable=since_var, width=17).pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(filters, text="Al:").pack(side=tk.LEFT)
+        ttk.Entry(filters, textvariable=until_var, width=17).pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(filters, text="Testo:").pack(side=tk.LEFT)
+        ttk.Entry(filters, textvariable=text_var, width=20).pack(side=tk.LEFT, padx=(2, 10))
+
+        actions = ttk.Frame(dialog)
+        actions.pack(fill=tk.X, padx=10, pady=5)
+        search_button = ttk.Button(actions, text="Cerca", command=lambda: start_search())
+        search_button.pack(side=tk.LEFT)
+        for label, delta in (("Ultima ora", timedelta(hours=1)), ("Oggi", None), ("Ultimi 7 giorni", timedelta(days=7))):
+            ttk.Button(actions, text=label, command=lambda delta=delta: set_range(delta)).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Checkbutton(actions, text="Segui le nuove voci", variable=follow_var, command=lambda: toggle_follow()).pack(side=tk.LEFT, padx=15)
+        status_label = ttk.Label(actions, text="Orari nel formato AAAA-MM-GG HH:MM (o 30m, 12h, 7d); 'Al' vuoto = adesso.")
+        status_label.pack(side=tk.LEFT, padx=10)
+
+        log_text = scrolledtext.ScrolledText(dialog, state='disabled', wrap=tk.NONE)
+        log_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        for level, color in LOG_LEVEL_COLORS.items():
+            log_text.tag_configure(level, foreground=color)
+
+        state = {'index': LogIndex(), 'filter': None, 'follower': None, 'results': None, 'searching': False, 'closed': False}
+
+        def set_range(delta):
+            now = datetime.now()
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0) if delta is None else now - delta
+            since_var.set(start.strftime("%Y-%m-%d %H:%M"))
+            until_var.set("")
+            start_search()
+
+        def build_filter():
+            since = since_var.get().strip()
+            until = until_var.get().strip()
+            return LogFilter(
+                flow_var.get().strip() or None,
+                None if level_var.get() == "Tutti" else level_var.get(),
+                parse_log_time(since) if since else None,
+                parse_log_time(until, end_of_period=True) if until else None,
+                text_var.get()
+            )
+
+        def show_entries(entries, clear=False):
+            log_text.configure(state='normal')
+            if clear:
+                log_text.delete('1.0', tk.END)
+            for entry in entries:
+                log_text.insert(tk.END, entry['text'] + "\n", entry['level'] or "")
+            # Si scartano le righe più vecchie: la memoria usata resta costante
+            excess = int(log_text.index('end-1c').split('.')[0]) - 1 - LOG_BROWSER_MAX_LINES
+            if excess > 0:
+                log_text.delete('1.0', f"{excess + 1}.0")
+            log_text.configure(state='disabled')
+            log_text.yview(tk.END)
+
+        def start_search():
+            if state['searching']:
+                return
+            try:
+                log_filter = build_filter()
+            except ValueError as e:
+                messagebox.showwarning("Filtro non valido", str(e), parent=dialog)
+                return
+            state['filter'] = log_filter
+            state['searching'] = True
+            search_button.config(state='disabled')
+            status_label.config(text="Aggiornamento dell'indice e ricerca in corso...")
+
+            def worker():
+                # Il primo aggiornamento dell'indice di un log grande può richiedere qualche secondo
+                try:
+                    state['index'].refresh()
+                    entries = state['index'].search(log_filter, limit=LOG_BROWSER_MAX_LINES, newest_first=True)
+                    state['results'] = (log_filter, list(reversed(entries)), None)
+                except (OSError, ValueError) as e:
+                    state['results'] = (log_filter, [], e)
+
+            threading.Thread(target=worker, daemon=True).start()
+            dialog.after(100, finish_search)
+
+        def finish_search():
+            if state['closed']:
+                return
+            if state['results'] is None:
+                dialog.after(100, finish_search)
+                return
+            log_filter, entries, error = state['results']
+            state['results'] = None
+            state['searching'] = False
+            search_button.config(state='normal')
+            if error is not None:
+                status_label.config(text=f"Errore nella lettura del log: {error}")
+                return
+            # Anche i flussi non più configurati ma presenti nel log possono essere filtrati
+            flow_combo.config(values=[""] + sorted(set(self.workflows) | set(state['index'].flows())))
+            show_entries(entries, clear=True)
+            shown = f"le {len(entries)} più recenti" if len(entries) >= LOG_BROWSER_MAX_LINES else f"{len(entries)}"
+            status_label.config(text=f"Voci trovate: {shown}.")
+            if follow_var.get():
+                state['follower'] = LogFollower()
+
+        def toggle_follow():
+            state['follower'] = LogFollower() if follow_var.get() else None
+            if follow_var.get() and state['filter'] is None:
+                start_search()
+
+        def poll_follow():
+            if state['closed']:
+                return
+            follower = state['follower']
+            if follower is not None and state['filter'] is not None:
+                try:
+                    entries = [entry for entry in follower.read_new() if state['filter'].matches(entry)]
+                except OSError as e:
+                    entries = []
+                    status_label.config(text=f"Errore nella lettura del log: {e}")
+                if entries:
+                    show_entries(entries)
+            dialog.after(LOG_FOLLOW_INTERVAL_MS, poll_follow)
+
+        def on_close():
+            state['closed'] = True
+            dialog.destroy()
+
+        dialog.protocol("WM_DELETE_WINDOW", on_close)
+        dialog.bind("<Escape>", lambda e: on_close())
+        dialog.bind("<Return>", lambda e: start_search())
+        if self.selected_workflow_name:
+            flow_var.set(self.selected_workflow_name)
+        start_search()
+        poll_follow()
+
     def import_task_from_xml(self):
         if not self.selected_workflow_name:
             messagebox.showwarning("Azione non permessa", "Seleziona prima un flusso di lavoro a cui aggiungere il task.")
@@ -433,7 +1057,7 @@ class WorkflowConfiguratorApp:
 
             new_task = {'name': task_name, 'path': task_path, 'enabled': True}
             self.current_tasks.append(new_task)
-            self.tasks_tree.insert("", tk.END, values=(new_task['name'], "", ""))
+            self.tasks_tree.insert("", tk.END, values=(new_task['name'], "", "", ""))
             self.save_workflows()
             messagebox.showinfo("Successo", f"Task '{task_name}' importato e aggiunto al flusso.")
 
@@ -463,7 +1087,7 @@ class WorkflowConfiguratorApp:
 
                     new_task = {'name': task_name, 'path': task_path, 'enabled': True}
                     self.current_tasks.append(new_task)
-                    self.tasks_tree.insert("", tk.END, values=(new_task['name'], "", ""))
+                    self.tasks_tree.insert("", tk.END, values=(new_task['name'], "", "", ""))
                     success_count += 1
                 except (ET.ParseError, ValueError) as e:
                     # Aggiungi il file e il motivo specifico alla lista degli ignorati
@@ -535,7 +1159,7 @@ class WorkflowConfiguratorApp:
             task_name = os.path.splitext(os.path.basename(task_path))[0]
             new_task = {'name': task_name, 'path': task_path, 'enabled': True}
             self.current_tasks.append(new_task)
-            self.tasks_tree.insert("", tk.END, values=(new_task['name'], "", ""))
+            self.tasks_tree.insert("", tk.END, values=(new_task['name'], "", "", ""))
 
         self.save_workflows()
         messagebox.showinfo("Successo", f"{len(filepaths)} task aggiunti con successo.")
@@ -579,6 +1203,26 @@ class WorkflowConfiguratorApp:
         self.populate_workflow_details(self.selected_workflow_name)
 
 
+    def toggle_task_pipe(self):
+        """
+        Inverte la modalità pipe dei task selezionati: in modalità pipe lo stdout
+        del task viene passato come stdin al task successivo, eseguito in parallelo.
+        """
+        selected_items = self.tasks_tree.selection()
+        if not selected_items:
+            messagebox.showwarning("Azione non permessa", "Seleziona almeno un task da collegare al successivo.")
+            return
+
+        for item in selected_items:
+            index = self.tasks_tree.index(item)
+            task_data = self.current_tasks[index]
+            task_data['pipe_to_next'] = not task_data.get('pipe_to_next', False)
+
+        self.save_workflows()
+
+        # Aggiorna la visualizzazione per riflettere il nuovo stato
+        self.populate_workflow_details(self.selected_workflow_name)
+
     def move_task_up(self):
         selected_items = self.tasks_tree.selection()
         if not selected_items: return
@@ -620,7 +1264,7 @@ class WorkflowConfiguratorApp:
 
         dialog = tk.Toplevel(self.root)
         dialog.title("Modifica Task")
-        dialog.geometry("600x150")
+        dialog.geometry("600x320")
         dialog.transient(self.root)
         dialog.grab_set()
 
@@ -638,20 +1282,62 @@ class WorkflowConfiguratorApp:
         path_entry = ttk.Entry(dialog, textvariable=path_var)
         path_entry.pack(padx=10, pady=2, fill=tk.X, expand=True)
 
+        # Campo Risorse condivise
+        ttk.Label(dialog, text="Risorse condivise (es. excel:1, safework:2):").pack(padx=10, pady=(5, 0))
+        resources_var = tk.StringVar(value=", ".join(task_data.get('resources', [])))
+        resources_entry = ttk.Entry(dialog, textvariable=resources_var)
+        resources_entry.pack(padx=10, pady=2, fill=tk.X, expand=True)
+
+        # Campi Matrice: un'istanza dello script per ogni insieme di parametri
+        ttk.Label(dialog, text='Matrice (JSON, es. [{"name": "Nord", "args": ["--zona", "N"], "env": {}}]):').pack(padx=10, pady=(5, 0))
+        matrix_var = tk.StringVar(value=json.dumps(task_data['matrix'], ensure_ascii=False) if 'matrix' in task_data else "")
+        matrix_entry = ttk.Entry(dialog, textvariable=matrix_var)
+        matrix_entry.pack(padx=10, pady=2, fill=tk.X, expand=True)
+
+        ttk.Label(dialog, text="Istanze in parallelo (vuoto = tutte):").pack(padx=10, pady=(5, 0))
+        max_parallel_var = tk.StringVar(value=str(task_data.get('max_parallel', "")))
+        ttk.Entry(dialog, textvariable=max_parallel_var, width=6).pack(padx=10, pady=2)
+
         def on_ok():
             new_name = name_var.get().strip()
             new_path = path_var.get().strip()
+            new_resources = [spec.strip() for spec in resources_var.get().split(',') if spec.strip()]
+            new_matrix = {}
 
             if not new_name or not new_path:
                 messagebox.showwarning("Dati non validi", "Nome e percorso non possono essere vuoti.", parent=dialog)
                 return
 
+            try:
+                parse_resources(new_resources)
+            except ValueError as e:
+                messagebox.showwarning("Dati non validi", f"Risorse non valide: {e}", parent=dialog)
+                return
+
+            try:
+                if matrix_var.get().strip():
+                    new_matrix['matrix'] = json.loads(matrix_var.get())
+                if max_parallel_var.get().strip():
+                    new_matrix['max_parallel'] = int(max_parallel_var.get())
+                parse_matrix(new_matrix)
+            except (json.JSONDecodeError, ValueError) as e:
+                messagebox.showwarning("Dati non validi", f"Matrice non valida: {e}", parent=dialog)
+                return
+
             # Aggiorna i dati interni
             self.current_tasks[index]['name'] = new_name
             self.current_tasks[index]['path'] = new_path
+            if new_resources:
+                self.current_tasks[index]['resources'] = new_resources
+            else:
+                self.current_tasks[index].pop('resources', None)
+            self.current_tasks[index].pop('matrix', None)
+            self.current_tasks[index].pop('max_parallel', None)
+            self.current_tasks[index].update(new_matrix)
 
             # Aggiorna direttamente l'elemento nella Treeview per reattività immediata
-            self.tasks_tree.item(item, values=(new_name, self.tasks_tree.item(item, 'values')[1], self.tasks_tree.item(item, 'values')[2]))
+            display_name = self._task_display_name(self.current_tasks[index])
+            self.tasks_tree.item(item, values=(display_name, *self.tasks_tree.item(item, 'values')[1:]))
 
             self.save_workflows()
             dialog.destroy()
@@ -0,0 +1,390 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+
+CONFIG_DIR = "config"
+LOCKS_DIR = os.path.join(CONFIG_DIR, "locks")
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _try_lock(f):
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def lock_name(name):
+    """Converte un nome arbitrario (es. il nome di un flusso) in un nome di file sicuro e univoco."""
+    safe_name = re.sub(r'[^\w.-]+', '_', name)[:60]
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+    return f"{safe_name}-{digest}"
+
+
+class FileLock:
+    """
+    Lock esclusivo tra processi basato su un file. Il sistema operativo rilascia il
+    lock automaticamente se il processo che lo detiene termina, anche per un crash.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @property
+    def locked(self):
+        return self._file is not None
+
+    def acquire(self, blocking=True, timeout=None, poll_interval=0.5):
+        """Acquisisce il lock. Restituisce False se non è stato possibile entro il timeout."""
+        if self._file is not None:
+            raise RuntimeError(f"Lock '{self.path}' già acquisito.")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        f = open(self.path, 'a+')
+        while True:
+            if _try_lock(f):
+                self._file = f
+                return True
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                f.close()
+                return False
+            time.sleep(poll_interval)
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            _unlock(self._file)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class FlowLock:
+    """
+    Lock tra processi per un flusso. Oltre al lock principale gestisce uno 'slot di
+    attesa' (al più un'attivazione può attendere il termine di quella in corso) e
+    le richieste di annullamento (dell'intera esecuzione o del solo task in corso)
+    indirizzate al processo che detiene il lock.
+    """
+    def __init__(self, flow_name):
+        base_path = os.path.join(LOCKS_DIR, lock_name(flow_name))
+        self.flow_name = flow_name
+        self.token = uuid.uuid4().hex
+        self._lock = FileLock(base_path + ".lock")
+        self._queue_slot = FileLock(base_path + ".queue.lock")
+        self._owner_path = base_path + ".owner.json"
+        self._cancel_path = base_path + ".cancel"
+        self._cancel_task_path = base_path + ".cancel-task"
+
+    def try_acquire(self, label):
+        """Tenta di acquisire il lock senza attendere."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        self._write_owner(label)
+        return True
+
+    def reserve_queue_slot(self):
+        """Occupa lo slot di attesa. Restituisce False se un'altra attivazione è già in attesa."""
+        return self._queue_slot.acquire(blocking=False)
+
+    def wait_and_acquire(self, label, timeout=None):
+        """
+        Attende il rilascio del lock (al più 'timeout' secondi, se indicato), lo
+        acquisisce e libera lo slot di attesa. Restituisce False se il timeout scade.
+        """
+        if not self._lock.acquire(timeout=timeout):
+            return False
+        self._queue_slot.release()
+        self._clear_cancel_request()
+        self._write_owner(label)
+        return True
+
+    def owner(self):
+        """Restituisce le informazioni sul detentore corrente del lock, se disponibili."""
+        try:
+            with open(self._owner_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def request_cancel(self):
+        """
+        Chiede al detentore corrente del lock di annullare la sua esecuzione.
+        Restituisce False se il flusso non è in esecuzione.
+        """
+        return self._write_request(self._cancel_path)
+
+    def request_task_cancel(self):
+        """
+        Chiede al detentore corrente del lock di terminare il task in corso e
+        proseguire con il successivo. Restituisce False se il flusso non è in esecuzione.
+        """
+        return self._write_request(self._cancel_task_path)
+
+    def take_task_cancel_request(self):
+        """Indica se è stato chiesto di terminare il task in corso, consumando la richiesta."""
+        try:
+            with open(self._cancel_task_path, 'r') as f:
+                requested = f.read().strip() == self.token
+        except FileNotFoundError:
+            return False
+        if requested:
+            self._remove(self._cancel_task_path)
+        return requested
+
+    def _write_request(self, path):
+        owner = self.owner()
+        if owner is None:
+            return False
+        with open(path, 'w') as f:
+            f.write(owner.get('token', ''))
+        return True
+
+    def cancel_requested(self):
+        """Indica se è stato chiesto di annullare l'esecuzione che detiene questo lock."""
+        try:
+            with open(self._cancel_path, 'r') as f:
+                return f.read().strip() == self.token
+        except FileNotFoundError:
+            return False
+
+    def release(self):
+        if not self._lock.locked:
+            return
+        self._clear_cancel_request()
+        try:
+            os.remove(self._owner_path)
+        except FileNotFoundError:
+            pass
+        self._lock.release()
+
+    def _write_owner(self, label):
+        owner = {
+            'pid': os.getpid(),
+            'token': self.token,
+            'label': label,
+            'since': datetime.now().isoformat()
+        }
+        # Scrittura atomica: chi chiede un annullamento non deve leggere un file a metà
+        tmp_path = self._owner_path + f".{self.token}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(owner, f, indent=4)
+        os.replace(tmp_path, self._owner_path)
+
+    def _clear_cancel_request(self):
+        # Chiamato solo da chi detiene il lock: ogni richiesta pendente è ormai superata
+        self._remove(self._cancel_path)
+        self._remove(self._cancel_task_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid):
+    """Indica se il processo con il PID indicato è ancora in esecuzione."""
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5 # ERROR_ACCESS_DENIED: esiste ma non è accessibile
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259 # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def parse_resources(specs):
+    """
+    Converte le dichiarazioni di risorse di un task (es. ["excel:1", "safework:2"])
+    in un dizionario nome -> capacità. La capacità è 1 se omessa.
+    Solleva ValueError per dichiarazioni non valide.
+    """
+    resources = {}
+    for spec in specs or []:
+        name, _, capacity = str(spec).partition(':')
+        name = name.strip()
+        if not name:
+            raise ValueError(f"Nome di risorsa mancante in '{spec}'.")
+        try:
+            capacity = int(capacity) if capacity.strip() else 1
+        except ValueError:
+            raise ValueError(f"Capacità non valida in '{spec}'.") from None
+        if capacity < 1:
+            raise ValueError(f"La capacità della risorsa '{name}' deve essere almeno 1.")
+        resources[name] = capacity
+    return resources
+
+
+class ResourceSet:
+    """
+    Semaforo tra processi per un insieme di risorse nominate con capacità.
+
+    Lo stato di ogni risorsa (detentori e coda di attesa) è in un file JSON protetto
+    da un FileLock. Le risorse vengono acquisite tutte insieme o nessuna, quindi un
+    task non resta mai in attesa tenendone occupata una parte (niente deadlock).
+    Le attese sono servite in ordine di arrivo: ogni richiedente riceve un biglietto
+    e può entrare solo se i detentori più i richiedenti arrivati prima di lui
+    non saturano la capacità. Le voci di processi terminati vengono rimosse.
+    """
+    def __init__(self, resources, label):
+        self.resources = dict(resources)
+        self.label = label
+        self.token = uuid.uuid4().hex
+        self._ticket = None
+        self._held = False
+
+    def _state_path(self, name):
+        return os.path.join(LOCKS_DIR, f"res-{lock_name(name)}.json")
+
+    def _load_state(self, name):
+        try:
+            with open(self._state_path(name), 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        state.setdefault('holders', [])
+        state.setdefault('queue', [])
+        for key in ('holders', 'queue'):
+            state[key] = [entry for entry in state[key] if _pid_alive(entry.get('pid', -1))]
+        return state
+
+    def _save_state(self, name, state):
+        path = self._state_path(name)
+        tmp_path = path + f".{self.token}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=4)
+        os.replace(tmp_path, path)
+
+    def _update_states(self, update):
+        """Applica 'update(nome, stato)' a tutte le risorse tenendo i lock in ordine di nome."""
+        state_locks = [FileLock(self._state_path(name) + ".lock") for name in sorted(self.resources)]
+        for state_lock in state_locks:
+            state_lock.acquire(poll_interval=0.01)
+        try:
+            states = {name: self._load_state(name) for name in self.resources}
+            result = update(states)
+            for name, state in states.items():
+                self._save_state(name, state)
+            return result
+        finally:
+            for state_lock in reversed(state_locks):
+                state_lock.release()
+
+    def _entry(self):
+        return {
+            'token': self.token,
+            'pid': os.getpid(),
+            'ticket': self._ticket,
+            'label': self.label,
+            'since': datetime.now().isoformat()
+        }
+
+    def _try_take(self, states):
+        # Prima ci si mette in coda su tutte le risorse, così chi arriva dopo non passa avanti
+        for state in states.values():
+            if not any(entry['token'] == self.token for entry in state['queue']):
+                state['queue'].append(self._entry())
+
+        for name, capacity in self.resources.items():
+            state = states[name]
+            ahead = sum(1 for entry in state['queue']
+                        if (entry['ticket'], entry['token']) < (self._ticket, self.token))
+            if len(state['holders']) + ahead >= capacity:
+                return False
+
+        for state in states.values():
+            state['queue'] = [entry for entry in state['queue'] if entry['token'] != self.token]
+            state['holders'].append(self._entry())
+        return True
+
+    def _leave(self, states):
+        for state in states.values():
+            state['queue'] = [entry for entry in state['queue'] if entry['token'] != self.token]
+            state['holders'] = [entry for entry in state['holders'] if entry['token'] != self.token]
+
+    def holders(self):
+        """Restituisce, per ogni risorsa, le etichette dei detentori correnti."""
+        return self._update_states(
+            lambda states: {name: [entry['label'] for entry in state['holders']] for name, state in states.items()}
+        )
+
+    def acquire(self, cancel_event=None, on_wait=None, poll_interval=0.5, skip_event=None):
+        """
+        Attende finché tutte le risorse sono disponibili e le acquisisce.
+        on_wait viene chiamato una volta se è necessario attendere.
+        Restituisce False, dopo aver lasciato la coda, se cancel_event (annullamento del
+        flusso) o skip_event (annullamento del solo task) è impostato prima o durante
+        l'attesa; anche un'eccezione durante l'attesa fa lasciare la coda.
+        """
+        if not self.resources:
+            return True
+        stop_events = [event for event in (cancel_event, skip_event) if event is not None]
+        self._ticket = time.time_ns()
+        waiting = False
+        try:
+            while True:
+                if any(event.is_set() for event in stop_events):
+                    self._update_states(self._leave)
+                    return False
+                if self._update_states(self._try_take):
+                    self._held = True
+                    return True
+                if not waiting:
+                    waiting = True
+                    if on_wait is not None:
+                        on_wait()
+                if stop_events:
+                    stop_events[0].wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+        except BaseException:
+            self._update_states(self._leave)
+            raise
+
+    def release(self):
+        if self._held:
+            self._update_states(self._leave)
+            self._held = False
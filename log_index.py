@@ -0,0 +1,364 @@
+"""
+Ricerca indicizzata e lettura in coda del log dello scheduler.
+
+Accanto al log viene mantenuto un indice (scheduler.log.idx) che divide il file in
+blocchi di circa BLOCK_SIZE byte e, per ogni blocco, ricorda l'intervallo di orari,
+i livelli e i flussi delle righe che contiene. Una ricerca legge (tramite memory
+mapping) solo i blocchi che possono contenere righe utili, più la parte finale del
+log non ancora indicizzata. L'indice è in sola aggiunta: a ogni ricerca vengono
+indicizzati solo i blocchi completati nel frattempo, e viene ricostruito se il log
+è stato troncato o sostituito.
+"""
+import json
+import logging
+import mmap
+import os
+import re
+from datetime import datetime, timedelta
+from core_logic import LOG_FILE
+from locking import FileLock, LOCKS_DIR
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+# Dimensione indicativa dei blocchi del log descritti da una voce dell'indice
+BLOCK_SIZE = 256 * 1024
+# Livelli di logging in ordine di gravità
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+# Byte letti al più a ogni chiamata di LogFollower.read_new
+FOLLOW_CHUNK_SIZE = 1024 * 1024
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Byte iniziali del log usati per riconoscere se il file è stato sostituito
+HEAD_LENGTH = 200
+
+# Intestazione di una voce del log: "2024-05-06 12:00:00,123 - LIVELLO - messaggio"
+_ENTRY_RE = re.compile(rb'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+ - ([A-Z]+) - ')
+# Il flusso di una voce: "[Nome flusso] ..." all'inizio del messaggio oppure "... flusso 'Nome flusso' ..."
+_FLOW_LABEL_RE = re.compile(rb"\[([^\]]+)\]")
+_FLOW_NAME_RE = re.compile(rb"[Ff]lusso '([^']+)'")
+
+
+def _parse_header(line):
+    """Restituisce (orario, livello, flusso) se la riga apre una voce del log, altrimenti None."""
+    match = _ENTRY_RE.match(line)
+    if match is None:
+        return None
+    flow_match = _FLOW_LABEL_RE.match(line, match.end()) or _FLOW_NAME_RE.search(line, match.end())
+    flow = flow_match.group(1).decode('utf-8', errors='replace') if flow_match is not None else None
+    return match.group(1).decode(), match.group(2).decode(), flow
+
+
+def flow_matches(label, flow_name):
+    """Indica se l'etichetta di una voce (es. "Flusso (Manuale)") appartiene al flusso indicato."""
+    return label is not None and (label == flow_name or label.startswith(flow_name + " ("))
+
+
+def _level_rank(level):
+    return LEVELS.index(level) if level in LEVELS else -1
+
+
+def _parse_entries(data, base_offset, previous=None):
+    """
+    Divide un blocco di righe complete in voci del log. Le righe senza intestazione
+    (es. traceback) appartengono alla voce precedente; 'previous' è l'ultima voce del
+    blocco precedente, da cui le righe iniziali senza intestazione ereditano orario,
+    livello e flusso.
+    """
+    entries = []
+    current = None
+    offset = base_offset
+    for line in data.split(b'\n'):
+        header = _parse_header(line)
+        if header is not None or current is None:
+            if current is not None:
+                entries.append(current)
+            timestamp, level, flow = header or (
+                (previous['timestamp'], previous['level'], previous['flow']) if previous else (None, None, None))
+            current = {'offset': offset, 'timestamp': timestamp, 'level': level, 'flow': flow, 'lines': [line]}
+        else:
+            current['lines'].append(line)
+        offset += len(line) + 1
+    if current is not None:
+        entries.append(current)
+    for entry in entries:
+        entry['text'] = b'\n'.join(entry.pop('lines')).decode('utf-8', errors='replace')
+    return entries
+
+
+def parse_log_time(text, end_of_period=False, now=None):
+    """
+    Interpreta un orario per la ricerca nel log: "AAAA-MM-GG", "AAAA-MM-GG HH:MM[:SS]"
+    oppure una durata all'indietro da adesso ("30m", "12h", "7d"). Con end_of_period
+    una data senza ora indica la fine del giorno. Solleva ValueError se non valido.
+    """
+    text = text.strip()
+    units = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+    if text[-1:] in units and text[:-1].isdigit():
+        return (now or datetime.now()) - timedelta(**{units[text[-1]]: int(text[:-1])})
+    for time_format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            value = datetime.strptime(text, time_format)
+        except ValueError:
+            continue
+        if time_format == "%Y-%m-%d" and end_of_period:
+            value = value.replace(hour=23, minute=59, second=59)
+        return value
+    raise ValueError(f"Orario '{text}' non valido: usare AAAA-MM-GG [HH:MM] oppure una durata come 30m, 12h, 7d.")
+
+
+def _format_time(value):
+    """Converte un datetime (o una stringa già nel formato del log) nel formato degli orari del log."""
+    if value is None or isinstance(value, str):
+        return value
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+class LogFilter:
+    """Criteri di ricerca: flusso, livello minimo, intervallo di orari e testo contenuto."""
+    def __init__(self, flow=None, min_level=None, since=None, until=None, text=None):
+        if min_level is not None and min_level not in LEVELS:
+            raise ValueError(f"Livello '{min_level}' non valido: usare uno tra {', '.join(LEVELS)}.")
+        self.flow = flow or None
+        self.min_rank = _level_rank(min_level) if min_level else None
+        self.since = _format_time(since)
+        self.until = _format_time(until)
+        self.text = text.lower() if text else None
+
+    def block_may_match(self, block):
+        """Indica se un blocco dell'indice può contenere voci che rispettano il filtro."""
+        if block['first'] is not None:
+            if self.since is not None and block['last'] < self.since:
+                return False
+            if self.until is not None and block['first'] > self.until:
+                return False
+        if self.min_rank is not None and not any(_level_rank(level) >= self.min_rank for level in block['levels']):
+            return False
+        if self.flow is not None and not any(flow_matches(label, self.flow) for label in block['flows']):
+            return False
+        return True
+
+    def matches(self, entry):
+        if self.since is not None and (entry['timestamp'] is None or entry['timestamp'] < self.since):
+            return False
+        if self.until is not None and (entry['timestamp'] is None or entry['timestamp'] > self.until):
+            return False
+        if self.min_rank is not None and _level_rank(entry['level']) < self.min_rank:
+            return False
+        if self.flow is not None and not flow_matches(entry['flow'], self.flow):
+            return False
+        return self.text is None or self.text in entry['text'].lower()
+
+
+class LogIndex:
+    """Indice a blocchi di un file di log, mantenuto in un file accanto al log."""
+    def __init__(self, log_path=LOG_FILE):
+        self.log_path = log_path
+        self.index_path = log_path + INDEX_SUFFIX
+        self._lock = FileLock(os.path.join(LOCKS_DIR, os.path.basename(self.index_path) + ".lock"))
+        self.blocks = []
+        self._torn = False
+
+    @property
+    def indexed_size(self):
+        """Byte del log coperti dall'indice."""
+        return self.blocks[-1]['end'] if self.blocks else 0
+
+    def _load(self):
+        """Legge l'indice; restituisce la firma del log che descrive, o None se manca o non è valido."""
+        self.blocks = []
+        self._torn = False
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if header.get('version') != INDEX_VERSION:
+                    return None
+                for line in f:
+                    try:
+                        if not line.endswith("\n"):
+                            raise ValueError(line)
+                        self.blocks.append(json.loads(line))
+                    except ValueError:
+                        # Ultima voce scritta a metà (es. processo interrotto): verrà rifatta
+                        self._torn = True
+                        break
+            return header.get('head')
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            return None
+
+    @staticmethod
+    def _head(mapped):
+        """Firma del log: l'inizio della sua prima riga, che cambia se il file viene sostituito."""
+        end = mapped.find(b'\n', 0, HEAD_LENGTH)
+        return mapped[:end if end >= 0 else HEAD_LENGTH].decode('utf-8', errors='replace')
+
+    def refresh(self):
+        """
+        Aggiorna l'indice con i blocchi completati dopo l'ultimo aggiornamento,
+        ricostruendolo se il log è stato troncato o sostituito.
+        Restituisce il numero di blocchi aggiunti.
+        """
+        with self._lock, _open_mapped(self.log_path) as mapped:
+            if mapped is None:
+                self.blocks = []
+                return 0
+            head = self._head(mapped)
+            if self._load() != head or self.indexed_size > len(mapped):
+                if self.blocks:
+                    logging.info(f"Log '{self.log_path}' troncato o sostituito: ricostruzione dell'indice.")
+                self.blocks = []
+                self._write(head)
+            elif self._torn:
+                # Riscrive l'indice senza l'ultima voce incompleta
+                self._write(head)
+
+            new_blocks = list(_scan_blocks(mapped, self.indexed_size))
+            if new_blocks:
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    for block in new_blocks:
+                        f.write(json.dumps(block) + "\n")
+                self.blocks.extend(new_blocks)
+            return len(new_blocks)
+
+    def _write(self, head):
+        """Riscrive per intero l'indice con i blocchi già noti (rename atomico)."""
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': INDEX_VERSION, 'head': head}) + "\n")
+            for block in self.blocks:
+                f.write(json.dumps(block) + "\n")
+        os.replace(tmp_path, self.index_path)
+
+    def search(self, log_filter, limit=None, newest_first=False):
+        """
+        Restituisce le voci del log che rispettano log_filter (al più 'limit'), dalla
+        più vecchia o, con newest_first, dalla più recente. Ogni voce è un dizionario
+        con offset, timestamp, level, flow e text. Va chiamato dopo refresh().
+        """
+        results = []
+        with _open_mapped(self.log_path) as mapped:
+            if mapped is None:
+                return results
+            # La parte finale non ancora indicizzata viene letta sempre, fino all'ultima riga completa
+            tail_end = mapped.rfind(b'\n', self.indexed_size) + 1
+            ranges = [(block['start'], block['end']) for block in self.blocks if log_filter.block_may_match(block)]
+            if tail_end > self.indexed_size:
+                ranges.append((self.indexed_size, tail_end))
+            if newest_first:
+                ranges.reverse()
+
+            for start, end in ranges:
+                entries = [entry for entry in _parse_entries(mapped[start:end - 1], start) if log_filter.matches(entry)]
+                if newest_first:
+                    entries.reverse()
+                results.extend(entries)
+                if limit is not None and len(results) >= limit:
+                    return results[:limit]
+        return results
+
+    def flows(self):
+        """Nomi dei flussi presenti nel log indicizzato, senza il suffisso dell'etichetta (es. " (Manuale)")."""
+        return sorted({label.split(" (", 1)[0] for block in self.blocks for label in block['flows']})
+
+
+class _open_mapped:
+    """Apre il log in memory mapping in sola lettura; restituisce None se il file è vuoto o assente."""
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._mapped = None
+
+    def __enter__(self):
+        try:
+            self._file = open(self.path, 'rb')
+            if os.fstat(self._file.fileno()).st_size > 0:
+                self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            pass
+        return self._mapped
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._mapped is not None:
+            self._mapped.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def _scan_blocks(mapped, start):
+    """
+    Genera le voci dell'indice per i blocchi completi del log a partire da 'start'.
+    Un blocco si chiude solo all'inizio di una nuova voce, così una voce su più righe
+    non viene mai divisa; la parte finale incompleta resta da indicizzare.
+    """
+    size = len(mapped)
+    block = None
+    position = start
+    while position < size:
+        line_end = mapped.find(b'\n', position)
+        if line_end < 0:
+            break
+        header = _parse_header(mapped[position:line_end])
+        if header is not None and block is not None and position - block['start'] >= BLOCK_SIZE:
+            block['end'] = position
+            block['levels'] = sorted(block['levels'], key=_level_rank)
+            block['flows'] = sorted(block['flows'])
+            yield block
+            block = None
+        if block is None:
+            block = {'start': position, 'end': None, 'first': None, 'last': None, 'levels': set(), 'flows': set()}
+        if header is not None:
+            timestamp, level, flow = header
+            if block['first'] is None or timestamp < block['first']:
+                block['first'] = timestamp
+            if block['last'] is None or timestamp > block['last']:
+                block['last'] = timestamp
+            block['levels'].add(level)
+            if flow is not None:
+                block['flows'].add(flow)
+        position = line_end + 1
+
+
+class LogFollower:
+    """
+    Segue la crescita del log restituendo solo le voci nuove, come 'tail -f': la
+    memoria usata non dipende dalla dimensione del file. Se il log viene troncato
+    o sostituito, la lettura riparte dall'inizio del nuovo file.
+    """
+    def __init__(self, log_path=LOG_FILE, from_end=True):
+        self.log_path = log_path
+        self.offset = 0
+        self._identity = None
+        self._previous = None
+        if from_end:
+            # Si parte dopo l'ultima riga completa, per non restituire una riga a metà
+            with _open_mapped(log_path) as mapped:
+                if mapped is not None:
+                    self.offset = mapped.rfind(b'\n') + 1
+            try:
+                stat = os.stat(log_path)
+                self._identity = (stat.st_dev, stat.st_ino)
+            except FileNotFoundError:
+                pass
+
+    def read_new(self):
+        """Restituisce le voci complete aggiunte al log dall'ultima chiamata (al più FOLLOW_CHUNK_SIZE byte)."""
+        try:
+            with open(self.log_path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                identity = (stat.st_dev, stat.st_ino)
+                if identity != self._identity or stat.st_size < self.offset:
+                    if self._identity is not None:
+                        logging.info(f"Log '{self.log_path}' troncato o sostituito: lettura dall'inizio.")
+                    self._identity = identity
+                    self.offset = 0
+                    self._previous = None
+                f.seek(self.offset)
+                data = f.read(FOLLOW_CHUNK_SIZE)
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b'\n')
+        if end < 0:
+            return []
+        entries = _parse_entries(data[:end], self.offset, self._previous)
+        self.offset += end + 1
+        if entries:
+            self._previous = entries[-1]
+        return entries
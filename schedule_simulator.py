@@ -0,0 +1,393 @@
+import heapq
+import random
+from datetime import timedelta
+
+from locking import parse_resources
+from workflow_config import next_fire_time
+from core_logic import OVERLAP_POLICIES, pipe_group, parse_matrix
+
+# Durata ipotizzata (in secondi) per i task senza statistiche
+DEFAULT_TASK_DURATION = 60.0
+
+
+def sample_duration(task_stats, rng, default_duration=DEFAULT_TASK_DURATION):
+    """
+    Estrae una durata plausibile per un task dalle sue statistiche storiche: una
+    delle ultime durate registrate, oppure (per le statistiche meno recenti che
+    hanno solo gli estremi) uniforme tra minimo e massimo, oppure la durata predefinita.
+    """
+    if task_stats.get('recent'):
+        return rng.choice(task_stats['recent'])
+    low = task_stats.get('min')
+    high = task_stats.get('max')
+    if low is None and high is None:
+        return default_duration
+    if low is None or high is None:
+        return low if high is None else high
+    return rng.uniform(low, high)
+
+
+class _SimulatedRun:
+    """Un'esecuzione simulata di un flusso."""
+    def __init__(self, flow_name, triggered_at, groups, deadline):
+        self.flow_name = flow_name
+        self.triggered_at = triggered_at
+        self.groups = groups # lista di (lista di task, risorse)
+        self.deadline = deadline
+        self.next_group = 0
+        self.started_at = None
+        self.pending_units = []
+        self.active_units = []
+        self.cancelled = False
+
+
+class _SimulatedUnit:
+    """Un'unità di lavoro simulata: un task, una pipeline o un'istanza di un task matrice."""
+    def __init__(self, run, durations, resources):
+        self.run = run
+        self.durations = durations # una durata per task della pipeline
+        self.resources = resources
+        self.active_stages = 0
+        self.request = None
+        self.held = False
+
+
+class ScheduleSimulator:
+    """
+    Simulatore a eventi discreti delle pianificazioni di workflows.json.
+
+    Non esegue nessun task: il tempo avanza saltando da un evento al successivo
+    (avvio pianificato, fine di un task), usando le stesse regole dello scheduler
+    per gli orari, le politiche di sovrapposizione dei flussi, la modalità pipe e
+    le risorse condivise (in ordine di arrivo, tutte o nessuna). Le durate dei
+    task sono estratte dalle statistiche storiche. Per questo un mese di
+    pianificazioni si simula in frazioni di secondo.
+    Come nell'esecutore, le istanze di un task matrice girano al più 'max_parallel'
+    alla volta e ognuna acquisisce le risorse del task per conto proprio: una
+    matrice con più istanze di una risorsa a capacità 1 le esegue una dopo l'altra.
+    """
+    def __init__(self, workflows, task_stats, seed=None, default_duration=DEFAULT_TASK_DURATION, deadlines=None):
+        self.workflows = workflows
+        self.task_stats = task_stats
+        self.rng = random.Random(seed)
+        self.default_duration = default_duration
+        self.deadlines = deadlines or {}
+
+    def _now(self):
+        return self.start + timedelta(seconds=self.clock)
+
+    def _push(self, delay, kind, payload):
+        self._sequence += 1
+        heapq.heappush(self._events, (self.clock + delay, self._sequence, kind, payload))
+
+    def _build_groups(self, tasks):
+        groups = []
+        i = 0
+        while i < len(tasks):
+            group = pipe_group(tasks, i)
+            i = group[-1] + 1
+            if not tasks[group[0]].get('enabled', True):
+                continue
+            resources = {}
+            for j in group:
+                try:
+                    resources.update(parse_resources(tasks[j].get('resources')))
+                except ValueError:
+                    pass
+            groups.append(([tasks[j] for j in group], resources))
+        return groups
+
+    def _set_concurrency(self, flows_delta=0, tasks_delta=0):
+        self._running_tasks += tasks_delta
+        self._running_flows += flows_delta
+        if self._running_tasks > self.report['peak_tasks']:
+            self.report['peak_tasks'] = self._running_tasks
+            self.report['peak_tasks_at'] = self._now()
+        if self._running_flows > self.report['peak_flows']:
+            self.report['peak_flows'] = self._running_flows
+            self.report['peak_flows_at'] = self._now()
+
+    # --- Risorse condivise ---
+
+    def _request_unit(self, unit):
+        if not unit.resources:
+            self._start_unit(unit, 0.0)
+            return
+        self._ticket += 1
+        unit.request = {'ticket': self._ticket, 'unit': unit, 'resources': unit.resources, 'requested_at': self.clock}
+        for name in unit.resources:
+            self._resource_state(name)['waiting'].append(unit.request)
+        self._grant_resources()
+
+    def _resource_state(self, name):
+        return self._resources.setdefault(name, {'holders': 0, 'waiting': []})
+
+    def _grant_resources(self):
+        granted = True
+        while granted:
+            granted = False
+            pending = {id(req): req for state in self._resources.values() for req in state['waiting']}
+            for request in sorted(pending.values(), key=lambda req: req['ticket']):
+                if all(self._can_take(name, capacity, request) for name, capacity in request['resources'].items()):
+                    for name in request['resources']:
+                        state = self._resource_state(name)
+                        state['waiting'].remove(request)
+                        state['holders'] += 1
+                    unit = request['unit']
+                    unit.request = None
+                    unit.held = True
+                    self._start_unit(unit, self.clock - request['requested_at'])
+                    granted = True
+                    break
+
+    def _can_take(self, name, capacity, request):
+        state = self._resource_state(name)
+        ahead = sum(1 for other in state['waiting'] if other['ticket'] < request['ticket'])
+        return state['holders'] + ahead < capacity
+
+    def _release_resources(self, unit):
+        """Rilascia (o ritira dalla coda) le risorse di un'unità; le risorse liberate vanno assegnate con _grant_resources."""
+        if unit.request is not None:
+            for name in unit.request['resources']:
+                self._resource_state(name)['waiting'].remove(unit.request)
+            unit.request = None
+        if unit.held:
+            for name in unit.resources:
+                self._resource_state(name)['holders'] -= 1
+            unit.held = False
+
+    # --- Ciclo di vita delle esecuzioni ---
+
+    def _sample(self, stats_key):
+        task_stats = self.task_stats.get(stats_key, {})
+        if not task_stats:
+            self.report['tasks_without_stats'].add(stats_key)
+        return sample_duration(task_stats, self.rng, self.default_duration)
+
+    def _group_units(self, tasks):
+        """
+        Durate delle unità di lavoro di un gruppo e quante ne girano in parallelo, come
+        nell'esecutore: un task matrice ha un'unità per istanza, gli altri gruppi
+        un'unica unità con una durata per task della pipeline.
+        """
+        task = tasks[0]
+        try:
+            instances, max_parallel = parse_matrix(task)
+        except ValueError:
+            instances = None
+        if len(tasks) > 1 or instances is None:
+            return [[self._sample(task.get('path', '')) for task in tasks]], 1
+
+        task_path = task.get('path', '')
+        stats_keys = [f"{task_path} [{params['name']}]" for params in instances]
+        if any(self.task_stats.get(key) for key in stats_keys):
+            return [[self._sample(key)] for key in stats_keys], max_parallel
+        # Senza statistiche per istanza la durata complessiva della matrice viene
+        # ripartita tra i turni di istanze eseguite in parallelo
+        rounds = -(-len(instances) // max_parallel)
+        duration = self._sample(task_path) / rounds
+        return [[duration] for _ in instances], max_parallel
+
+    def _start_group(self, run):
+        tasks, resources = run.groups[run.next_group]
+        durations, parallel = self._group_units(tasks)
+        run.pending_units = [_SimulatedUnit(run, unit_durations, resources) for unit_durations in durations]
+        for _ in range(parallel):
+            self._next_unit(run)
+
+    def _next_unit(self, run):
+        unit = run.pending_units.pop(0)
+        run.active_units.append(unit)
+        self._request_unit(unit)
+
+    def _start_unit(self, unit, queue_wait):
+        if queue_wait > 0:
+            for name in unit.resources:
+                waits = self.report['resource_waits'].setdefault(name, [])
+                waits.append(queue_wait)
+        unit.active_stages = len(unit.durations)
+        self._set_concurrency(tasks_delta=len(unit.durations))
+        for duration in unit.durations:
+            self._push(duration, 'stage_done', unit)
+
+    def _start_run(self, run):
+        run.started_at = self.clock
+        self._running[run.flow_name] = run
+        self._set_concurrency(flows_delta=1)
+        wait = run.started_at - run.triggered_at
+        if wait > 0:
+            self.report['overlap_waits'].append(wait)
+        self._start_group(run)
+
+    def _finish_run(self, run, status):
+        self._running.pop(run.flow_name, None)
+        self._set_concurrency(flows_delta=-1)
+        finished_at = self.start + timedelta(seconds=self.clock)
+        self.report['runs'].append({
+            'flow': run.flow_name,
+            'triggered': self.start + timedelta(seconds=run.triggered_at),
+            'started': self.start + timedelta(seconds=run.started_at),
+            'finished': finished_at,
+            'duration': self.clock - run.started_at,
+            'status': status,
+            'deadline_missed': run.deadline is not None and finished_at > run.deadline
+        })
+        queued = self._queued.pop(run.flow_name, None)
+        if queued is not None:
+            self._start_run(queued)
+
+    def _on_trigger(self, flow_name):
+        config = self.workflows[flow_name]
+        groups = self._build_groups(config.get("tasks", []))
+        if not groups:
+            return
+        now = self._now()
+        deadline = None
+        if flow_name in self.deadlines:
+            hour, minute = self.deadlines[flow_name]
+            deadline = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if deadline < now:
+                deadline += timedelta(days=1)
+        run = _SimulatedRun(flow_name, self.clock, groups, deadline)
+        self.report['triggered'] += 1
+
+        current = self._running.get(flow_name)
+        if current is None:
+            self._start_run(run)
+            return
+
+        policy = config.get("overlap_policy", "skip")
+        if policy not in OVERLAP_POLICIES:
+            policy = 'skip'
+        if policy == 'skip':
+            self.report['skipped'] += 1
+        elif flow_name in self._queued:
+            self.report['coalesced'] += 1
+        elif policy == 'queue':
+            self._queued[flow_name] = run
+        else:
+            # 'replace': l'esecuzione in corso viene interrotta e la nuova parte subito
+            self.report['replaced'] += 1
+            current.cancelled = True
+            for unit in current.active_units:
+                self._set_concurrency(tasks_delta=-unit.active_stages)
+                unit.active_stages = 0
+                self._release_resources(unit)
+            current.active_units = []
+            current.pending_units = []
+            self._grant_resources()
+            self._queued[flow_name] = run
+            self._finish_run(current, 'cancelled')
+
+    def _on_stage_done(self, unit):
+        run = unit.run
+        if run.cancelled:
+            return
+        unit.active_stages -= 1
+        self._set_concurrency(tasks_delta=-1)
+        if unit.active_stages > 0:
+            return
+        run.active_units.remove(unit)
+        self._release_resources(unit)
+        self._grant_resources()
+        if run.pending_units:
+            self._next_unit(run)
+            return
+        if run.active_units:
+            return
+        run.next_group += 1
+        if run.next_group < len(run.groups):
+            self._start_group(run)
+        else:
+            self._finish_run(run, 'success')
+
+    def run(self, start, end):
+        """Simula il periodo [start, end) e restituisce il report."""
+        self.start = start
+        self.clock = 0.0
+        self._events = []
+        self._sequence = 0
+        self._ticket = 0
+        self._running = {}
+        self._queued = {}
+        self._resources = {}
+        self._running_flows = 0
+        self._running_tasks = 0
+        self.report = {
+            'start': start,
+            'end': end,
+            'triggered': 0,
+            'skipped': 0,
+            'coalesced': 0,
+            'replaced': 0,
+            'peak_flows': 0,
+            'peak_flows_at': None,
+            'peak_tasks': 0,
+            'peak_tasks_at': None,
+            'overlap_waits': [],
+            'resource_waits': {},
+            'tasks_without_stats': set(),
+            'runs': []
+        }
+
+        # Gli avvii pianificati sono calcolati con le stesse regole dello scheduler
+        for flow_name, config in self.workflows.items():
+            fire_time = next_fire_time(config, start - timedelta(microseconds=1))
+            while fire_time is not None and fire_time < end:
+                self._push((fire_time - start).total_seconds(), 'trigger', flow_name)
+                fire_time = next_fire_time(config, fire_time)
+
+        # Le esecuzioni avviate nel periodo vengono completate anche oltre la sua fine
+        while self._events:
+            self.clock, _, kind, payload = heapq.heappop(self._events)
+            if kind == 'trigger':
+                self._on_trigger(payload)
+            else:
+                self._on_stage_done(payload)
+        return self.report
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+def format_report(report):
+    """Formatta il report di una simulazione come testo leggibile."""
+    lines = [
+        f"Periodo simulato: {report['start']:%Y-%m-%d %H:%M} - {report['end']:%Y-%m-%d %H:%M}",
+        f"Attivazioni: {report['triggered']} (ignorate: {report['skipped']}, accorpate: {report['coalesced']}, "
+        f"sostituite: {report['replaced']})",
+    ]
+    if report['peak_flows_at'] is not None:
+        lines.append(f"Picco flussi contemporanei: {report['peak_flows']} ({report['peak_flows_at']:%Y-%m-%d %H:%M})")
+        lines.append(f"Picco task contemporanei: {report['peak_tasks']} ({report['peak_tasks_at']:%Y-%m-%d %H:%M})")
+
+    if report['overlap_waits']:
+        waits = report['overlap_waits']
+        lines.append(f"Attese per flusso già in esecuzione: {len(waits)}, media {_format_seconds(sum(waits) / len(waits))}, "
+                     f"massima {_format_seconds(max(waits))}")
+    for name, waits in sorted(report['resource_waits'].items()):
+        lines.append(f"Attese per la risorsa '{name}': {len(waits)}, media {_format_seconds(sum(waits) / len(waits))}, "
+                     f"massima {_format_seconds(max(waits))}")
+
+    runs_by_flow = {}
+    for run in report['runs']:
+        runs_by_flow.setdefault(run['flow'], []).append(run)
+    if runs_by_flow:
+        lines.append("")
+        lines.append("Flusso\tEsecuzioni\tDurata media\tDurata max\tFine più tardiva\tScadenze mancate")
+    for flow_name, runs in sorted(runs_by_flow.items()):
+        durations = [run['duration'] for run in runs]
+        # La fine più tardiva è misurata dalla mezzanotte del giorno di avvio, così i flussi
+        # che terminano dopo la mezzanotte non risultano "presto"
+        latest = max(runs, key=lambda run: run['finished'] - run['triggered'].replace(hour=0, minute=0, second=0, microsecond=0))
+        missed = sum(1 for run in runs if run['deadline_missed'])
+        lines.append(f"{flow_name}\t{len(runs)}\t{_format_seconds(sum(durations) / len(durations))}\t"
+                     f"{_format_seconds(max(durations))}\t{latest['finished']:%H:%M:%S} ({latest['finished']:%Y-%m-%d})\t{missed}")
+
+    if report['tasks_without_stats']:
+        lines.append("")
+        lines.append(f"{len(report['tasks_without_stats'])} task senza statistiche: usata la durata predefinita.")
+    return "\n".join(lines)
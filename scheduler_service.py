@@ -1,30 +1,78 @@
+import itertools
 import json
 import logging
 import os
 import threading
 import time
-from datetime import datetime
-from core_logic import setup_logging, execute_flow
+from collections import Counter
+from datetime import datetime, timedelta
+from core_logic import setup_logging, load_run_manifest, preflight_check, slow_task_alerts, OVERLAP_POLICIES
+from control_api import start_control_server
+from file_watcher import FileTrigger, parse_watch
+from flow_supervisor import run_supervised, supervised_progress, supervisors_info, DEFAULT_MAX_RESTARTS
+from locking import FlowLock
+from workflow_config import load_workflows, is_fire_minute
 
 CONFIG_DIR = "config"
-CONFIG_FILE = os.path.join(CONFIG_DIR, "workflows.json")
 STATUS_FILE = os.path.join(CONFIG_DIR, "scheduler_status.json")
 
-# Stato condiviso per i flussi attivi
-_active_flows = set()
+# Stato condiviso per i flussi attivi: nome -> attivazioni in corso (con la politica
+# 'queue' o 'replace' due attivazioni dello stesso flusso possono essere vive insieme)
+_active_flows = Counter()
+# Esito dell'ultimo pre-flight di ogni flusso
+_warmup_results = {}
+# Valori di 'warmup_minutes' non validi già segnalati, per flusso
+_invalid_warmups = {}
+# Trigger su file attivi: nome flusso -> (dichiarazione 'watch', FileTrigger)
+_file_triggers = {}
+# Richieste di esecuzione ricevute dall'API di controllo, in ordine di arrivo
+_run_requests = []
+_request_ids = itertools.count(1)
+# Flussi con le pianificazioni sospese; ALL_FLOWS sospende tutti i flussi
+_paused_flows = set()
+ALL_FLOWS = '*'
+# Numero di richieste concluse conservate per la consultazione
+FINISHED_REQUESTS_KEPT = 50
+# Porta e token dell'API di controllo, pubblicati nel file di stato
+_control = {}
+# Ogni quanti secondi il file di stato viene aggiornato mentre ci sono flussi in corso
+PROGRESS_REFRESH_SECONDS = 5
+# Tentativi di sostituzione del file di stato quando è aperto da un lettore
+STATUS_REPLACE_ATTEMPTS = 5
 _status_lock = threading.Lock()
 
 def _update_status_file():
-    """Scrive lo stato corrente (PID, flussi attivi) nel file di stato."""
+    """
+    Scrive lo stato corrente (PID, flussi attivi con avanzamento e fine prevista,
+    processi dei flussi, esiti del pre-flight, task lenti) nel file di stato.
+    """
     with _status_lock:
         status = {
             'pid': os.getpid(),
-            'running_flows': list(_active_flows),
+            'running_flows': sorted(_active_flows),
+            'progress': supervised_progress(),
+            'supervisors': supervisors_info(),
+            'warmup': dict(_warmup_results),
+            'slow_tasks': slow_task_alerts(),
+            'file_triggers': {flow_name: trigger.mode for flow_name, (_, trigger) in _file_triggers.items()},
+            'paused': sorted(_paused_flows),
+            'control': dict(_control),
             'timestamp': datetime.now().isoformat()
         }
         os.makedirs(CONFIG_DIR, exist_ok=True)
-        with open(STATUS_FILE, 'w') as f:
+        # Scrittura atomica: chi legge il file (GUI, flowctl) non vede mai un JSON a metà,
+        # che farebbe credere irraggiungibile l'API di controllo
+        tmp_path = STATUS_FILE + ".tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(status, f, indent=4)
+        for _ in range(STATUS_REPLACE_ATTEMPTS):
+            try:
+                os.replace(tmp_path, STATUS_FILE)
+                return
+            except PermissionError:
+                # Su Windows la sostituzione fallisce mentre un altro processo ha il file aperto
+                time.sleep(0.05)
+        logging.warning(f"Impossibile aggiornare '{STATUS_FILE}' (file in uso): riprovo al prossimo aggiornamento.")
 
 def _clear_status_file():
     """Rimuove il file di stato, se esiste."""
@@ -32,31 +80,345 @@ def _clear_status_file():
         if os.path.exists(STATUS_FILE):
             os.remove(STATUS_FILE)
 
-def flow_execution_wrapper(flow_name, tasks):
+def is_flow_due(config, now, last_execution_date):
+    """
+    Indica se un flusso deve partire nel minuto 'now' e non è già partito oggi.
+    L'orario segue le stesse regole del simulatore (workflow_config.next_fire_time).
+    """
+    has_run_today = (last_execution_date == now.strftime("%Y-%m-%d"))
+    return is_fire_minute(config, now) and not has_run_today
+
+def warmup_minutes_of(flow_name, config):
+    """
+    Minuti di anticipo del pre-flight del flusso ('warmup_minutes'), o None se il
+    pre-flight non è configurato. Un valore non numerico viene segnalato una volta e
+    ignorato, così una voce errata non blocca la pianificazione degli altri flussi.
+    """
+    value = config.get("warmup_minutes")
+    if value is None:
+        return None
+    try:
+        minutes = int(value)
+    except (TypeError, ValueError):
+        with _status_lock:
+            already_warned = _invalid_warmups.get(flow_name) == repr(value)
+            _invalid_warmups[flow_name] = repr(value)
+        if not already_warned:
+            logging.warning(f"[{flow_name}] 'warmup_minutes' non valido ({value!r}): pre-flight disattivato.")
+        return None
+    with _status_lock:
+        _invalid_warmups.pop(flow_name, None)
+    return minutes if minutes > 0 else None
+
+def is_warmup_due(config, now, last_warmup_date, warmup_minutes):
+    """
+    Indica se nel minuto 'now' deve partire il pre-flight del flusso, cioè se il flusso
+    è pianificato tra 'warmup_minutes' minuti (vedi warmup_minutes_of). last_warmup_date
+    è la data dell'ultima esecuzione pianificata già preparata.
+    """
+    if not warmup_minutes:
+        return False
+    return is_flow_due(config, now + timedelta(minutes=warmup_minutes), last_warmup_date)
+
+def warmup_wrapper(flow_name, tasks, fire_time):
+    """
+    Esegue il pre-flight di un flusso prima del suo orario di avvio: valida i task,
+    controlla la sintassi degli script Python e li porta nella cache del disco. I problemi trovati
+    vengono registrati subito nel log e nel file di stato.
+    """
+    logging.info(f"PRE-FLIGHT: Preparazione del flusso '{flow_name}' pianificato alle {fire_time:%H:%M}.")
+    start_time = time.monotonic()
+    problems = preflight_check(flow_name, tasks)
+    duration = time.monotonic() - start_time
+
+    if problems:
+        for problem in problems:
+            logging.error(f"[{flow_name}] PRE-FLIGHT: {problem}")
+        logging.error(f"[{flow_name}] PRE-FLIGHT fallito: {len(problems)} problemi da risolvere prima delle {fire_time:%H:%M}.")
+    else:
+        logging.info(f"[{flow_name}] PRE-FLIGHT completato in {duration:.2f} secondi: {len(tasks)} task pronti.")
+
+    with _status_lock:
+        _warmup_results[flow_name] = {
+            'checked': datetime.now().isoformat(),
+            'fire_time': fire_time.isoformat(),
+            'problems': problems
+        }
+    _update_status_file()
+
+def flow_execution_wrapper(flow_name, tasks, overlap_policy='skip', resume_attempts=0, resume_delay_minutes=5,
+                           label=None, resume=False, params=None, max_restarts=DEFAULT_MAX_RESTARTS,
+                           memory_limit_mb=None):
     """
     Wrapper per l'esecuzione di un flusso che gestisce l'aggiornamento
     dello stato (aggiunta/rimozione dalla lista dei flussi attivi).
+    Il flusso viene eseguito in un processo separato e supervisionato (vedi
+    flow_supervisor), riavviato fino a max_restarts volte se termina in modo
+    anomalo, si blocca o supera memory_limit_mb; il processo esegue il flusso
+    sotto il lock tra processi, così non può sovrapporsi a un'esecuzione
+    avviata dalla GUI. Se il flusso fallisce, viene ripreso dal task in errore
+    fino a resume_attempts volte, attendendo resume_delay_minutes tra un
+    tentativo e l'altro.
+    Restituisce l'identificativo dell'ultima esecuzione, o None se non è stata avviata.
     """
     with _status_lock:
-        _active_flows.add(flow_name)
+        _active_flows[flow_name] += 1
     _update_status_file()
 
+    run_id = None
     try:
         # Esegui il flusso vero e proprio
-        execute_flow(flow_name, tasks)
+        run_id = run_supervised(flow_name, tasks, overlap_policy, label, resume, params, max_restarts, memory_limit_mb)
+
+        for attempt in range(1, resume_attempts + 1):
+            manifest = load_run_manifest(run_id) if run_id else None
+            if manifest is None or manifest.get('status') != 'failed':
+                break
+            logging.info(f"[{flow_name}] Ripresa automatica {attempt}/{resume_attempts} tra {resume_delay_minutes} minuti.")
+            time.sleep(resume_delay_minutes * 60)
+            run_id = run_supervised(flow_name, tasks, overlap_policy, label, True, params, max_restarts, memory_limit_mb)
     finally:
         # Assicura la rimozione dallo stato anche in caso di errore
         with _status_lock:
-            _active_flows.remove(flow_name)
+            _active_flows[flow_name] -= 1
+            if _active_flows[flow_name] <= 0:
+                del _active_flows[flow_name]
         _update_status_file()
+    return run_id
+
+def supervision_options(config):
+    """Opzioni di supervisione del processo di un flusso, lette dalla sua configurazione."""
+    return {
+        'max_restarts': config.get("max_restarts", DEFAULT_MAX_RESTARTS),
+        'memory_limit_mb': config.get("memory_limit_mb")
+    }
+
+def _refresh_progress(stop_event):
+    """Aggiorna di frequente il file di stato finché ci sono esecuzioni in corso, per l'avanzamento in tempo reale."""
+    while not stop_event.wait(PROGRESS_REFRESH_SECONDS):
+        if supervised_progress():
+            _update_status_file()
+
+def is_paused(flow_name):
+    """Indica se le pianificazioni del flusso (orari e trigger su file) sono sospese."""
+    with _status_lock:
+        return ALL_FLOWS in _paused_flows or flow_name in _paused_flows
+
+# --- Operazioni dell'API di controllo ---
 
-def scheduler_service():
+def _execute_run_request(request, tasks, config):
+    with _status_lock:
+        request['state'] = 'running'
+        request['started'] = datetime.now().isoformat()
+    run_id = None
+    try:
+        run_id = flow_execution_wrapper(
+            request['flow'],
+            tasks,
+            request['policy'],
+            config.get("resume_attempts", 0),
+            config.get("resume_delay_minutes", 5),
+            label=request['label'],
+            resume=request['resume'],
+            params=request['params'],
+            **supervision_options(config)
+        )
+    finally:
+        manifest = load_run_manifest(run_id) if run_id else None
+        with _status_lock:
+            request['state'] = 'finished'
+            request['finished'] = datetime.now().isoformat()
+            request['run_id'] = run_id
+            request['status'] = manifest.get('status') if manifest else 'not_started'
+            # Si conservano tutte le richieste attive e solo le ultime concluse
+            finished = [r for r in _run_requests if r['state'] == 'finished']
+            for old_request in finished[:-FINISHED_REQUESTS_KEPT]:
+                _run_requests.remove(old_request)
+
+def api_run(body):
+    """Accoda l'esecuzione immediata di un flusso con parametri facoltativi."""
+    flow_name = body.get('flow')
+    config = load_workflows().get(flow_name)
+    if config is None:
+        raise LookupError(f"Flusso '{flow_name}' non trovato.")
+    tasks = config.get("tasks", [])
+    if not tasks:
+        raise ValueError(f"Il flusso '{flow_name}' non ha task da eseguire.")
+    params = body.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValueError("'params' deve essere un oggetto con nomi e valori.")
+    policy = body.get('policy') or config.get("overlap_policy", "skip")
+    if policy not in OVERLAP_POLICIES:
+        raise ValueError(f"Politica di sovrapposizione '{policy}' non valida.")
+
+    request_id = next(_request_ids)
+    source = body.get('source') or "API"
+    request = {
+        'id': request_id,
+        'flow': flow_name,
+        'label': f"{flow_name} ({source} #{request_id})",
+        'params': {str(key): str(value) for key, value in params.items()},
+        'resume': bool(body.get('resume', False)),
+        'policy': policy,
+        'state': 'queued',
+        'submitted': datetime.now().isoformat(),
+        'started': None,
+        'finished': None,
+        'run_id': None,
+        'status': None
+    }
+    with _status_lock:
+        _run_requests.append(request)
+    logging.info(f"API: richiesta #{request_id} di esecuzione del flusso '{flow_name}' ({source}).")
+    threading.Thread(target=_execute_run_request, args=(request, tasks, config)).start()
+    with _status_lock:
+        return {'request': dict(request)}
+
+def api_cancel(body):
+    """Annulla l'esecuzione in corso di un flusso (o solo il task in corso), in qualunque processo."""
+    flow_name = body.get('flow')
+    if not flow_name:
+        raise ValueError("Indicare il flusso da annullare ('flow').")
+    flow_lock = FlowLock(flow_name)
+    task_only = bool(body.get('task', False))
+    requested = flow_lock.request_task_cancel() if task_only else flow_lock.request_cancel()
+    if not requested:
+        raise LookupError(f"Il flusso '{flow_name}' non è in esecuzione.")
+    owner = flow_lock.owner() or {}
+    target = "del task in corso" if task_only else "dell'esecuzione"
+    logging.warning(f"API: richiesto l'annullamento {target} di '{owner.get('label', flow_name)}' (PID {owner.get('pid', '?')}).")
+    return {'flow': flow_name, 'task': task_only, 'owner': owner}
+
+def _set_paused(body, paused):
+    flow_name = body.get('flow') or ALL_FLOWS
+    with _status_lock:
+        if paused:
+            _paused_flows.add(flow_name)
+        elif flow_name == ALL_FLOWS:
+            _paused_flows.clear()
+        else:
+            _paused_flows.discard(flow_name)
+        current = sorted(_paused_flows)
+    target = "di tutti i flussi" if flow_name == ALL_FLOWS else f"del flusso '{flow_name}'"
+    logging.warning(f"API: pianificazioni {target} {'sospese' if paused else 'riattivate'}.")
+    _update_status_file()
+    return {'paused': current}
+
+def api_pause(body):
+    """Sospende le pianificazioni di un flusso, o di tutti se 'flow' non è indicato."""
+    return _set_paused(body, True)
+
+def api_resume(body):
+    """Riattiva le pianificazioni di un flusso, o di tutti se 'flow' non è indicato."""
+    return _set_paused(body, False)
+
+def api_queue(body):
+    """Elenca le richieste di esecuzione (in attesa del flusso, in corso e recenti) e le sospensioni."""
+    with _status_lock:
+        requests = [dict(request) for request in _run_requests]
+        paused = sorted(_paused_flows)
+        running_flows = sorted(_active_flows)
+    for request in requests:
+        # Una richiesta avviata è in corso solo se detiene il lock del flusso,
+        # altrimenti attende (politica 'queue') la fine di un'altra esecuzione
+        if request['state'] == 'running':
+            owner = FlowLock(request['flow']).owner() or {}
+            if owner.get('label') != request['label']:
+                request['state'] = 'waiting'
+    return {'requests': requests, 'paused': paused, 'running_flows': running_flows, 'progress': supervised_progress()}
+
+CONTROL_ROUTES = {
+    ('GET', '/queue'): api_queue,
+    ('POST', '/run'): api_run,
+    ('POST', '/cancel'): api_cancel,
+    ('POST', '/pause'): api_pause,
+    ('POST', '/resume'): api_resume,
+}
+
+def on_file_trigger(flow_name, files):
+    """Avvia un flusso attivato dall'arrivo o dalla modifica di file nella cartella osservata."""
+    config = load_workflows().get(flow_name)
+    if config is None or not config.get("tasks"):
+        logging.warning(f"[{flow_name}] Trigger su file ignorato: flusso non più presente o senza task.")
+        return
+    if is_paused(flow_name):
+        logging.info(f"[{flow_name}] Trigger su file ignorato: pianificazioni sospese.")
+        return
+    shown_files = ", ".join(files[:5]) + (f" e altri {len(files) - 5}" if len(files) > 5 else "")
+    logging.info(f"TRIGGER FILE: Avvio flusso '{flow_name}' per {len(files)} file: {shown_files}.")
+    threading.Thread(
+        target=flow_execution_wrapper,
+        args=(
+            flow_name,
+            config["tasks"],
+            config.get("overlap_policy", "skip"),
+            config.get("resume_attempts", 0),
+            config.get("resume_delay_minutes", 5)
+        ),
+        kwargs=supervision_options(config)
+    ).start()
+
+def sync_file_triggers(workflows, invalid_watches):
+    """
+    Allinea i trigger su file alla configurazione: avvia quelli nuovi, riavvia quelli
+    modificati e ferma quelli rimossi. 'invalid_watches' ricorda le dichiarazioni non
+    valide già segnalate, per non ripetere l'errore a ogni controllo.
+    """
+    wanted = {}
+    for flow_name, config in workflows.items():
+        try:
+            watch = parse_watch(config.get("watch"))
+        except ValueError as e:
+            if invalid_watches.get(flow_name) != config.get("watch"):
+                logging.error(f"[{flow_name}] Trigger su file non valido: {e}")
+                invalid_watches[flow_name] = config.get("watch")
+            continue
+        invalid_watches.pop(flow_name, None)
+        if watch is not None:
+            wanted[flow_name] = watch
+
+    with _status_lock:
+        stale = {flow_name: entry for flow_name, entry in _file_triggers.items() if wanted.get(flow_name) != entry[0]}
+        for flow_name in stale:
+            del _file_triggers[flow_name]
+    for _, trigger in stale.values():
+        trigger.stop()
+
+    for flow_name, watch in wanted.items():
+        if flow_name not in _file_triggers:
+            trigger = FileTrigger(flow_name, watch, on_file_trigger)
+            trigger.start()
+            with _status_lock:
+                _file_triggers[flow_name] = (watch, trigger)
+
+def stop_file_triggers():
+    """Ferma tutti i trigger su file."""
+    with _status_lock:
+        triggers = [trigger for _, trigger in _file_triggers.values()]
+        _file_triggers.clear()
+    for trigger in triggers:
+        trigger.stop()
+
+def scheduler_service(control_port=0):
     """
     Servizio principale che controlla e avvia i flussi di lavoro pianificati.
+    'control_port' è la porta dell'API di controllo locale (0: scelta automatica).
     """
     logging.info("Servizio Scheduler avviato. In attesa di flussi da eseguire...")
 
+    control_server = None
+    try:
+        control_server = start_control_server(CONTROL_ROUTES, control_port)
+        with _status_lock:
+            _control.update({'port': control_server.server_address[1], 'token': control_server.token})
+    except OSError as e:
+        logging.error(f"Impossibile avviare l'API di controllo: {e}. Lo scheduler funziona senza.")
+
     last_execution_dates = {}
+    last_warmup_dates = {}
+    invalid_watches = {}
+    stop_refresh = threading.Event()
+    threading.Thread(target=_refresh_progress, args=(stop_refresh,), daemon=True).start()
 
     try:
         _update_status_file() # Scrivi lo stato iniziale
@@ -64,8 +426,7 @@ def scheduler_service():
         while True:
             try:
                 try:
-                    with open(CONFIG_FILE, 'r') as f:
-                        workflows = json.load(f)
+                    workflows = load_workflows()
                 except (FileNotFoundError, json.JSONDecodeError):
                     logging.warning("File di configurazione non trovato o corrotto. Riprovo tra 60 secondi.")
                     time.sleep(60)
@@ -78,20 +439,53 @@ def scheduler_service():
 
                 logging.info(f"Controllo orario: {current_time}, Giorno: {current_day_of_week}, Flussi attivi: {len(_active_flows)}")
 
+                # I trigger su file lavorano in thread propri; qui si seguono solo le modifiche alla configurazione
+                sync_file_triggers(workflows, invalid_watches)
+
                 for flow_name, config in workflows.items():
-                    is_time_to_run = (config.get("schedule_time") == current_time)
-                    is_day_to_run = (current_day_of_week in config.get("schedule_days", []))
-                    has_run_today = (last_execution_dates.get(flow_name) == current_date_str)
+                    paused = is_paused(flow_name)
+                    warmup_minutes = warmup_minutes_of(flow_name, config)
+                    if not paused and is_warmup_due(config, now, last_warmup_dates.get(flow_name), warmup_minutes) and config.get("tasks"):
+                        fire_time = (now + timedelta(minutes=warmup_minutes)).replace(second=0, microsecond=0)
+                        threading.Thread(
+                            target=warmup_wrapper,
+                            args=(flow_name, config["tasks"], fire_time),
+                            daemon=True
+                        ).start()
+                        last_warmup_dates[flow_name] = fire_time.strftime("%Y-%m-%d")
 
-                    if is_time_to_run and is_day_to_run and not has_run_today:
+                    if is_flow_due(config, now, last_execution_dates.get(flow_name)):
+                        if paused:
+                            logging.info(f"[{flow_name}] Esecuzione pianificata saltata: pianificazioni sospese.")
+                            last_execution_dates[flow_name] = current_date_str
+                            continue
                         tasks = config.get("tasks", [])
                         if not tasks:
                             logging.warning(f"Il flusso '{flow_name}' è pianificato ma non ha task. Salto.")
                             continue
 
+                        # Se il pre-flight ha trovato problemi, si ricontrolla (senza rileggere gli script)
+                        # e il flusso non parte se non sono stati risolti, invece di fallire a metà
+                        with _status_lock:
+                            warmup = _warmup_results.get(flow_name, {})
+                        if warmup.get('problems') and last_warmup_dates.get(flow_name) == current_date_str:
+                            problems = preflight_check(flow_name, tasks, warm=False)
+                            if problems:
+                                logging.critical(f"[{flow_name}] Flusso NON avviato: {len(problems)} problemi del pre-flight non risolti "
+                                                 f"(il primo: {problems[0]}).")
+                                last_execution_dates[flow_name] = current_date_str
+                                continue
+
                         execution_thread = threading.Thread(
                             target=flow_execution_wrapper, # Usa il wrapper
-                            args=(flow_name, tasks)
+                            args=(
+                                flow_name,
+                                tasks,
+                                config.get("overlap_policy", "skip"),
+                                config.get("resume_attempts", 0),
+                                config.get("resume_delay_minutes", 5)
+                            ),
+                            kwargs=supervision_options(config)
                         )
                         execution_thread.start()
 
@@ -109,6 +503,10 @@ def scheduler_service():
                 time.sleep(60)
     finally:
         logging.info("Pulizia e arresto del servizio...")
+        stop_refresh.set()
+        stop_file_triggers()
+        if control_server is not None:
+            control_server.shutdown()
         _clear_status_file() # Assicura che il file di stato sia rimosso all'uscita
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+"""
+Lettura della configurazione dei flussi e calcolo dei prossimi orari pianificati.
+
+Usa solo la libreria standard, così può essere importato da flowctl e dal
+simulatore senza caricare lo scheduler (API di controllo, processi, trigger su file).
+"""
+import json
+import logging
+import os
+from datetime import timedelta
+
+CONFIG_DIR = "config"
+CONFIG_FILE = os.path.join(CONFIG_DIR, "workflows.json")
+
+
+def normalize_tasks(flow_name, tasks):
+    """
+    Riporta i task di un flusso alla forma di dizionario. Le configurazioni meno
+    recenti elencano i task come semplici percorsi di script; le voci non
+    riconosciute vengono segnalate e scartate.
+    """
+    normalized = []
+    for task in tasks:
+        if isinstance(task, str):
+            normalized.append({'name': os.path.basename(task), 'path': task})
+        elif isinstance(task, dict):
+            normalized.append(task)
+        else:
+            logging.warning(f"[{flow_name}] Task non valido ignorato nella configurazione: {task!r}")
+    return normalized
+
+
+def load_workflows(path=CONFIG_FILE):
+    """
+    Carica la configurazione dei flussi (per default quella in uso) con i task in
+    forma normalizzata. Solleva FileNotFoundError (o altri OSError) o JSONDecodeError.
+    """
+    with open(path, 'r') as f:
+        workflows = json.load(f)
+    for flow_name, config in workflows.items():
+        if isinstance(config.get("tasks"), list):
+            config["tasks"] = normalize_tasks(flow_name, config["tasks"])
+    return workflows
+
+
+def _schedule(config):
+    """Ora, minuto e giorni pianificati del flusso, o None se la pianificazione manca o non è valida."""
+    schedule_days = config.get("schedule_days", [])
+    try:
+        hour, minute = map(int, config.get("schedule_time", "").split(':'))
+    except (ValueError, AttributeError):
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60) or not isinstance(schedule_days, list) or not schedule_days:
+        return None
+    return hour, minute, schedule_days
+
+
+def next_fire_time(config, now):
+    """
+    Restituisce il prossimo istante (dopo 'now') in cui il flusso è pianificato, o None.
+    È l'unica regola degli orari, usata sia dallo scheduler sia dal simulatore.
+    """
+    schedule = _schedule(config)
+    if schedule is None:
+        return None
+    hour, minute, schedule_days = schedule
+
+    for day_offset in range(8):
+        candidate = (now + timedelta(days=day_offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate > now and candidate.weekday() in schedule_days:
+            return candidate
+    return None
+
+
+def is_fire_minute(config, now):
+    """Indica se il flusso è pianificato nel minuto che contiene 'now'."""
+    minute = now.replace(second=0, microsecond=0)
+    return next_fire_time(config, minute - timedelta(microseconds=1)) == minute